@@ -0,0 +1,82 @@
+-- Run this in Supabase SQL Editor
+-- Adds functions used to answer aggregate questions ("total spent on HVAC",
+-- "utility bills over $400") with one SQL query over the documents table
+-- instead of vector search + the LLM adding numbers up
+
+-- Distinct properties, vendors and document types for the current user
+-- (used to recognise names mentioned in a question)
+CREATE OR REPLACE FUNCTION document_facets()
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+AS $$
+    SELECT jsonb_build_object(
+        'properties', COALESCE(
+            (SELECT jsonb_agg(DISTINCT property_name) FROM documents
+             WHERE user_id = auth.uid() AND property_name IS NOT NULL),
+            '[]'::jsonb
+        ),
+        'vendors', COALESCE(
+            (SELECT jsonb_agg(DISTINCT vendor) FROM documents
+             WHERE user_id = auth.uid() AND vendor IS NOT NULL),
+            '[]'::jsonb
+        ),
+        'document_types', COALESCE(
+            (SELECT jsonb_agg(DISTINCT document_type) FROM documents
+             WHERE user_id = auth.uid() AND document_type IS NOT NULL),
+            '[]'::jsonb
+        )
+    );
+$$;
+
+-- Totals over every matching document, plus the matching rows (up to row_limit)
+-- NULL filters are ignored; property/vendor match case-insensitively on a substring
+CREATE OR REPLACE FUNCTION aggregate_documents(
+    property_filter TEXT DEFAULT NULL,
+    vendor_filter TEXT DEFAULT NULL,
+    type_filter TEXT DEFAULT NULL,
+    date_from DATE DEFAULT NULL,
+    date_to DATE DEFAULT NULL,
+    min_amount NUMERIC DEFAULT NULL,
+    max_amount NUMERIC DEFAULT NULL,
+    row_limit INT DEFAULT 50
+)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+AS $$
+    WITH matched AS (
+        SELECT id, filename, property_name, document_type, vendor, amount, document_date
+        FROM documents d
+        WHERE
+            d.user_id = auth.uid()
+            AND (property_filter IS NULL OR d.property_name ILIKE '%' || property_filter || '%')
+            AND (vendor_filter IS NULL OR d.vendor ILIKE '%' || vendor_filter || '%')
+            AND (type_filter IS NULL OR d.document_type = type_filter)
+            AND (date_from IS NULL OR d.document_date >= date_from)
+            AND (date_to IS NULL OR d.document_date <= date_to)
+            AND (min_amount IS NULL OR d.amount > min_amount)
+            AND (max_amount IS NULL OR d.amount < max_amount)
+    )
+    SELECT jsonb_build_object(
+        'document_count', (SELECT count(*) FROM matched),
+        'amount_count', (SELECT count(amount) FROM matched),
+        'total_amount', (SELECT COALESCE(sum(amount), 0) FROM matched),
+        'average_amount', (SELECT avg(amount) FROM matched),
+        'min_amount', (SELECT min(amount) FROM matched),
+        'max_amount', (SELECT max(amount) FROM matched),
+        'first_date', (SELECT min(document_date) FROM matched),
+        'last_date', (SELECT max(document_date) FROM matched),
+        'documents', COALESCE(
+            (SELECT jsonb_agg(to_jsonb(m) ORDER BY m.amount DESC NULLS LAST)
+             FROM (SELECT * FROM matched ORDER BY amount DESC NULLS LAST LIMIT row_limit) m),
+            '[]'::jsonb
+        )
+    );
+$$;
+
+-- Speeds up the per-user filters above
+CREATE INDEX IF NOT EXISTS documents_user_type_date_idx
+    ON documents(user_id, document_type, document_date);
@@ -0,0 +1,31 @@
+-- Run this in Supabase SQL Editor after ADD_CHUNKS_TABLE.sql
+-- Adds delete_document_chunks_batch(): removes chunks for a set of documents
+-- a limited number of rows at a time, so bulk deletes never hold long locks
+-- or cascade through thousands of chunks in one statement
+
+CREATE OR REPLACE FUNCTION delete_document_chunks_batch(
+    document_ids UUID[],
+    batch_size INT DEFAULT 1000
+)
+RETURNS INT
+LANGUAGE plpgsql
+SECURITY INVOKER
+AS $$
+DECLARE
+    deleted_count INT;
+BEGIN
+    DELETE FROM document_chunks
+    WHERE user_id = auth.uid()
+    AND id IN (
+        SELECT dc.id
+        FROM document_chunks dc
+        WHERE
+            dc.user_id = auth.uid()
+            AND dc.document_id = ANY(document_ids)
+        LIMIT batch_size
+    );
+
+    GET DIAGNOSTICS deleted_count = ROW_COUNT;
+    RETURN deleted_count;
+END;
+$$;
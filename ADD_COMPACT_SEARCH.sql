@@ -0,0 +1,61 @@
+-- Run this in Supabase SQL Editor after ADD_CHUNKS_TABLE.sql
+-- Adds match_chunks_compact(): same search as match_chunks(), but document
+-- metadata is returned once per document instead of once per chunk
+
+CREATE OR REPLACE FUNCTION match_chunks_compact(
+    query_embedding VECTOR(1536),
+    match_threshold FLOAT DEFAULT 0.3,
+    match_count INT DEFAULT 10
+)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+AS $$
+    WITH hits AS (
+        SELECT
+            dc.id,
+            dc.document_id,
+            dc.chunk_index,
+            dc.chunk_text,
+            1 - (dc.embedding <=> query_embedding) AS similarity
+        FROM document_chunks dc
+        WHERE
+            dc.user_id = auth.uid()
+            AND dc.embedding IS NOT NULL
+            AND (1 - (dc.embedding <=> query_embedding)) > match_threshold
+        ORDER BY dc.embedding <=> query_embedding
+        LIMIT match_count
+    )
+    SELECT jsonb_build_object(
+        -- One small row per chunk, already using the keys the Python side reads
+        'chunks', COALESCE(
+            (SELECT jsonb_agg(
+                jsonb_build_object(
+                    'id', h.id,
+                    'document_id', h.document_id,
+                    'chunk_index', h.chunk_index,
+                    'content', h.chunk_text,
+                    'similarity', h.similarity
+                ) ORDER BY h.similarity DESC
+            ) FROM hits h),
+            '[]'::jsonb
+        ),
+        -- Metadata for each matched document, keyed by document id
+        'documents', COALESCE(
+            (SELECT jsonb_object_agg(
+                d.id,
+                jsonb_build_object(
+                    'filename', d.filename,
+                    'property_name', d.property_name,
+                    'document_type', d.document_type,
+                    'vendor', d.vendor,
+                    'amount', d.amount,
+                    'document_date', d.document_date
+                )
+            ) FROM documents d
+            WHERE d.id IN (SELECT DISTINCT document_id FROM hits)),
+            '{}'::jsonb
+        )
+    );
+$$;
@@ -0,0 +1,80 @@
+-- Run this in Supabase SQL Editor after ADD_CHUNKS_TABLE.sql
+-- Keeps a per-user corpus version in the database, bumped by triggers whenever
+-- the user's documents or chunks change. The app keys its answer, lexicon and
+-- document-list caches on it, so changes made outside the app process (upload
+-- workers elsewhere, snapshot.py imports, other replicas) invalidate them too.
+-- If you partition document_chunks later (PARTITION_CHUNKS_BY_USER.sql), run
+-- this file again after the cutover so the new table gets the triggers.
+
+CREATE TABLE IF NOT EXISTS corpus_versions (
+    user_id UUID PRIMARY KEY REFERENCES auth.users(id) ON DELETE CASCADE,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Enable Row Level Security (read-only for users - only the triggers write)
+ALTER TABLE corpus_versions ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view their own corpus version" ON corpus_versions;
+CREATE POLICY "Users can view their own corpus version"
+    ON corpus_versions FOR SELECT
+    USING (auth.uid() = user_id);
+
+-- One bump per statement and user, however many rows the statement touched
+CREATE OR REPLACE FUNCTION bump_corpus_versions()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO corpus_versions (user_id, version)
+        SELECT DISTINCT user_id, 1 FROM old_rows
+        ON CONFLICT (user_id) DO UPDATE
+            SET version = corpus_versions.version + 1, updated_at = NOW();
+    ELSE
+        INSERT INTO corpus_versions (user_id, version)
+        SELECT DISTINCT user_id, 1 FROM new_rows
+        ON CONFLICT (user_id) DO UPDATE
+            SET version = corpus_versions.version + 1, updated_at = NOW();
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS documents_insert_bump_corpus_version ON documents;
+CREATE TRIGGER documents_insert_bump_corpus_version
+    AFTER INSERT ON documents
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_corpus_versions();
+
+DROP TRIGGER IF EXISTS documents_update_bump_corpus_version ON documents;
+CREATE TRIGGER documents_update_bump_corpus_version
+    AFTER UPDATE ON documents
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_corpus_versions();
+
+DROP TRIGGER IF EXISTS documents_delete_bump_corpus_version ON documents;
+CREATE TRIGGER documents_delete_bump_corpus_version
+    AFTER DELETE ON documents
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_corpus_versions();
+
+DROP TRIGGER IF EXISTS document_chunks_insert_bump_corpus_version ON document_chunks;
+CREATE TRIGGER document_chunks_insert_bump_corpus_version
+    AFTER INSERT ON document_chunks
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_corpus_versions();
+
+DROP TRIGGER IF EXISTS document_chunks_delete_bump_corpus_version ON document_chunks;
+CREATE TRIGGER document_chunks_delete_bump_corpus_version
+    AFTER DELETE ON document_chunks
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_corpus_versions();
+
+DROP TRIGGER IF EXISTS document_chunks_update_bump_corpus_version ON document_chunks;
+CREATE TRIGGER document_chunks_update_bump_corpus_version
+    AFTER UPDATE ON document_chunks
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_corpus_versions();
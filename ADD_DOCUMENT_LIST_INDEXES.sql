@@ -0,0 +1,14 @@
+-- Run this in Supabase SQL Editor (optional, for users with many documents)
+-- Indexes for the paginated document browser: each page is a filtered,
+-- newest-first range over one user's documents, plus an exact count
+
+-- Unfiltered pages: newest first per user
+CREATE INDEX IF NOT EXISTS documents_user_uploaded_idx
+    ON documents(user_id, uploaded_at DESC);
+
+-- Pages filtered by property or document type
+CREATE INDEX IF NOT EXISTS documents_user_property_uploaded_idx
+    ON documents(user_id, property_name, uploaded_at DESC);
+
+CREATE INDEX IF NOT EXISTS documents_user_type_uploaded_idx
+    ON documents(user_id, document_type, uploaded_at DESC);
@@ -0,0 +1,49 @@
+-- Run this in Supabase SQL Editor
+-- Creates the ingest_jobs table used by the background upload queue (jobs.py)
+-- One row per uploaded file: its processing status survives Streamlit reruns,
+-- browser refreshes and reconnects, and the content hash stops the same file
+-- from being processed twice
+
+CREATE TABLE IF NOT EXISTS ingest_jobs (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    filename TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued'
+        CHECK (status IN ('queued', 'processing', 'done', 'error')),
+    stage TEXT,
+    error TEXT,
+    document_id UUID REFERENCES documents(id) ON DELETE SET NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    UNIQUE(user_id, content_hash)
+);
+
+-- Enable Row Level Security
+ALTER TABLE ingest_jobs ENABLE ROW LEVEL SECURITY;
+
+-- RLS Policies
+DROP POLICY IF EXISTS "Users can view their own ingest jobs" ON ingest_jobs;
+CREATE POLICY "Users can view their own ingest jobs"
+    ON ingest_jobs FOR SELECT
+    USING (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can insert their own ingest jobs" ON ingest_jobs;
+CREATE POLICY "Users can insert their own ingest jobs"
+    ON ingest_jobs FOR INSERT
+    WITH CHECK (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can update their own ingest jobs" ON ingest_jobs;
+CREATE POLICY "Users can update their own ingest jobs"
+    ON ingest_jobs FOR UPDATE
+    USING (auth.uid() = user_id)
+    WITH CHECK (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can delete their own ingest jobs" ON ingest_jobs;
+CREATE POLICY "Users can delete their own ingest jobs"
+    ON ingest_jobs FOR DELETE
+    USING (auth.uid() = user_id);
+
+-- The upload tab lists a user's most recent jobs
+CREATE INDEX IF NOT EXISTS ingest_jobs_user_created_idx
+    ON ingest_jobs(user_id, created_at DESC);
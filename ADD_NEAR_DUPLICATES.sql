@@ -0,0 +1,68 @@
+-- Run this in Supabase SQL Editor (optional, requires Postgres 14+ for bit_count)
+-- Stores each document's SimHash fingerprint (simhash.py) and adds
+-- find_near_duplicates(), used by the upload queue to spot re-uploaded and
+-- re-scanned copies before paying for metadata extraction and embeddings.
+-- The 64-bit fingerprint is split into four 16-bit bands: fingerprints at most
+-- 3 bits apart share at least one band, so only documents matching a band
+-- (found through the indexes below) are compared.
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS simhash BIGINT;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS simhash_band_0 INTEGER;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS simhash_band_1 INTEGER;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS simhash_band_2 INTEGER;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS simhash_band_3 INTEGER;
+
+CREATE INDEX IF NOT EXISTS documents_user_simhash_band_0_idx
+    ON documents(user_id, simhash_band_0) WHERE simhash IS NOT NULL;
+CREATE INDEX IF NOT EXISTS documents_user_simhash_band_1_idx
+    ON documents(user_id, simhash_band_1) WHERE simhash IS NOT NULL;
+CREATE INDEX IF NOT EXISTS documents_user_simhash_band_2_idx
+    ON documents(user_id, simhash_band_2) WHERE simhash IS NOT NULL;
+CREATE INDEX IF NOT EXISTS documents_user_simhash_band_3_idx
+    ON documents(user_id, simhash_band_3) WHERE simhash IS NOT NULL;
+
+-- The caller's documents whose fingerprint is within max_distance bits of
+-- query_simhash, closest first (max_distance above 3 can miss matches)
+CREATE OR REPLACE FUNCTION find_near_duplicates(
+    query_simhash BIGINT,
+    max_distance INT DEFAULT 3,
+    match_count INT DEFAULT 5
+)
+RETURNS TABLE (
+    id UUID,
+    filename TEXT,
+    property_name TEXT,
+    document_type TEXT,
+    uploaded_at TIMESTAMP WITH TIME ZONE,
+    distance INT
+)
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+AS $$
+    WITH candidates AS (
+        SELECT d.id FROM documents d
+        WHERE d.user_id = auth.uid() AND d.simhash IS NOT NULL AND d.simhash_band_0 = (query_simhash & 65535)::INT
+        UNION
+        SELECT d.id FROM documents d
+        WHERE d.user_id = auth.uid() AND d.simhash IS NOT NULL AND d.simhash_band_1 = ((query_simhash >> 16) & 65535)::INT
+        UNION
+        SELECT d.id FROM documents d
+        WHERE d.user_id = auth.uid() AND d.simhash IS NOT NULL AND d.simhash_band_2 = ((query_simhash >> 32) & 65535)::INT
+        UNION
+        SELECT d.id FROM documents d
+        WHERE d.user_id = auth.uid() AND d.simhash IS NOT NULL AND d.simhash_band_3 = ((query_simhash >> 48) & 65535)::INT
+    )
+    SELECT
+        d.id,
+        d.filename,
+        d.property_name,
+        d.document_type,
+        d.uploaded_at,
+        bit_count((d.simhash # query_simhash)::BIT(64))::INT AS distance
+    FROM documents d
+    JOIN candidates c ON c.id = d.id
+    WHERE bit_count((d.simhash # query_simhash)::BIT(64)) <= max_distance
+    ORDER BY distance, d.uploaded_at DESC
+    LIMIT match_count;
+$$;
@@ -0,0 +1,118 @@
+-- Run this in Supabase SQL Editor after ADD_SEARCH_FILTERS.sql
+-- Lets match_chunks_compact() also return the chunks just before and after each
+-- match (neighbor_window chunks either side), in the same round trip.
+-- Neighbours are de-duplicated: a chunk next to two matches, or that is itself
+-- a match, is sent once. With neighbor_window = 0 nothing changes.
+
+DROP FUNCTION IF EXISTS match_chunks_compact(VECTOR(1536), FLOAT, INT);
+DROP FUNCTION IF EXISTS match_chunks_compact(VECTOR(1536), FLOAT, INT, TEXT, TEXT, TEXT, DATE, DATE);
+
+CREATE OR REPLACE FUNCTION match_chunks_compact(
+    query_embedding VECTOR(1536),
+    match_threshold FLOAT DEFAULT 0.3,
+    match_count INT DEFAULT 10,
+    property_filter TEXT DEFAULT NULL,
+    vendor_filter TEXT DEFAULT NULL,
+    type_filter TEXT DEFAULT NULL,
+    date_from DATE DEFAULT NULL,
+    date_to DATE DEFAULT NULL,
+    neighbor_window INT DEFAULT 0
+)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+AS $$
+    WITH candidate_documents AS (
+        SELECT ARRAY(
+            SELECT d.id
+            FROM documents d
+            WHERE
+                d.user_id = auth.uid()
+                AND (property_filter IS NULL OR d.property_name ILIKE '%' || property_filter || '%')
+                AND (vendor_filter IS NULL OR d.vendor ILIKE '%' || vendor_filter || '%')
+                AND (type_filter IS NULL OR d.document_type = type_filter)
+                AND (date_from IS NULL OR d.document_date >= date_from)
+                AND (date_to IS NULL OR d.document_date <= date_to)
+        ) AS ids
+    ),
+    hits AS (
+        SELECT
+            dc.id,
+            dc.document_id,
+            dc.chunk_index,
+            dc.chunk_text,
+            1 - (dc.embedding <=> query_embedding) AS similarity
+        FROM document_chunks dc
+        WHERE
+            dc.user_id = auth.uid()
+            AND dc.embedding IS NOT NULL
+            AND (1 - (dc.embedding <=> query_embedding)) > match_threshold
+            AND (
+                (property_filter IS NULL AND vendor_filter IS NULL AND type_filter IS NULL
+                 AND date_from IS NULL AND date_to IS NULL)
+                OR dc.document_id = ANY((SELECT ids FROM candidate_documents))
+            )
+        ORDER BY dc.embedding <=> query_embedding
+        LIMIT match_count
+    ),
+    neighbors AS (
+        -- Chunks within neighbor_window of a hit in the same document, each once
+        SELECT DISTINCT n.document_id, n.chunk_index, n.chunk_text
+        FROM hits h
+        JOIN document_chunks n
+            ON n.document_id = h.document_id
+            AND n.chunk_index BETWEEN h.chunk_index - neighbor_window AND h.chunk_index + neighbor_window
+        WHERE
+            neighbor_window > 0
+            AND n.user_id = auth.uid()
+            AND NOT EXISTS (
+                SELECT 1 FROM hits h2
+                WHERE h2.document_id = n.document_id AND h2.chunk_index = n.chunk_index
+            )
+    )
+    SELECT jsonb_build_object(
+        'chunks', COALESCE(
+            (SELECT jsonb_agg(
+                jsonb_build_object(
+                    'id', h.id,
+                    'document_id', h.document_id,
+                    'chunk_index', h.chunk_index,
+                    'content', h.chunk_text,
+                    'similarity', h.similarity
+                ) ORDER BY h.similarity DESC
+            ) FROM hits h),
+            '[]'::jsonb
+        ),
+        'neighbors', COALESCE(
+            (SELECT jsonb_agg(
+                jsonb_build_object(
+                    'document_id', n.document_id,
+                    'chunk_index', n.chunk_index,
+                    'content', n.chunk_text
+                ) ORDER BY n.document_id, n.chunk_index
+            ) FROM neighbors n),
+            '[]'::jsonb
+        ),
+        'neighbor_window', neighbor_window,
+        'documents', COALESCE(
+            (SELECT jsonb_object_agg(
+                d.id,
+                jsonb_build_object(
+                    'filename', d.filename,
+                    'property_name', d.property_name,
+                    'document_type', d.document_type,
+                    'vendor', d.vendor,
+                    'amount', d.amount,
+                    'document_date', d.document_date
+                )
+            ) FROM documents d
+            WHERE d.id IN (SELECT DISTINCT document_id FROM hits)),
+            '{}'::jsonb
+        )
+    );
+$$;
+
+-- Neighbour lookups are by (document_id, chunk_index)
+CREATE INDEX IF NOT EXISTS document_chunks_document_chunk_idx
+    ON document_chunks(document_id, chunk_index);
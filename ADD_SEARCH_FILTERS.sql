@@ -0,0 +1,88 @@
+-- Run this in Supabase SQL Editor after ADD_COMPACT_SEARCH.sql
+-- Adds optional structured filters to match_chunks_compact(). When a question
+-- names a property, vendor, document type or date range, only chunks of the
+-- matching documents are ranked instead of the user's whole corpus.
+-- NULL filters are ignored, so unfiltered calls behave exactly as before.
+
+DROP FUNCTION IF EXISTS match_chunks_compact(VECTOR(1536), FLOAT, INT);
+
+CREATE OR REPLACE FUNCTION match_chunks_compact(
+    query_embedding VECTOR(1536),
+    match_threshold FLOAT DEFAULT 0.3,
+    match_count INT DEFAULT 10,
+    property_filter TEXT DEFAULT NULL,
+    vendor_filter TEXT DEFAULT NULL,
+    type_filter TEXT DEFAULT NULL,
+    date_from DATE DEFAULT NULL,
+    date_to DATE DEFAULT NULL
+)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+SECURITY INVOKER
+AS $$
+    WITH candidate_documents AS (
+        -- Same matching rules as aggregate_documents()
+        SELECT ARRAY(
+            SELECT d.id
+            FROM documents d
+            WHERE
+                d.user_id = auth.uid()
+                AND (property_filter IS NULL OR d.property_name ILIKE '%' || property_filter || '%')
+                AND (vendor_filter IS NULL OR d.vendor ILIKE '%' || vendor_filter || '%')
+                AND (type_filter IS NULL OR d.document_type = type_filter)
+                AND (date_from IS NULL OR d.document_date >= date_from)
+                AND (date_to IS NULL OR d.document_date <= date_to)
+        ) AS ids
+    ),
+    hits AS (
+        SELECT
+            dc.id,
+            dc.document_id,
+            dc.chunk_index,
+            dc.chunk_text,
+            1 - (dc.embedding <=> query_embedding) AS similarity
+        FROM document_chunks dc
+        WHERE
+            dc.user_id = auth.uid()
+            AND dc.embedding IS NOT NULL
+            AND (1 - (dc.embedding <=> query_embedding)) > match_threshold
+            AND (
+                (property_filter IS NULL AND vendor_filter IS NULL AND type_filter IS NULL
+                 AND date_from IS NULL AND date_to IS NULL)
+                OR dc.document_id = ANY((SELECT ids FROM candidate_documents))
+            )
+        ORDER BY dc.embedding <=> query_embedding
+        LIMIT match_count
+    )
+    SELECT jsonb_build_object(
+        'chunks', COALESCE(
+            (SELECT jsonb_agg(
+                jsonb_build_object(
+                    'id', h.id,
+                    'document_id', h.document_id,
+                    'chunk_index', h.chunk_index,
+                    'content', h.chunk_text,
+                    'similarity', h.similarity
+                ) ORDER BY h.similarity DESC
+            ) FROM hits h),
+            '[]'::jsonb
+        ),
+        'documents', COALESCE(
+            (SELECT jsonb_object_agg(
+                d.id,
+                jsonb_build_object(
+                    'filename', d.filename,
+                    'property_name', d.property_name,
+                    'document_type', d.document_type,
+                    'vendor', d.vendor,
+                    'amount', d.amount,
+                    'document_date', d.document_date
+                )
+            ) FROM documents d
+            WHERE d.id IN (SELECT DISTINCT document_id FROM hits)),
+            '{}'::jsonb
+        )
+    );
+$$;
+
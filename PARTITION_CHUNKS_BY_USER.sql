@@ -0,0 +1,228 @@
+-- Run this in Supabase SQL Editor after ADD_CHUNKS_TABLE.sql
+-- Moves document_chunks to a table partitioned by user_id (see PARTITIONING_MIGRATION.md)
+--
+-- Layout:
+--   document_chunks_partitioned            PARTITION BY LIST (user_id)
+--   ├── document_chunks_u_<user id>        one partition per promoted (large) tenant
+--   └── document_chunks_shared             DEFAULT partition, PARTITION BY HASH (user_id)
+--       └── document_chunks_shared_0..15   16 hash buckets for everyone else
+--
+-- The vector index is created on the parent, so every partition gets its own
+-- local HNSW index. Searches filter on user_id = auth.uid(), so Postgres prunes
+-- to the tenant's partition and only walks that partition's index.
+
+-- Step 1: Partitioned table (same columns as document_chunks)
+-- Primary/unique keys must include the partition key (user_id)
+CREATE TABLE IF NOT EXISTS document_chunks_partitioned (
+    id UUID DEFAULT gen_random_uuid() NOT NULL,
+    document_id UUID NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
+    user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    chunk_index INTEGER NOT NULL,
+    chunk_text TEXT NOT NULL,
+    embedding VECTOR(1536),
+    start_char INTEGER,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (user_id, id),
+    UNIQUE (user_id, document_id, chunk_index)
+) PARTITION BY LIST (user_id);
+
+CREATE TABLE IF NOT EXISTS document_chunks_shared
+    PARTITION OF document_chunks_partitioned DEFAULT
+    PARTITION BY HASH (user_id);
+
+DO $$
+BEGIN
+    FOR i IN 0..15 LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS document_chunks_shared_%s
+                PARTITION OF document_chunks_shared
+                FOR VALUES WITH (MODULUS 16, REMAINDER %s)',
+            i, i
+        );
+    END LOOP;
+END $$;
+
+-- Partition-local indexes (created on every existing and future partition)
+CREATE INDEX IF NOT EXISTS document_chunks_partitioned_embedding_idx
+    ON document_chunks_partitioned USING hnsw (embedding vector_cosine_ops);
+
+CREATE INDEX IF NOT EXISTS document_chunks_partitioned_document_id_idx
+    ON document_chunks_partitioned(document_id);
+
+-- Step 2: Row Level Security (same policies as document_chunks)
+ALTER TABLE document_chunks_partitioned ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view their own chunks" ON document_chunks_partitioned;
+CREATE POLICY "Users can view their own chunks"
+    ON document_chunks_partitioned FOR SELECT
+    USING (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can insert their own chunks" ON document_chunks_partitioned;
+CREATE POLICY "Users can insert their own chunks"
+    ON document_chunks_partitioned FOR INSERT
+    WITH CHECK (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can delete their own chunks" ON document_chunks_partitioned;
+CREATE POLICY "Users can delete their own chunks"
+    ON document_chunks_partitioned FOR DELETE
+    USING (auth.uid() = user_id);
+
+-- Step 3: Mirror new writes while existing rows are copied over
+-- An updated row is written over its copy (or copied now, if the backfill hasn't
+-- reached it yet), so the partitioned table never keeps a stale version
+CREATE OR REPLACE FUNCTION mirror_document_chunks()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM document_chunks_partitioned
+        WHERE user_id = OLD.user_id AND id = OLD.id;
+        RETURN OLD;
+    END IF;
+
+    IF TG_OP = 'UPDATE' THEN
+        IF OLD.user_id IS DISTINCT FROM NEW.user_id OR OLD.id IS DISTINCT FROM NEW.id THEN
+            DELETE FROM document_chunks_partitioned
+            WHERE user_id = OLD.user_id AND id = OLD.id;
+        END IF;
+
+        INSERT INTO document_chunks_partitioned
+            (id, document_id, user_id, chunk_index, chunk_text, embedding, start_char, created_at)
+        VALUES
+            (NEW.id, NEW.document_id, NEW.user_id, NEW.chunk_index, NEW.chunk_text, NEW.embedding, NEW.start_char, NEW.created_at)
+        ON CONFLICT (user_id, id) DO UPDATE SET
+            document_id = EXCLUDED.document_id,
+            chunk_index = EXCLUDED.chunk_index,
+            chunk_text = EXCLUDED.chunk_text,
+            embedding = EXCLUDED.embedding,
+            start_char = EXCLUDED.start_char,
+            created_at = EXCLUDED.created_at;
+        RETURN NEW;
+    END IF;
+
+    INSERT INTO document_chunks_partitioned
+        (id, document_id, user_id, chunk_index, chunk_text, embedding, start_char, created_at)
+    VALUES
+        (NEW.id, NEW.document_id, NEW.user_id, NEW.chunk_index, NEW.chunk_text, NEW.embedding, NEW.start_char, NEW.created_at)
+    ON CONFLICT DO NOTHING;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS mirror_document_chunks_trigger ON document_chunks;
+CREATE TRIGGER mirror_document_chunks_trigger
+    AFTER INSERT OR UPDATE OR DELETE ON document_chunks
+    FOR EACH ROW EXECUTE FUNCTION mirror_document_chunks();
+
+-- Step 4: Batched backfill (called repeatedly by migrate_chunks.py)
+-- Copies the next batch_size rows after after_id (keyset pagination on id).
+-- last_id is NULL once there is nothing left to copy.
+CREATE OR REPLACE FUNCTION backfill_chunk_partitions(
+    after_id UUID DEFAULT NULL,
+    batch_size INT DEFAULT 1000
+)
+RETURNS TABLE (last_id UUID, scanned INT, copied INT)
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    CREATE TEMP TABLE IF NOT EXISTS chunk_backfill_batch ON COMMIT DROP
+        AS SELECT * FROM document_chunks WITH NO DATA;
+    TRUNCATE chunk_backfill_batch;
+
+    INSERT INTO chunk_backfill_batch
+    SELECT * FROM document_chunks dc
+    WHERE after_id IS NULL OR dc.id > after_id
+    ORDER BY dc.id
+    LIMIT batch_size;
+
+    GET DIAGNOSTICS scanned = ROW_COUNT;
+
+    INSERT INTO document_chunks_partitioned
+        (id, document_id, user_id, chunk_index, chunk_text, embedding, start_char, created_at)
+    SELECT id, document_id, user_id, chunk_index, chunk_text, embedding, start_char, created_at
+    FROM chunk_backfill_batch
+    ON CONFLICT DO NOTHING;
+
+    GET DIAGNOSTICS copied = ROW_COUNT;
+
+    SELECT b.id INTO last_id FROM chunk_backfill_batch b ORDER BY b.id DESC LIMIT 1;
+    RETURN NEXT;
+END;
+$$;
+
+-- Step 5: Swap the tables once the backfill has caught up
+-- Renames are instant; the old table is kept as document_chunks_legacy
+-- until you have verified the migration and drop it yourself.
+CREATE OR REPLACE FUNCTION finish_chunk_partition_migration()
+RETURNS TEXT
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    missing BIGINT;
+BEGIN
+    LOCK TABLE document_chunks IN EXCLUSIVE MODE;
+
+    SELECT count(*) INTO missing
+    FROM document_chunks dc
+    WHERE NOT EXISTS (
+        SELECT 1 FROM document_chunks_partitioned p
+        WHERE p.user_id = dc.user_id AND p.id = dc.id
+    );
+
+    IF missing > 0 THEN
+        RAISE EXCEPTION '% chunks have not been copied yet - run the backfill again', missing;
+    END IF;
+
+    DROP TRIGGER IF EXISTS mirror_document_chunks_trigger ON document_chunks;
+    ALTER TABLE document_chunks RENAME TO document_chunks_legacy;
+    ALTER TABLE document_chunks_partitioned RENAME TO document_chunks;
+
+    RETURN 'document_chunks is now partitioned by user_id';
+END;
+$$;
+
+-- Step 6 (optional, after the swap): give a large tenant its own partition
+-- Moves the tenant's rows out of the shared hash buckets into a dedicated
+-- list partition. Takes a lock on the shared partition while it runs.
+CREATE OR REPLACE FUNCTION promote_tenant_chunk_partition(tenant UUID)
+RETURNS TEXT
+LANGUAGE plpgsql
+SECURITY DEFINER
+SET search_path = public
+AS $$
+DECLARE
+    partition_name TEXT := 'document_chunks_u_' || replace(tenant::TEXT, '-', '');
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN partition_name || ' already exists';
+    END IF;
+
+    CREATE TEMP TABLE promoted_chunks ON COMMIT DROP AS
+        SELECT * FROM document_chunks_shared WHERE user_id = tenant;
+    DELETE FROM document_chunks_shared WHERE user_id = tenant;
+
+    EXECUTE format(
+        'CREATE TABLE %I PARTITION OF document_chunks FOR VALUES IN (%L)',
+        partition_name, tenant
+    );
+
+    INSERT INTO document_chunks SELECT * FROM promoted_chunks;
+
+    RETURN partition_name;
+END;
+$$;
+
+-- Maintenance functions are for the service role only
+REVOKE EXECUTE ON FUNCTION backfill_chunk_partitions(UUID, INT) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION finish_chunk_partition_migration() FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION promote_tenant_chunk_partition(UUID) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION backfill_chunk_partitions(UUID, INT) TO service_role;
+GRANT EXECUTE ON FUNCTION finish_chunk_partition_migration() TO service_role;
+GRANT EXECUTE ON FUNCTION promote_tenant_chunk_partition(UUID) TO service_role;
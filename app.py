@@ -6,11 +6,13 @@ WITH proper session management and error handling
 
 import streamlit as st
 import os
-from pathlib import Path
+from concurrent.futures import CancelledError
 import auth
 import database
-import ingest
+import database_async
+import jobs
 import qa
+import qa_async
 
 # Page config
 st.set_page_config(
@@ -54,6 +56,8 @@ def login_page():
                         if user:
                             st.session_state.user = user
                             st.session_state.user_id = user.id
+                            # The first question then skips creating clients
+                            get_question_runner().warm_up(auth.get_session_tokens()[0])
                             st.success("✅ Logged in successfully!")
                             st.rerun()
                         else:
@@ -97,6 +101,7 @@ def login_page():
 
 def main_app():
     """Main application after login"""
+    dashboard = database_async.get_dashboard_data(st.session_state.user_id)
     
     # Sidebar
     with st.sidebar:
@@ -106,6 +111,9 @@ def main_app():
         
         if st.button("Logout", type="secondary"):
             auth.sign_out()
+            if st.session_state.get("question_runner"):
+                st.session_state.question_runner.close()
+                st.session_state.question_runner = None
             st.session_state.user = None
             st.session_state.user_id = None
             st.success("Logged out successfully!")
@@ -115,7 +123,7 @@ def main_app():
         
         # Get user stats
         try:
-            stats = database.get_document_stats(st.session_state.user_id)
+            stats = dashboard["stats"]
             st.metric("📄 Total Documents", stats["total_documents"])
             st.metric("💰 Total Amount", f"${stats['total_amount']:,.2f}")
             
@@ -133,7 +141,7 @@ def main_app():
     tab1, tab2, tab3 = st.tabs(["📤 Upload Documents", "❓ Ask Questions", "📄 View Documents"])
     
     with tab1:
-        upload_documents_section()
+        upload_documents_section(dashboard["filenames"])
     
     with tab2:
         ask_questions_section()
@@ -142,7 +150,7 @@ def main_app():
         view_documents_section()
 
 
-def upload_documents_section():
+def upload_documents_section(existing_filenames):
     """Document upload interface"""
     st.header("Upload Property Documents")
     st.write("Upload invoices, bills, leases, or any property-related documents.")
@@ -157,8 +165,7 @@ def upload_documents_section():
     if uploaded_files:
         # Check for duplicates
         try:
-            existing_docs = database.get_user_documents(st.session_state.user_id)
-            existing_filenames = {doc.get('filename', '').lower() for doc in existing_docs}
+            existing_filenames = {filename.lower() for filename in existing_filenames}
             
             new_files = []
             duplicate_files = []
@@ -175,68 +182,75 @@ def upload_documents_section():
             if new_files:
                 st.info(f"📤 Ready to process {len(new_files)} new file(s)")
                 
+                skip_near_duplicates = st.checkbox(
+                    "Skip near-duplicates of documents already uploaded",
+                    value=True,
+                    help="Re-scanned or re-sent copies are recognised from their text and not processed again."
+                )
+                
                 if st.button("Process All Files", type="primary"):
-                    success_count = 0
-                    error_count = 0
+                    # Files are processed by background workers, so leaving the tab,
+                    # rerunning or refreshing the page doesn't interrupt them.
+                    # getbuffer() hands over the uploaded bytes without copying them.
+                    access_token, refresh_token = auth.get_session_tokens()
+                    outcome = jobs.enqueue_files(
+                        st.session_state.user_id,
+                        access_token,
+                        [(uploaded_file.name, uploaded_file.getbuffer()) for uploaded_file in new_files],
+                        skip_near_duplicates=skip_near_duplicates,
+                        refresh_token=refresh_token
+                    )
                     
-                    for uploaded_file in new_files:
-                        with st.spinner(f"Processing {uploaded_file.name}..."):
-                            # Save uploaded file temporarily
-                            temp_dir = Path("temp_uploads")
-                            temp_dir.mkdir(exist_ok=True)
-                            temp_path = temp_dir / uploaded_file.name
-                            
-                            with open(temp_path, "wb") as f:
-                                f.write(uploaded_file.getbuffer())
-                            
-                            # Process the document
-                            result = ingest.process_document(str(temp_path), uploaded_file.name)
-                            
-                            if "error" in result:
-                                st.error(f"❌ Error processing {uploaded_file.name}: {result['error']}")
-                                error_count += 1
-                            elif not result.get("property_name") and not result.get("document_type") and not result.get("vendor"):
-                                # Metadata extraction likely failed - show warning
-                                st.warning(f"⚠️ {uploaded_file.name} uploaded but metadata extraction may have failed. Check logs for details.")
-                                # Still save it - might be a parsing issue
-                            else:
-                                # Save to database
-                                try:
-                                    saved_doc = database.save_document(
-                                        user_id=st.session_state.user_id,
-                                        filename=result["filename"],
-                                        file_content=result["file_content"],
-                                        property_name=result["property_name"],
-                                        document_type=result["document_type"],
-                                        vendor=result["vendor"],
-                                        amount=result["amount"],
-                                        document_date=result["document_date"],
-                                        chunks=result.get("chunks", [])  # Pass chunks instead of embedding
-                                    )
-                                    
-                                    if saved_doc:
-                                        success_count += 1
-                                        st.success(f"✅ {uploaded_file.name} processed and saved!")
-                                    else:
-                                        error_count += 1
-                                        st.error(f"❌ Failed to save {uploaded_file.name}")
-                                except Exception as e:
-                                    error_count += 1
-                                    st.error(f"❌ Error saving {uploaded_file.name}: {str(e)}")
-                            
-                            # Clean up temp file
-                            try:
-                                temp_path.unlink()
-                            except:
-                                pass
-                    
-                    # Summary
-                    st.success(f"✅ Successfully processed {success_count} file(s)")
-                    if error_count > 0:
-                        st.warning(f"⚠️ {error_count} file(s) had errors")
-                    st.rerun()
+                    if outcome["queued"]:
+                        st.success(f"✅ Queued {len(outcome['queued'])} file(s) for processing")
+                    if outcome["skipped"]:
+                        st.warning(f"⚠️ Already processed or in progress, skipped: {', '.join(outcome['skipped'])}")
         except Exception as e:
             st.error(f"Error checking for duplicates: {str(e)}")
+    
+    upload_progress_section()
+
+
+def upload_progress_section():
+    """Per-file status of recent uploads, refreshed automatically while files are processing"""
+    active = jobs.has_active_jobs(st.session_state.user_id)
+    
+    # st.fragment reruns only the progress panel, not the whole page
+    fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+    if fragment and active:
+        fragment(run_every=2)(_render_upload_progress)()
+    else:
+        _render_upload_progress()
+        if active and st.button("🔄 Refresh progress"):
+            st.rerun()
+
+
+def _render_upload_progress():
+    """Lists the user's recent upload jobs"""
+    user_jobs = jobs.list_jobs(st.session_state.user_id)
+    active = [job for job in user_jobs if job["status"] in ("queued", "processing")]
+    
+    # Once the last file finishes, rerun the whole page so the document list updates
+    if st.session_state.get("ingest_was_active") and not active:
+        st.session_state.ingest_was_active = False
+        st.rerun()
+    st.session_state.ingest_was_active = bool(active)
+    
+    if not user_jobs:
+        return
+    
+    st.subheader("Upload Progress")
+    if active:
+        st.info(f"⏳ {len(active)} file(s) still processing - you can keep using the app")
+    
+    icons = {"queued": "🕒", "processing": "⚙️", "done": "✅", "error": "❌"}
+    for job in user_jobs:
+        line = f"{icons.get(job['status'], '•')} **{job['filename']}** - {job['status']}"
+        if job.get("stage"):
+            line += f" ({job['stage']})"
+        if job.get("error"):
+            line += f": {job['error']}"
+        st.write(line)
 
 
 def ask_questions_section():
@@ -257,79 +271,152 @@ def ask_questions_section():
     
     question = st.text_input(
         "Your question:",
-        placeholder="e.g., What was the total amount paid to vendors last month?"
+        placeholder="e.g., What was the total amount paid to vendors last month?",
+        on_change=_cancel_pending_question
     )
     
     if st.button("Get Answer", type="primary") and question:
-        with st.spinner("🔍 Searching documents and generating answer..."):
+        # Answered on a background event loop; asking again (or editing the
+        # question) cancels the previous answer mid-flight
+        access_token, _ = auth.get_session_tokens()
+        future, tokens = get_question_runner().stream(question, st.session_state.user_id, access_token)
+        
+        st.write("### Answer:")
+        placeholder = st.empty()
+        with st.spinner("🔍 Searching documents..."):
+            answer = next(tokens, "")
+        
+        # Render the answer as tokens arrive
+        for piece in tokens:
+            answer += piece
+            placeholder.markdown(answer + " ▌")
+        
+        try:
+            result = future.result()
+        except CancelledError:
+            placeholder.info("This question was replaced by a newer one.")
+            return
+        except Exception as e:
+            print(f"Async answer failed, falling back to sync: {e}")
             result = qa.answer_question(question, st.session_state.user_id)
-            
-            # Display answer
-            st.write("### Answer:")
-            
-            # Color code based on confidence
-            if result["confidence"] == "high":
-                st.success(result["answer"])
-            elif result["confidence"] == "medium":
-                st.info(result["answer"])
-            elif result["confidence"] == "low" or result["confidence"] == "none":
-                st.warning(result["answer"])
-            else:
-                st.error(result["answer"])
-            
-            # Show sources
-            if result["sources"]:
-                st.write("### 📚 Sources:")
-                for i, source in enumerate(result["sources"], 1):
-                    with st.expander(f"📄 Document {i}: {source['filename']} (Relevance: {source['similarity']:.1%})"):
-                        st.write(f"**Property:** {source['property'] or 'N/A'}")
-                        st.write(f"**Type:** {source['type'] or 'N/A'}")
-                        if source.get('vendor'):
-                            st.write(f"**Vendor:** {source['vendor']}")
-                        if source.get('amount'):
-                            st.write(f"**Amount:** ${source['amount']:.2f}")
+        
+        if result.get("cached"):
+            st.caption("⚡ Answered from cache (your documents haven't changed since this was asked)")
+        
+        # Color code based on confidence
+        if result["confidence"] == "high":
+            show_answer = st.success
+        elif result["confidence"] == "medium":
+            show_answer = st.info
+        elif result["confidence"] == "low" or result["confidence"] == "none":
+            show_answer = st.warning
+        else:
+            show_answer = st.error
+        
+        with placeholder.container():
+            show_answer(result["answer"])
+        
+        # Show sources
+        if result["sources"]:
+            st.write("### 📚 Sources:")
+            for i, source in enumerate(result["sources"], 1):
+                with st.expander(f"📄 Document {i}: {source['filename']} (Relevance: {source['similarity']:.1%})"):
+                    st.write(f"**Property:** {source['property'] or 'N/A'}")
+                    st.write(f"**Type:** {source['type'] or 'N/A'}")
+                    if source.get('vendor'):
+                        st.write(f"**Vendor:** {source['vendor']}")
+                    if source.get('amount'):
+                        st.write(f"**Amount:** ${source['amount']:.2f}")
+
+
+def get_question_runner() -> qa_async.LatestQuestionRunner:
+    """Returns this session's background question runner (created on first use)"""
+    if not st.session_state.get("question_runner"):
+        st.session_state.question_runner = qa_async.LatestQuestionRunner()
+    return st.session_state.question_runner
+
+
+def _cancel_pending_question():
+    """Stops answering the previous question as soon as the question is edited"""
+    runner = st.session_state.get("question_runner")
+    if runner:
+        runner.cancel()
 
 
 def view_documents_section():
-    """View all uploaded documents"""
+    """
+    Browse documents a page at a time
+    Filtering and paging happen in the database, and a document's text is only
+    fetched when its preview is switched on, so the tab renders in the same time
+    however many documents there are
+    """
     st.header("Your Documents")
+    user_id = st.session_state.user_id
     
-    try:
-        docs = database.get_user_documents(st.session_state.user_id)
-    except Exception as e:
-        st.error(f"Error loading documents: {e}")
-        return
-    
-    if not docs:
-        st.info("📭 No documents uploaded yet. Go to the Upload tab to add documents.")
-        return
+    # Same cached lists the question filters use
+    facets = qa.get_search_lexicon(user_id)
     
     # Filters
     col1, col2 = st.columns(2)
     with col1:
-        properties = list(set([d.get("property_name") for d in docs if d.get("property_name")]))
         property_filter = st.selectbox(
             "Filter by property:",
-            ["All"] + properties
+            ["All"] + list(facets.get("properties") or [])
         )
     with col2:
-        types = list(set([d.get("document_type") for d in docs if d.get("document_type")]))
         type_filter = st.selectbox(
             "Filter by type:",
-            ["All"] + types
+            ["All"] + list(facets.get("document_types") or [])
         )
+    property_name = property_filter if property_filter != "All" else None
+    document_type = type_filter if type_filter != "All" else None
+    
+    # Each filter combination keeps its own page, so changing a filter starts at page 1
+    page_key = f"document_page_{property_filter}_{type_filter}"
+    page = st.session_state.get(page_key, 0)
+    page_size = database.DOCUMENT_PAGE_SIZE
     
-    # Apply filters
-    filtered_docs = docs
-    if property_filter != "All":
-        filtered_docs = [d for d in filtered_docs if d.get("property_name") == property_filter]
-    if type_filter != "All":
-        filtered_docs = [d for d in filtered_docs if d.get("document_type") == type_filter]
+    listing = database.get_cached_document_page(
+        user_id,
+        page=page,
+        property_name=property_name,
+        document_type=document_type
+    )
+    if listing is None:
+        st.error("❌ Could not load documents. Please try again.")
+        return
+    
+    total = listing["total"]
+    if total == 0 and not property_name and not document_type:
+        st.info("📭 No documents uploaded yet. Go to the Upload tab to add documents.")
+        return
     
-    st.write(f"Showing **{len(filtered_docs)}** documents")
+    page_count = max(1, -(-total // page_size))
+    if page >= page_count:
+        # Deletes left this page empty - go to the new last page
+        st.session_state[page_key] = page_count - 1
+        st.rerun()
     
-    # Display documents
-    for doc in filtered_docs:
+    docs = listing["documents"]
+    first = page * page_size + 1 if docs else 0
+    st.write(f"Showing **{first}-{page * page_size + len(docs)}** of **{total}** documents")
+    
+    # Bulk delete everything matching the current filter (e.g. a decommissioned property)
+    if total and (property_name or document_type):
+        with st.expander(f"🗑️ Delete all {total} matching documents"):
+            confirm = st.checkbox("I understand this permanently deletes these documents", key="confirm_bulk_delete")
+            if st.button("Delete All Matching", type="secondary", disabled=not confirm):
+                with st.spinner("Deleting documents..."):
+                    deleted = database.delete_documents(
+                        user_id,
+                        property_name=property_name,
+                        document_type=document_type
+                    )
+                st.success(f"✅ Deleted {deleted} document(s)")
+                st.rerun()
+    
+    # Display this page's documents
+    for doc in docs:
         doc_id = doc.get('id')
         filename = doc.get('filename', 'Unknown')
         
@@ -347,15 +434,39 @@ def view_documents_section():
             
             with col2:
                 if st.button("🗑️ Delete", key=f"delete_{doc_id}", type="secondary"):
-                    if database.delete_document(doc_id, st.session_state.user_id):
+                    if database.delete_document(doc_id, user_id):
                         st.success(f"✅ Deleted {filename}")
                         st.rerun()
                     else:
                         st.error("❌ Failed to delete document")
             
-            st.write("**Content Preview:**")
-            content = doc.get('file_content', '')
-            st.text(content[:500] + ("..." if len(content) > 500 else ""))
+            # Streamlit doesn't say when an expander opens, so the text loads on request
+            if st.toggle("Show content preview", key=f"preview_{doc_id}"):
+                content = database.get_cached_user_data(
+                    user_id,
+                    f"content:{doc_id}",
+                    lambda: database.get_document_content(doc_id, user_id),
+                    should_cache=lambda content: content is not None
+                )
+                if content is None:
+                    st.error("❌ Could not load the document text")
+                else:
+                    st.text(content[:500] + ("..." if len(content) > 500 else ""))
+    
+    # Page controls
+    if page_count > 1:
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            st.button("← Previous", disabled=page == 0, on_click=_set_document_page, args=(page_key, page - 1))
+        with col2:
+            st.write(f"Page **{page + 1}** of **{page_count}**")
+        with col3:
+            st.button("Next →", disabled=page >= page_count - 1, on_click=_set_document_page, args=(page_key, page + 1))
+
+
+def _set_document_page(page_key: str, page: int):
+    """Moves the document browser to another page"""
+    st.session_state[page_key] = page
 
 
 def main():
@@ -366,13 +477,17 @@ def main():
     if not auth.is_authenticated():
         login_page()
     else:
-        # Try to restore user info if not in session state
-        if st.session_state.user is None:
-            user = auth.get_current_user()
-            if user:
-                st.session_state.user = user
-                st.session_state.user_id = user.id
+        # Identify the user from the access token - validated locally, so a rerun
+        # makes no auth network call (the token is refreshed in the background)
+        user = auth.get_current_user()
+        if user is None:
+            auth.clear_session()
+            st.warning("⚠️ Your session has expired. Please log in again.")
+            login_page()
+            return
         
+        st.session_state.user = user
+        st.session_state.user_id = user.id
         main_app()
 
 
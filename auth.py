@@ -1,31 +1,94 @@
 """
 auth.py
 Handles user authentication with Supabase - with proper session management
+Access tokens are validated locally (JWT signature and expiry) and each session
+keeps its own data client, so an authenticated rerun makes no auth network calls.
+Tokens are refreshed in the background shortly before they expire.
 """
 
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import streamlit as st
-from database import get_supabase_client
-from typing import Optional, Dict
+from cache import TTLCache
+from database import get_supabase_client, create_user_client, _get_supabase_credentials
+from typing import Optional, Dict, NamedTuple, Tuple
+
+# Refresh the access token in the background once it has less than this many seconds left
+REFRESH_MARGIN = 300
+
+# How long a rerun waits for a refresh when its token has already expired
+REFRESH_TIMEOUT = 10
+
+# Signing algorithms accepted for tokens checked against the project's JWKS
+JWKS_ALGORITHMS = ["ES256", "RS256"]
+
+# How long fetched signing keys are reused before the JWKS is fetched again
+JWKS_CACHE_SECONDS = 600
+
+
+class SessionUser(NamedTuple):
+    """The logged-in user, as identified by the access token"""
+    id: str
+    email: Optional[str]
+
+
+# Verified token claims by token hash - each entry expires with its token
+_claims_cache = TTLCache(maxsize=1024, ttl=3600)
+
+_jwks_client = None
+
+# Background token refreshes, by the refresh token they use
+# Worker threads can't write st.session_state, so the next rerun collects the result
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="auth-refresh")
+_refreshes: Dict[str, Future] = {}
+_refreshes_lock = threading.Lock()
+
+# Tokens each refresh token was exchanged for, so a refresh token already spent by
+# the session (or an upload worker) is never sent to Supabase Auth again
+_refreshed_tokens = TTLCache(maxsize=1024, ttl=3600)
+
 
 def get_authenticated_client():
     """
     Returns a Supabase client with the current user's session attached
-    This ensures RLS policies work correctly
+    This ensures RLS policies work correctly. Each session keeps its own client
+    with the access token attached to data requests, so using it makes no auth call.
     """
-    supabase = get_supabase_client()
+    access_token, _ = get_session_tokens()
+    if not access_token:
+        return get_supabase_client()
+    
+    # Recreated only when the token changes (login or refresh)
+    if st.session_state.get("supabase_client_token") != access_token:
+        st.session_state.supabase_client = create_user_client(access_token)
+        st.session_state.supabase_client_token = access_token
     
-    # If we have a stored session, restore it
-    if 'access_token' in st.session_state and st.session_state.access_token:
-        try:
-            supabase.auth.set_session(
-                st.session_state.access_token,
-                st.session_state.refresh_token
-            )
-        except:
-            # Session might be expired, will handle in UI
-            pass
+    return st.session_state.supabase_client
+
+
+def get_session_tokens() -> Tuple[Optional[str], Optional[str]]:
+    """
+    Returns the stored (access_token, refresh_token) for the current session
+    Read these on the Streamlit script thread and pass them to code running elsewhere
+    """
+    return (
+        st.session_state.get('access_token'),
+        st.session_state.get('refresh_token')
+    )
+
+
+def _create_auth_client():
+    """
+    Creates a short-lived client for one auth call (sign in, refresh, sign out)
+    Keeps user sessions off the shared client, which every session in the process uses
+    """
+    from supabase import create_client, ClientOptions
     
-    return supabase
+    url, key = _get_supabase_credentials()
+    return create_client(url, key, options=ClientOptions(auto_refresh_token=False, persist_session=False))
 
 
 def sign_up(email: str, password: str) -> Dict:
@@ -40,7 +103,7 @@ def sign_up(email: str, password: str) -> Dict:
         Response from Supabase with user data
     """
     try:
-        supabase = get_supabase_client()
+        supabase = _create_auth_client()
         response = supabase.auth.sign_up({
             "email": email,
             "password": password
@@ -62,17 +125,21 @@ def sign_in(email: str, password: str) -> Dict:
         Response with user session or error
     """
     try:
-        supabase = get_supabase_client()
+        supabase = _create_auth_client()
         response = supabase.auth.sign_in_with_password({
             "email": email,
             "password": password
         })
-        
+    
         # Store session tokens in Streamlit session state for persistence
         if response.session:
             st.session_state.access_token = response.session.access_token
             st.session_state.refresh_token = response.session.refresh_token
-        
+            
+            # Prefetch the user's documents and search lists while the app loads
+            from warmup import start_warmup
+            start_warmup(response.user.id, response.session.access_token)
+    
         return {"success": True, "data": response}
     except Exception as e:
         return {"success": False, "error": str(e)}
@@ -83,40 +150,267 @@ def sign_out():
     Logs out the current user and clears session state
     """
     try:
-        supabase = get_supabase_client()
-        supabase.auth.sign_out()
-        
-        # Clear session state
-        if 'access_token' in st.session_state:
-            del st.session_state.access_token
-        if 'refresh_token' in st.session_state:
-            del st.session_state.refresh_token
-        if 'user' in st.session_state:
-            del st.session_state.user
-        if 'user_id' in st.session_state:
-            del st.session_state.user_id
-            
+        access_token, _ = get_session_tokens()
+        if access_token:
+            # Revokes the session's refresh tokens on the server
+            _create_auth_client().auth.admin.sign_out(access_token)
+    
+        clear_session()
         return {"success": True}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 
-def get_current_user() -> Optional[Dict]:
+def clear_session():
+    """
+    Forgets the current session's tokens, user and client (no network call)
+    """
+    for key in ("access_token", "refresh_token", "user", "user_id", "supabase_client", "supabase_client_token"):
+        if key in st.session_state:
+            del st.session_state[key]
+
+
+def get_current_user() -> Optional[SessionUser]:
+    """
+    Gets the currently logged-in user from the session's access token
+    The token is validated locally, so a normal rerun makes no network call.
+    A token close to expiry is refreshed in the background; one that has already
+    expired is refreshed before returning.
+    
+    Returns:
+        SessionUser (id, email) if logged in with a valid session, None otherwise
+    """
+    claims = _session_claims()
+    if not claims:
+        return None
+    return SessionUser(id=claims["sub"], email=claims.get("email"))
+
+
+def verify_access_token(access_token: str) -> Optional[Dict]:
+    """
+    Validates an access token and returns its claims
+    HS256 tokens are checked with SUPABASE_JWT_SECRET and asymmetric ones with the
+    project's (cached) JWKS. Without the secret, an HS256 token is checked with
+    Supabase Auth once. Results are cached until the token expires.
+    
+    Args:
+        access_token: The user's access token
+    
+    Returns:
+        Token claims ("sub", "email", "exp", ...), or None if invalid or expired
+    """
+    key = hashlib.sha256(access_token.encode()).hexdigest()
+    claims = _claims_cache.get(key)
+    if claims is not None:
+        return claims
+    
+    claims = _decode_access_token(access_token)
+    if claims:
+        _claims_cache.set(key, claims, ttl=claims["exp"] - time.time())
+    return claims
+
+
+def _decode_access_token(access_token: str) -> Optional[Dict]:
+    """Checks an access token's signature, expiry and audience"""
+    import jwt
+    
+    try:
+        algorithm = jwt.get_unverified_header(access_token).get("alg")
+        if algorithm == "HS256":
+            secret = os.getenv("SUPABASE_JWT_SECRET")
+            if not secret:
+                return _fetch_claims(access_token)
+            signing_key = secret.strip()
+            algorithms = ["HS256"]
+        else:
+            signing_key = _get_jwks_client().get_signing_key_from_jwt(access_token).key
+            algorithms = JWKS_ALGORITHMS
+    
+        return jwt.decode(
+            access_token,
+            signing_key,
+            algorithms=algorithms,
+            audience="authenticated",
+            options={"require": ["exp", "sub"]}
+        )
+    except jwt.ExpiredSignatureError:
+        return None
+    except Exception as e:
+        print(f"Access token rejected: {e}")
+        return None
+
+
+def _fetch_claims(access_token: str) -> Optional[Dict]:
+    """
+    Validates a token with Supabase Auth (one network call)
+    For HS256 projects when SUPABASE_JWT_SECRET isn't set
+    """
+    import jwt
+    
+    try:
+        response = get_supabase_client().auth.get_user(access_token)
+    except Exception as e:
+        print(f"Error validating access token: {e}")
+        return None
+    if not response or not response.user:
+        return None
+    
+    # Supabase vouched for the token, so its claims can be read as-is
+    claims = jwt.decode(access_token, options={"verify_signature": False})
+    if claims.get("exp", 0) <= time.time():
+        return None
+    return claims
+
+
+def _get_jwks_client():
+    """Returns the client for the project's signing keys (lazy initialization)"""
+    global _jwks_client
+    
+    if _jwks_client is None:
+        from jwt import PyJWKClient
+    
+        url, key = _get_supabase_credentials()
+        _jwks_client = PyJWKClient(
+            f"{url.rstrip('/')}/auth/v1/.well-known/jwks.json",
+            cache_keys=True,
+            lifespan=JWKS_CACHE_SECONDS,
+            headers={"apikey": key}
+        )
+    
+    return _jwks_client
+
+
+def _session_claims() -> Optional[Dict]:
+    """
+    Claims of the current session's access token, refreshing it when needed
+    Must run on the Streamlit script thread (it updates session state)
     """
-    Gets the currently logged-in user
+    _collect_refresh()
+    access_token, refresh_token = get_session_tokens()
+    if not access_token:
+        return None
+    
+    claims = verify_access_token(access_token)
+    if claims is None:
+        # Expired (e.g. the tab sat idle) - this rerun has to wait for a new token
+        if refresh_token and _collect_refresh(wait=True):
+            claims = verify_access_token(st.session_state.access_token)
+    elif refresh_token and claims["exp"] - time.time() < REFRESH_MARGIN:
+        _start_refresh(refresh_token)
+    
+    return claims
+
+
+def _start_refresh(refresh_token: str) -> Future:
+    """Starts refreshing a session in the background (once per refresh token)"""
+    with _refreshes_lock:
+        future = _refreshes.get(refresh_token)
+        if future is None:
+            tokens = _refreshed_tokens.get(refresh_token)
+            if tokens is not None:
+                future = Future()
+                future.set_result(tokens)
+            else:
+                future = _refresh_executor.submit(_refresh_tokens, refresh_token)
+            _refreshes[refresh_token] = future
+        return future
+
+
+def refresh_session_tokens(refresh_token: str) -> Optional[Tuple[str, str]]:
+    """
+    Newest (access_token, refresh_token) for a session, from any thread
+    For code that outlives the rerun it started in (e.g. upload workers). Refreshes
+    the session or another worker already made are followed instead of repeated,
+    so the same refresh token is never exchanged twice.
+    
+    Args:
+        refresh_token: The refresh token the caller holds
     
     Returns:
-        User data if logged in, None otherwise
+        The new tokens, or None if the refresh failed
     """
+    tokens = None
+    while True:
+        newer = _refreshed_tokens.get(refresh_token)
+        if newer is None:
+            break
+        tokens = newer
+        refresh_token = newer[1]
+    if tokens and (_token_expiry(tokens[0]) or 0) - time.time() >= REFRESH_MARGIN:
+        return tokens
+    
+    future = _start_refresh(refresh_token)
     try:
-        supabase = get_authenticated_client()
-        user = supabase.auth.get_user()
-        if user and user.user:
-            return user.user
+        return future.result(timeout=REFRESH_TIMEOUT) or tokens
+    except Exception as e:
+        print(f"Error refreshing session: {e}")
+        return tokens
+    finally:
+        if future.done():
+            # The result stays in _refreshed_tokens for the session to pick up
+            with _refreshes_lock:
+                _refreshes.pop(refresh_token, None)
+
+
+def _token_expiry(access_token: str) -> Optional[float]:
+    """A token's "exp" claim, read without checking the signature"""
+    import jwt
+    
+    try:
+        return jwt.decode(access_token, options={"verify_signature": False}).get("exp")
+    except Exception:
         return None
+
+
+def _collect_refresh(wait: bool = False) -> bool:
+    """
+    Stores the new tokens from this session's background refresh, if it has finished
+    
+    Args:
+        wait: Start the refresh if needed and wait for it (up to REFRESH_TIMEOUT)
+    
+    Returns:
+        True if the session's tokens were replaced
+    """
+    _, refresh_token = get_session_tokens()
+    if not refresh_token:
+        return False
+    
+    with _refreshes_lock:
+        future = _refreshes.get(refresh_token)
+    if future is None:
+        if not wait:
+            return False
+        future = _start_refresh(refresh_token)
+    if not wait and not future.done():
+        return False
+    
+    try:
+        tokens = future.result(timeout=REFRESH_TIMEOUT)
+    except FutureTimeoutError:
+        print("Session refresh is taking too long")
+        return False
     except Exception as e:
-        print(f"Error getting current user: {e}")
+        print(f"Error refreshing session: {e}")
+        tokens = None
+    
+    with _refreshes_lock:
+        _refreshes.pop(refresh_token, None)
+    if not tokens:
+        return False
+    
+    st.session_state.access_token, st.session_state.refresh_token = tokens
+    return True
+
+
+def _refresh_tokens(refresh_token: str) -> Optional[Tuple[str, str]]:
+    """Exchanges a refresh token for a new (access_token, refresh_token) - runs in the background"""
+    response = _create_auth_client().auth.refresh_session(refresh_token)
+    if not response.session:
         return None
+    tokens = (response.session.access_token, response.session.refresh_token)
+    _refreshed_tokens.set(refresh_token, tokens)
+    return tokens
 
 
 def is_authenticated() -> bool:
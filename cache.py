@@ -0,0 +1,104 @@
+"""
+cache.py
+Small thread-safe in-process LRU cache with per-entry expiry
+Module-level instances are shared by every Streamlit session in the process
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+# Returned by get() on a miss, so cached None values are still hits
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Least-recently-used cache where entries also expire after ttl seconds
+    Tracks hits/misses so callers can report hit rates
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 3600.0):
+        """
+        Args:
+            maxsize: Maximum number of entries before the least recently used is evicted
+            ttl: Seconds an entry stays valid after it was stored
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Returns the cached value, or default if missing or expired
+
+        Args:
+            key: Cache key
+            default: Value to return on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """
+        Stores a value, evicting the least recently used entries if full
+
+        Args:
+            key: Cache key
+            value: Value to store
+            ttl: Override the cache's default ttl for this entry
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Removes and returns an entry (no hit/miss counting)"""
+        with self._lock:
+            entry = self._entries.pop(key, _MISSING)
+            return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        """Removes every entry (stats are kept)"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict:
+        """
+        Returns cache statistics
+
+        Returns:
+            Dictionary with size, hits, misses, hit_rate and evictions
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions
+            }
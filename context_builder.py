@@ -0,0 +1,185 @@
+"""
+context_builder.py
+Builds the prompt context for question answering within a token budget
+Merges adjacent chunks of the same document and strips the overlap the chunker adds
+"""
+
+from typing import List, Dict, Tuple
+
+# Rough characters-per-token for English text (no tokenizer dependency needed)
+CHARS_PER_TOKEN = 4
+
+# Overlap between consecutive chunks is at most the chunker's overlap (50 chars),
+# so we never need to look further back than this
+MAX_OVERLAP_CHARS = 200
+MIN_OVERLAP_CHARS = 8
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates how many tokens a piece of text uses
+
+    Args:
+        text: Any text
+
+    Returns:
+        Approximate token count
+    """
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def strip_overlap(previous: str, current: str) -> str:
+    """
+    Removes the start of current that repeats the end of previous
+    (chunk_text starts each chunk with the tail of the one before it)
+
+    Args:
+        previous: Text of the earlier chunk
+        current: Text of the following chunk
+
+    Returns:
+        current without the repeated prefix
+    """
+    longest = min(len(previous), len(current), MAX_OVERLAP_CHARS)
+    for size in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(current[:size]):
+            return current[size:].lstrip()
+    return current
+
+
+def merge_chunks(chunks: List[Dict]) -> List[Dict]:
+    """
+    Merges chunks from the same document with consecutive chunk_index values
+
+    Args:
+        chunks: Search results (content, similarity, chunk_index, document_id, metadata)
+
+    Returns:
+        List of segments: {"document_id", "metadata", "text", "similarity",
+        "chunk_indexes", "chunks"} - similarity is the best of the merged chunks
+    """
+    by_document: Dict[str, List[Dict]] = {}
+    for chunk in chunks:
+        by_document.setdefault(chunk.get("document_id"), []).append(chunk)
+
+    segments = []
+    for document_id, doc_chunks in by_document.items():
+        doc_chunks = sorted(doc_chunks, key=lambda c: c.get("chunk_index", 0))
+        current = None
+
+        for chunk in doc_chunks:
+            index = chunk.get("chunk_index", 0)
+            text = chunk.get("content", "")
+            similarity = chunk.get("similarity", 0) or 0
+
+            if current and index <= current["chunk_indexes"][-1] + 1:
+                # Contiguous with the previous chunk - append without the repeated overlap
+                addition = strip_overlap(current["text"], text)
+                if addition:
+                    current["text"] += "\n\n" + addition
+                current["chunk_indexes"].append(index)
+                current["chunks"].append(chunk)
+                current["similarity"] = max(current["similarity"], similarity)
+                continue
+
+            current = {
+                "document_id": document_id,
+                "metadata": chunk.get("metadata", {}),
+                "text": text,
+                "similarity": similarity,
+                "chunk_indexes": [index],
+                "chunks": [chunk]
+            }
+            segments.append(current)
+
+    return segments
+
+
+def _document_header(metadata: Dict) -> str:
+    """Header written once per document in the context"""
+    header = f"\n--- Document: {metadata.get('filename', 'Unknown')} ---\n"
+    header += f"Property: {metadata.get('property_name', 'Unknown')}\n"
+    header += f"Type: {metadata.get('document_type', 'Unknown')}\n"
+    if metadata.get('vendor'):
+        header += f"Vendor: {metadata.get('vendor')}\n"
+    if metadata.get('amount'):
+        header += f"Amount: ${metadata.get('amount')}\n"
+    if metadata.get('document_date'):
+        header += f"Date: {metadata.get('document_date')}\n"
+    header += "Relevant sections:\n"
+    return header
+
+
+def _segment_label(segment: Dict) -> str:
+    """e.g. '[Sections 2-3, Relevance: 81.0%]'"""
+    first = segment["chunk_indexes"][0] + 1
+    last = segment["chunk_indexes"][-1] + 1
+    sections = f"Section {first}" if first == last else f"Sections {first}-{last}"
+    return f"  [{sections}, Relevance: {segment['similarity']:.1%}]\n"
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts text to roughly max_tokens, preferring a sentence or word boundary"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    boundary = max(cut.rfind(". "), cut.rfind("\n"))
+    if boundary < max_chars // 2:
+        boundary = cut.rfind(" ")
+    return cut[:boundary + 1].rstrip() + " ..." if boundary > 0 else cut + " ..."
+
+
+def pack_context(chunks: List[Dict], token_budget: int = 1500) -> Tuple[str, List[Dict]]:
+    """
+    Packs the most relevant text into the prompt context without exceeding the budget
+
+    Chunks are merged into contiguous segments, documents are ordered by their best
+    segment, and segments are added best-first until the budget runs out. The last
+    segment that doesn't fit whole is truncated if enough budget is left for it.
+
+    Args:
+        chunks: Search results (content, similarity, chunk_index, document_id, metadata)
+        token_budget: Maximum estimated tokens for the context
+
+    Returns:
+        (context text, list of the chunks that made it into the context)
+    """
+    segments = merge_chunks(chunks)
+    segments.sort(key=lambda seg: seg["similarity"], reverse=True)
+
+    # Decide what fits, best segments first
+    selected: Dict[str, List[Tuple[Dict, str]]] = {}
+    used_tokens = 0
+    for segment in segments:
+        document_id = segment["document_id"]
+        header_tokens = 0 if document_id in selected else estimate_tokens(_document_header(segment["metadata"]))
+        label = _segment_label(segment)
+        cost = header_tokens + estimate_tokens(label) + estimate_tokens(segment["text"]) + 1
+        remaining = token_budget - used_tokens
+
+        if cost <= remaining:
+            text = segment["text"]
+        else:
+            # Only worth truncating if a meaningful piece still fits
+            room = remaining - header_tokens - estimate_tokens(label) - 1
+            if room < 50:
+                continue
+            text = _truncate_to_tokens(segment["text"], room)
+            cost = header_tokens + estimate_tokens(label) + estimate_tokens(text) + 1
+
+        selected.setdefault(document_id, []).append((segment, text))
+        used_tokens += cost
+
+    # Write documents in order of their best segment, sections in document order
+    context = ""
+    used_chunks = []
+    for document_id, parts in selected.items():
+        parts.sort(key=lambda part: part[0]["chunk_indexes"][0])
+        context += _document_header(parts[0][0]["metadata"])
+        for segment, text in parts:
+            context += _segment_label(segment)
+            context += f"  {text}\n"
+            used_chunks.extend(segment["chunks"])
+
+    return context, used_chunks
@@ -5,8 +5,14 @@ Handles all database operations with Supabase - using authenticated sessions
 
 import os
 from dotenv import load_dotenv
-from typing import List, Dict, Optional, TYPE_CHECKING
+from typing import Any, Callable, List, Dict, Optional, Tuple, TYPE_CHECKING
 from datetime import datetime
+import threading
+import time
+from resilience import CircuitBreaker, LatencyTracker, call_with_deadline
+from cache import TTLCache
+from vectors import Vector, to_pgvector
+from simhash import NEAR_DUPLICATE_DISTANCE, band_values, to_signed
 
 # Lazy import Supabase - only load when actually needed
 if TYPE_CHECKING:
@@ -93,6 +99,253 @@ def get_supabase_client() -> 'Client':
     return _supabase_client
 
 
+_service_client: Optional['Client'] = None
+
+
+def create_user_client(access_token: str) -> 'Client':
+    """
+    Creates a Supabase client that acts as a user, without Streamlit session state
+    For background threads: the token is attached to PostgREST requests directly,
+    so no auth call is made (RLS applies as usual)
+    
+    Args:
+        access_token: The user's access token (read it on the Streamlit script thread)
+    
+    Returns:
+        Supabase client instance
+    """
+    from supabase import create_client
+    
+    url, key = _get_supabase_credentials()
+    client = create_client(url, key)
+    client.postgrest.auth(access_token)
+    return client
+
+
+def get_service_client() -> 'Client':
+    """
+    Returns a Supabase client using the service role key (bypasses RLS)
+    Only for maintenance scripts run by an admin - never use this in the app
+    """
+    global _service_client
+    
+    if _service_client is None:
+        from supabase import create_client
+        
+        url, _ = _get_supabase_credentials()
+        service_key = os.getenv("SUPABASE_SERVICE_KEY")
+        if not service_key:
+            raise ValueError("SUPABASE_SERVICE_KEY not found in environment variables. "
+                             "Copy the 'service_role' key from Supabase Dashboard > Settings > API.")
+        
+        _service_client = create_client(url, service_key.strip())
+    
+    return _service_client
+
+
+# Per-user corpus version: the database's (corpus_versions, kept by triggers in
+# ADD_CORPUS_VERSIONS.sql, so writes from any process count) plus a local counter
+# bumped by this process's own writes. Caches key on it (e.g. the answer cache in
+# qa.py) so they never serve stale results
+_corpus_versions: Dict[str, int] = {}
+_corpus_versions_lock = threading.Lock()
+
+# Seconds the database's version is reused before it's read again (bounds how
+# long a change made by another process can go unnoticed)
+CORPUS_VERSION_TTL = 15
+
+_stored_corpus_versions = TTLCache(maxsize=4096, ttl=CORPUS_VERSION_TTL)
+
+# Flipped off if the corpus_versions table hasn't been created yet (ADD_CORPUS_VERSIONS.sql)
+_corpus_versions_table_available = True
+
+
+def get_corpus_version(user_id: str, client: Optional['Client'] = None) -> Tuple[Optional[int], int]:
+    """
+    Returns the current corpus version for a user
+    
+    Args:
+        user_id: The user ID
+        client: Authenticated client to use if the stored version has to be read
+                (defaults to the current session's)
+    
+    Returns:
+        (stored version, local version) - compare as a whole; the stored part is
+        None without the corpus_versions table or when it couldn't be read
+    """
+    stored = _stored_corpus_versions.get(user_id)
+    if stored is None and _corpus_versions_table_available:
+        from auth import get_authenticated_client
+        stored = _fetch_corpus_version(client or get_authenticated_client(), user_id)
+    return stored, _local_corpus_version(user_id)
+
+
+def _local_corpus_version(user_id: str) -> int:
+    """How many times this process has bumped the user's version"""
+    with _corpus_versions_lock:
+        return _corpus_versions.get(user_id, 0)
+
+
+def _fetch_corpus_version(supabase, user_id: str) -> Optional[int]:
+    """Reads the user's version from corpus_versions and caches it (None on error)"""
+    try:
+        response = supabase.table("corpus_versions").select("version").eq("user_id", user_id).limit(1).execute()
+    except Exception as e:
+        _corpus_versions_error(e)
+        return None
+    return _store_corpus_version(user_id, response.data)
+
+
+def _store_corpus_version(user_id: str, rows: Optional[List[Dict]]) -> int:
+    """Caches a version read from corpus_versions (shared with database_async.py)"""
+    version = rows[0]["version"] if rows else 0
+    _stored_corpus_versions.set(user_id, version)
+    return version
+
+
+def _corpus_versions_error(error: Exception) -> None:
+    """Turns off the stored version if the table is missing (shared with database_async.py)"""
+    global _corpus_versions_table_available
+    if "corpus_versions" in str(error):
+        print(f"Warning: corpus_versions table not available, caches only see this process's changes: {error}")
+        print("Run ADD_CORPUS_VERSIONS.sql in Supabase to track changes made elsewhere.")
+        _corpus_versions_table_available = False
+    else:
+        print(f"Error reading corpus version: {error}")
+
+
+def bump_corpus_version(user_id: str) -> int:
+    """
+    Marks a user's document set as changed, invalidating anything cached against it
+    Called by save_document and the delete functions. The stored version is read
+    again on the next lookup, so it includes the change too.
+    
+    Args:
+        user_id: The user ID
+    
+    Returns:
+        The new local version number
+    """
+    _stored_corpus_versions.pop(user_id)
+    with _corpus_versions_lock:
+        _corpus_versions[user_id] = _corpus_versions.get(user_id, 0) + 1
+        return _corpus_versions[user_id]
+
+
+# Per-user query results (document list, stats...) keyed by (user, name, corpus version)
+# Streamlit reruns the whole script on every click; this serves those reruns from
+# memory until a save or delete bumps the corpus version (changes made by other
+# processes show up in the stored version within CORPUS_VERSION_TTL seconds, or
+# without ADD_CORPUS_VERSIONS.sql, when the entry's TTL runs out).
+_user_data_cache = TTLCache(maxsize=512, ttl=600)
+
+
+def get_cached_user_data(
+    user_id: str,
+    name: str,
+    loader: Callable[[], Any],
+    should_cache: Callable[[Any], bool] = bool,
+    client: Optional['Client'] = None
+) -> Any:
+    """
+    Returns a cached per-user query result, calling loader() on a miss
+    
+    Args:
+        user_id: The user ID
+        name: What is being cached (e.g. "dashboard") - part of the cache key
+        loader: Fetches the value when it isn't cached
+        should_cache: Whether a loaded value may be cached (by default empty results
+                      aren't, since the query functions also return them on errors)
+        client: Authenticated client for reading the corpus version (defaults to
+                the current session's - pass one from worker threads)
+    
+    Returns:
+        The cached or freshly loaded value
+    """
+    key = (user_id, name, get_corpus_version(user_id, client))
+    value = _user_data_cache.get(key)
+    if value is None:
+        value = loader()
+        if should_cache(value):
+            _user_data_cache.set(key, value)
+    return value
+
+
+def get_user_data_cache_stats() -> Dict:
+    """Returns hit/miss statistics for the per-user data cache"""
+    return _user_data_cache.stats()
+
+
+def _build_document_record(
+    user_id: str,
+    filename: str,
+    file_content: str,
+    property_name: str = None,
+    document_type: str = None,
+    vendor: str = None,
+    amount: float = None,
+    document_date: datetime = None,
+    simhash: Optional[int] = None
+) -> Dict:
+    """Builds the row inserted into the documents table (shared with database_async.py)"""
+    record = {
+        "user_id": user_id,
+        "filename": filename,
+        "file_content": file_content,
+        "property_name": property_name,
+        "document_type": document_type,
+        "vendor": vendor,
+        "amount": amount,
+        "document_date": document_date.isoformat() if document_date else None,
+        "embedding": None  # No longer storing document-level embedding
+    }
+    if simhash is not None and _simhash_columns_available:
+        record["simhash"] = to_signed(simhash)
+        for band, value in enumerate(band_values(simhash)):
+            record[f"simhash_band_{band}"] = value
+    return record
+
+
+# Flipped off if the documents table has no simhash columns yet (ADD_NEAR_DUPLICATES.sql)
+_simhash_columns_available = True
+
+# Flipped off if find_near_duplicates hasn't been created yet (ADD_NEAR_DUPLICATES.sql)
+_near_duplicate_search_available = True
+
+
+def _insert_document(supabase, document_data: Dict):
+    """
+    Inserts a document row, retrying without the simhash columns if they don't exist
+    """
+    global _simhash_columns_available
+    
+    try:
+        return supabase.table("documents").insert(document_data).execute()
+    except Exception as e:
+        if "simhash" not in str(e) or "simhash" not in document_data:
+            raise
+        print(f"Warning: documents table has no simhash columns, near-duplicate detection is off: {e}")
+        print("Run ADD_NEAR_DUPLICATES.sql in Supabase to enable it.")
+        _simhash_columns_available = False
+        document_data = {key: value for key, value in document_data.items() if not key.startswith("simhash")}
+        return supabase.table("documents").insert(document_data).execute()
+
+
+def _build_chunk_records(document_id: str, user_id: str, chunks: List[Dict]) -> List[Dict]:
+    """Builds the rows inserted into the document_chunks table (shared with database_async.py)"""
+    chunk_records = []
+    for chunk in chunks:
+        chunk_records.append({
+            "document_id": document_id,
+            "user_id": user_id,
+            "chunk_index": chunk.get("chunk_index", 0),
+            "chunk_text": chunk.get("text", ""),
+            "embedding": to_pgvector(chunk["embedding"]) if chunk.get("embedding") is not None else None,
+            "start_char": chunk.get("start_char", 0)
+        })
+    return chunk_records
+
+
 def save_document(
     user_id: str,
     filename: str,
@@ -102,7 +355,9 @@ def save_document(
     vendor: str = None,
     amount: float = None,
     document_date: datetime = None,
-    chunks: List[Dict] = None
+    chunks: List[Dict] = None,
+    client: Optional['Client'] = None,
+    simhash: Optional[int] = None
 ) -> Dict:
     """
     Saves a document to the database with metadata and chunks (chunked RAG system)
@@ -117,55 +372,40 @@ def save_document(
         amount: Dollar amount (if applicable)
         document_date: Date on the document
         chunks: List of chunk dictionaries with text and embeddings
+        client: Authenticated client to use - pass one when calling from a worker
+                thread (defaults to the current session's)
+        simhash: The document's SimHash fingerprint (simhash.py), stored for
+                 near-duplicate detection
     
     Returns:
         The saved document data or None on error
     """
     # Import here to avoid circular dependency
     from auth import get_authenticated_client
-    supabase = get_authenticated_client()
+    supabase = client or get_authenticated_client()
     
     try:
         # Step 1: Save the document (without embedding - chunks have embeddings)
-        document_data = {
-            "user_id": user_id,
-            "filename": filename,
-            "file_content": file_content,
-            "property_name": property_name,
-            "document_type": document_type,
-            "vendor": vendor,
-            "amount": amount,
-            "document_date": document_date.isoformat() if document_date else None,
-            "embedding": None  # No longer storing document-level embedding
-        }
+        document_data = _build_document_record(
+            user_id, filename, file_content, property_name,
+            document_type, vendor, amount, document_date, simhash
+        )
         
         # Insert document
-        doc_response = supabase.table("documents").insert(document_data).execute()
+        doc_response = _insert_document(supabase, document_data)
         
         if not doc_response.data:
             print(f"No data returned from document insert")
             return None
         
         document_id = doc_response.data[0]["id"]
+        bump_corpus_version(user_id)
         
         # Step 2: Save chunks if provided (optional - won't break if table doesn't exist)
         if chunks and len(chunks) > 0:
             try:
-                chunk_records = []
-                for chunk in chunks:
-                    chunk_records.append({
-                        "document_id": document_id,
-                        "user_id": user_id,
-                        "chunk_index": chunk.get("chunk_index", 0),
-                        "chunk_text": chunk.get("text", ""),
-                        "embedding": chunk.get("embedding"),
-                        "start_char": chunk.get("start_char", 0)
-                    })
-                
-                # Insert chunks in batch
-                if chunk_records:
-                    chunks_response = supabase.table("document_chunks").insert(chunk_records).execute()
-                    print(f"Saved {len(chunk_records)} chunks for document {document_id}")
+                saved = save_document_chunks(document_id, user_id, chunks, client=supabase)
+                print(f"Saved {saved} chunks for document {document_id}")
             except Exception as chunk_error:
                 # Chunks table might not exist yet - that's okay, document is still saved
                 print(f"Warning: Could not save chunks (table might not exist): {chunk_error}")
@@ -181,6 +421,81 @@ def save_document(
         return None
 
 
+def save_document_chunks(
+    document_id: str,
+    user_id: str,
+    chunks: List[Dict],
+    client: Optional['Client'] = None
+) -> int:
+    """
+    Saves a batch of chunks for an already saved document (one insert)
+    Streaming ingestion calls this once per batch as the chunks are embedded
+    
+    Args:
+        document_id: The document the chunks belong to
+        user_id: The user who owns the document
+        chunks: List of chunk dictionaries with text and embeddings
+        client: Authenticated client to use (defaults to the current session's)
+    
+    Returns:
+        Number of chunks saved (raises if the insert fails)
+    """
+    from auth import get_authenticated_client
+    supabase = client or get_authenticated_client()
+    
+    chunk_records = _build_chunk_records(document_id, user_id, chunks)
+    if not chunk_records:
+        return 0
+    
+    supabase.table("document_chunks").insert(chunk_records).execute()
+    bump_corpus_version(user_id)
+    return len(chunk_records)
+
+
+def find_near_duplicates(
+    simhash: int,
+    max_distance: int = NEAR_DUPLICATE_DISTANCE,
+    match_count: int = 5,
+    client: Optional['Client'] = None
+) -> List[Dict]:
+    """
+    Finds the user's documents whose SimHash is within max_distance bits
+    One indexed lookup per band (find_near_duplicates in ADD_NEAR_DUPLICATES.sql),
+    so the cost doesn't grow with the size of the corpus
+
+    Args:
+        simhash: Fingerprint of the new document (simhash.simhash)
+        max_distance: Most bits a near-duplicate may differ in
+        match_count: Maximum matches returned
+        client: Authenticated client to use (defaults to the current session's)
+
+    Returns:
+        List of {"id", "filename", "property_name", "document_type", "uploaded_at",
+        "distance"}, closest first (empty on error or if the function isn't installed)
+    """
+    global _near_duplicate_search_available
+    if not _near_duplicate_search_available or not _simhash_columns_available:
+        return []
+
+    from auth import get_authenticated_client
+    supabase = client or get_authenticated_client()
+
+    try:
+        response = supabase.rpc(
+            "find_near_duplicates",
+            {"query_simhash": to_signed(simhash), "max_distance": max_distance, "match_count": match_count}
+        ).execute()
+        return response.data or []
+    except Exception as e:
+        if "find_near_duplicates" in str(e):
+            print(f"Warning: find_near_duplicates not available, near-duplicate detection is off: {e}")
+            print("Run ADD_NEAR_DUPLICATES.sql in Supabase to enable it.")
+            _near_duplicate_search_available = False
+        else:
+            print(f"Error finding near-duplicates: {e}")
+        return []
+
+
 def get_user_documents(user_id: str) -> List[Dict]:
     """
     Gets all documents for a specific user
@@ -207,6 +522,247 @@ def get_user_documents(user_id: str) -> List[Dict]:
         return []
 
 
+# Columns the document browser lists (everything but the full text)
+DOCUMENT_LIST_COLUMNS = "id,filename,property_name,document_type,vendor,amount,document_date,uploaded_at"
+
+# Documents per page in the document browser
+DOCUMENT_PAGE_SIZE = 20
+
+
+def get_document_page(
+    user_id: str,
+    page: int = 0,
+    page_size: int = DOCUMENT_PAGE_SIZE,
+    property_name: Optional[str] = None,
+    document_type: Optional[str] = None,
+    client: Optional['Client'] = None
+) -> Optional[Dict]:
+    """
+    Gets one page of a user's documents, newest first, filtered in the database
+    Only the listing columns are fetched - use get_document_content for the text
+    
+    Args:
+        user_id: The user ID
+        page: Zero-based page number
+        page_size: Documents per page
+        property_name: Only documents for this property
+        document_type: Only documents of this type
+        client: Authenticated client to use (defaults to the current session's)
+    
+    Returns:
+        {"documents": [...], "total": number of matching documents}, or None on error
+    """
+    from auth import get_authenticated_client
+    from postgrest.types import CountMethod
+    supabase = client or get_authenticated_client()
+    
+    try:
+        query = supabase.table("documents")\
+            .select(DOCUMENT_LIST_COLUMNS, count=CountMethod.exact)\
+            .eq("user_id", user_id)
+        if property_name:
+            query = query.eq("property_name", property_name)
+        if document_type:
+            query = query.eq("document_type", document_type)
+    
+        start = page * page_size
+        response = query.order("uploaded_at", desc=True)\
+            .range(start, start + page_size - 1)\
+            .execute()
+    
+        return {"documents": response.data or [], "total": response.count or 0}
+    except Exception as e:
+        print(f"Error getting document page: {e}")
+        return None
+
+
+def get_cached_document_page(
+    user_id: str,
+    page: int = 0,
+    property_name: Optional[str] = None,
+    document_type: Optional[str] = None,
+    client: Optional['Client'] = None
+) -> Optional[Dict]:
+    """
+    get_document_page through the per-user data cache (see get_cached_user_data)
+    
+    Returns:
+        {"documents": [...], "total": ...}, or None on error
+    """
+    return get_cached_user_data(
+        user_id,
+        f"documents:{property_name}:{document_type}:{page}",
+        lambda: get_document_page(
+            user_id,
+            page=page,
+            property_name=property_name,
+            document_type=document_type,
+            client=client
+        ),
+        should_cache=lambda listing: listing is not None,
+        client=client
+    )
+
+
+def get_document_content(document_id: str, user_id: str, client: Optional['Client'] = None) -> Optional[str]:
+    """
+    Gets the full text of one document
+    
+    Args:
+        document_id: The document ID
+        user_id: User ID (must own the document)
+        client: Authenticated client to use (defaults to the current session's)
+    
+    Returns:
+        The document text ("" if it has none), or None on error
+    """
+    from auth import get_authenticated_client
+    supabase = client or get_authenticated_client()
+    
+    try:
+        response = supabase.table("documents")\
+            .select("file_content")\
+            .eq("id", document_id)\
+            .eq("user_id", user_id)\
+            .limit(1)\
+            .execute()
+    
+        if not response.data:
+            return None
+        return response.data[0].get("file_content") or ""
+    except Exception as e:
+        print(f"Error getting document content: {e}")
+        return None
+
+
+def get_document_filenames(user_id: str, client: Optional['Client'] = None) -> List[str]:
+    """
+    Gets the filenames of all of a user's documents (for the upload duplicate check)
+    
+    Args:
+        user_id: The user ID
+        client: Authenticated client to use (defaults to the current session's)
+    
+    Returns:
+        List of filenames
+    """
+    from auth import get_authenticated_client
+    supabase = client or get_authenticated_client()
+    
+    try:
+        response = supabase.table("documents")\
+            .select("filename")\
+            .eq("user_id", user_id)\
+            .execute()
+    
+        return [row["filename"] for row in (response.data or []) if row.get("filename")]
+    except Exception as e:
+        print(f"Error getting document filenames: {e}")
+        return []
+
+
+def get_document_facets(user_id: str, client: Optional['Client'] = None) -> Dict:
+    """
+    Gets the distinct properties, vendors and document types a user has
+    
+    Args:
+        user_id: The user ID
+        client: Authenticated client to use (defaults to the current session's)
+    
+    Returns:
+        {"properties": [...], "vendors": [...], "document_types": [...]}
+    """
+    from auth import get_authenticated_client
+    supabase = client or get_authenticated_client()
+    
+    try:
+        response = supabase.rpc("document_facets", {}).execute()
+        if response.data:
+            return response.data
+    except Exception as e:
+        print(f"Warning: document_facets not available, building facets from documents: {e}")
+    
+    # Fallback: fetch just the facet columns and de-duplicate here
+    try:
+        response = supabase.table("documents")\
+            .select("property_name,vendor,document_type")\
+            .eq("user_id", user_id)\
+            .execute()
+        docs = response.data or []
+    except Exception as e:
+        print(f"Error getting document facets: {e}")
+        docs = []
+    
+    return _collect_facets(docs)
+
+
+def _collect_facets(docs: List[Dict]) -> Dict:
+    """Distinct properties, vendors and document types of some document rows"""
+    return {
+        "properties": sorted({d["property_name"] for d in docs if d.get("property_name")}),
+        "vendors": sorted({d["vendor"] for d in docs if d.get("vendor")}),
+        "document_types": sorted({d["document_type"] for d in docs if d.get("document_type")})
+    }
+
+
+def aggregate_documents(
+    property_name: str = None,
+    vendor: str = None,
+    document_type: str = None,
+    date_from: str = None,
+    date_to: str = None,
+    min_amount: float = None,
+    max_amount: float = None,
+    row_limit: int = 50,
+    client: Optional['Client'] = None
+) -> Optional[Dict]:
+    """
+    Totals, counts and min/max/average amount over every matching document,
+    computed in one SQL query (aggregate_documents function, RLS applies)
+    
+    Args:
+        property_name: Property name substring (case-insensitive)
+        vendor: Vendor name substring (case-insensitive)
+        document_type: Exact normalized document type
+        date_from: Earliest document_date (YYYY-MM-DD)
+        date_to: Latest document_date (YYYY-MM-DD)
+        min_amount: Only documents with amount above this
+        max_amount: Only documents with amount below this
+        row_limit: Maximum matching documents returned alongside the totals
+        client: Authenticated client to use (defaults to the current session's)
+    
+    Returns:
+        Dictionary with document_count, total_amount, average_amount, min_amount,
+        max_amount, first_date, last_date and documents - or None on error
+    """
+    from auth import get_authenticated_client
+    supabase = client or get_authenticated_client()
+    
+    try:
+        response = supabase.rpc(
+            "aggregate_documents",
+            _aggregate_params(property_name, vendor, document_type, date_from, date_to, min_amount, max_amount, row_limit)
+        ).execute()
+        return response.data
+    except Exception as e:
+        print(f"Error aggregating documents (run ADD_AGGREGATE_QUERIES.sql?): {e}")
+        return None
+
+
+def _aggregate_params(property_name, vendor, document_type, date_from, date_to, min_amount, max_amount, row_limit) -> Dict:
+    """Parameters for the aggregate_documents RPC"""
+    return {
+        "property_filter": property_name,
+        "vendor_filter": vendor,
+        "type_filter": document_type,
+        "date_from": date_from,
+        "date_to": date_to,
+        "min_amount": min_amount,
+        "max_amount": max_amount,
+        "row_limit": row_limit
+    }
+
+
 def search_documents_by_property(user_id: str, property_name: str) -> List[Dict]:
     """
     Finds all documents for a specific property
@@ -234,97 +790,464 @@ def search_documents_by_property(user_id: str, property_name: str) -> List[Dict]
         return []
 
 
+def _attach_document_metadata(payload: Dict) -> List[Dict]:
+    """
+    Turns a match_chunks_compact payload into the list of chunk results
+    
+    Chunk rows already carry content/similarity/chunk_index/document_id, so they
+    are used as-is. Each row just gets a reference to its document's metadata
+    dict (shared between chunks of the same document, not copied).
+    
+    Args:
+        payload: {"chunks": [...], "documents": {document_id: metadata}} plus
+                 "neighbors" and "neighbor_window" when neighbours were requested
+    
+    Returns:
+        List of chunk dictionaries with a "metadata" key
+    """
+    if not payload:
+        return []
+    
+    documents = payload.get("documents") or {}
+    chunks = payload.get("chunks") or []
+    for chunk in chunks:
+        chunk["metadata"] = documents.get(chunk.get("document_id"), {})
+    
+    if payload.get("neighbor_window"):
+        _attach_neighbors(chunks, payload.get("neighbors") or [], documents, payload["neighbor_window"])
+    
+    return chunks
+
+
+def _attach_neighbors(chunks: List[Dict], neighbors: List[Dict], documents: Dict, window: int) -> None:
+    """
+    Gives each matched chunk a "neighbors" list: the surrounding chunks of its document
+    the search returned (each neighbour row is shared, not copied, between matches)
+    
+    Other matches count as neighbours too (the RPC doesn't repeat them as neighbour
+    rows), so an adjacent match that reranking drops later is still merged in.
+    
+    Args:
+        chunks: Matched chunks (modified in place)
+        neighbors: [{"document_id", "chunk_index", "content"}] - de-duplicated by the RPC
+        documents: {document_id: metadata}
+        window: How many chunks either side of a match count as its neighbours
+    """
+    by_document: Dict[str, Dict[int, Dict]] = {}
+    for neighbor in neighbors:
+        neighbor["metadata"] = documents.get(neighbor.get("document_id"), {})
+        by_document.setdefault(neighbor.get("document_id"), {})[neighbor.get("chunk_index", 0)] = neighbor
+    for chunk in chunks:
+        # A neighbour-shaped copy, so matches don't end up nested in each other
+        by_document.setdefault(chunk.get("document_id"), {})[chunk.get("chunk_index", 0)] = {
+            "document_id": chunk.get("document_id"),
+            "chunk_index": chunk.get("chunk_index", 0),
+            "content": chunk.get("content", ""),
+            "metadata": chunk.get("metadata", {})
+        }
+    
+    for chunk in chunks:
+        doc_neighbors = by_document.get(chunk.get("document_id"), {})
+        index = chunk.get("chunk_index", 0)
+        chunk["neighbors"] = [
+            doc_neighbors[i]
+            for i in range(index - window, index + window + 1)
+            if i != index and i in doc_neighbors
+        ]
+
+
+def _format_legacy_matches(rows: List[Dict]) -> List[Dict]:
+    """Formats rows from the older match_chunks function (one metadata object per row)"""
+    results = []
+    for chunk in rows or []:
+        results.append({
+            "content": chunk.get("chunk_text", ""),
+            "similarity": chunk.get("similarity", 0.0),
+            "metadata": chunk.get("metadata", {}),
+            "chunk_index": chunk.get("chunk_index", 0),
+            "document_id": chunk.get("document_id")
+        })
+    return results
+
+
+# Flipped off if match_chunks_compact hasn't been created yet (ADD_COMPACT_SEARCH.sql)
+_compact_search_available = True
+
+# Flipped off if match_chunks_compact doesn't take filters yet (ADD_SEARCH_FILTERS.sql)
+_filtered_search_available = True
+
+# Flipped off if match_chunks_compact doesn't return neighbouring chunks yet (ADD_NEIGHBOR_CHUNKS.sql)
+_neighbor_search_available = True
+
+# Filter keys (as returned by query_filters.extract_filters) -> match_chunks_compact parameters
+SEARCH_FILTER_PARAMS = {
+    "property_name": "property_filter",
+    "vendor": "vendor_filter",
+    "document_type": "type_filter",
+    "date_from": "date_from",
+    "date_to": "date_to"
+}
+
+# Search deadline (seconds) - a slow match_chunks call can't stall the whole answer
+SEARCH_TIMEOUT = 8.0
+
+# Shared by database.py and database_async.py so both see the same backend health
+_search_latency = LatencyTracker(window=200, min_samples=20, default=1.0)
+_search_breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30.0)
+
+
+class SearchUnavailableError(Exception):
+    """Raised when semantic search fails, times out, or is refused by the circuit breaker"""
+
+
+def _hedge_delay(timeout: float) -> float:
+    """Starts a hedged search once the first has run longer than ~95% of recent searches"""
+    return min(max(_search_latency.percentile(95), 0.05), timeout)
+
+
+def _search_params(
+    query_embedding: Vector,
+    match_threshold: float,
+    match_count: int,
+    filters: Optional[Dict],
+    neighbor_window: int = 0
+) -> Dict:
+    """Builds the search RPC parameters (optional parameters only when set and supported)"""
+    params = {
+        "query_embedding": to_pgvector(query_embedding),
+        "match_threshold": match_threshold,
+        "match_count": match_count
+    }
+    if filters and _filtered_search_available:
+        for key, param in SEARCH_FILTER_PARAMS.items():
+            if filters.get(key) is not None:
+                params[param] = filters[key]
+    if neighbor_window > 0 and _neighbor_search_available:
+        params["neighbor_window"] = neighbor_window
+    return params
+
+
+def _base_search_params(params: Dict) -> Dict:
+    """The search parameters every version of the search functions accepts"""
+    return {key: params[key] for key in ("query_embedding", "match_threshold", "match_count")}
+
+
+def _downgrade_search_params(params: Dict, error: Exception) -> Optional[Dict]:
+    """
+    Called when match_chunks_compact rejected a call: drops the newest optional
+    parameters the installed version of the function doesn't take yet
+    
+    Returns:
+        The reduced parameters to retry with, or None if there is nothing left to drop
+    """
+    global _neighbor_search_available, _filtered_search_available
+    
+    if "neighbor_window" in params:
+        print(f"Warning: neighbouring chunks not available, searching without them: {error}")
+        print("Run ADD_NEIGHBOR_CHUNKS.sql in Supabase to fetch neighbouring chunks with search results.")
+        _neighbor_search_available = False
+        return {key: value for key, value in params.items() if key != "neighbor_window"}
+    
+    if params != _base_search_params(params):
+        print(f"Warning: filtered search not available, searching without filters: {error}")
+        print("Run ADD_SEARCH_FILTERS.sql in Supabase to enable filtered search.")
+        _filtered_search_available = False
+        return _base_search_params(params)
+    
+    return None
+
+
+def _run_chunk_search(supabase, params: Dict) -> List[Dict]:
+    """
+    Runs one chunk search RPC (compact format if installed) and shapes the results
+    Raises on errors - callers decide how to handle them
+    """
+    global _compact_search_available
+    
+    if _compact_search_available:
+        try:
+            # Document metadata comes back once per document, not once per chunk
+            response = supabase.rpc("match_chunks_compact", params).execute()
+            return _attach_document_metadata(response.data)
+        except Exception as compact_error:
+            if "match_chunks_compact" not in str(compact_error):
+                raise
+            # The installed function may predate some optional parameters
+            downgraded = _downgrade_search_params(params, compact_error)
+            if downgraded is not None:
+                return _run_chunk_search(supabase, downgraded)
+            print(f"Warning: match_chunks_compact not available, using match_chunks: {compact_error}")
+            print("Run ADD_COMPACT_SEARCH.sql in Supabase to enable compact search results.")
+            _compact_search_available = False
+    
+    # match_chunks function uses auth.uid() automatically for security
+    # (it has no optional parameters - filters and neighbours need the compact search)
+    response = supabase.rpc("match_chunks", _base_search_params(params)).execute()
+    return _format_legacy_matches(response.data)
+
+
 def search_documents_semantic(
-    query_embedding: List[float],
+    query_embedding: Vector,
     match_threshold: float = 0.3,
-    match_count: int = 10
+    match_count: int = 10,
+    timeout: float = SEARCH_TIMEOUT,
+    hedge: bool = True,
+    filters: Optional[Dict] = None,
+    neighbor_window: int = 0,
+    client: Optional['Client'] = None
 ) -> List[Dict]:
     """
     Performs semantic search using vector similarity on CHUNKS
-    Uses the match_chunks SQL function with RLS (filters by auth.uid() automatically)
+    Uses the match_chunks_compact SQL function with RLS (filters by auth.uid() automatically),
+    falling back to match_chunks if the compact function isn't installed
+    
+    The call is bounded by a deadline, optionally hedged with a second request
+    after the recent p95 latency, and guarded by a circuit breaker.
     
     Args:
         query_embedding: Vector representation of the user's question
         match_threshold: Minimum similarity score (0.0 to 1.0)
         match_count: How many chunks to return
+        timeout: Seconds to wait before giving up
+        hedge: Whether to send a backup request when the first one is slow
+        filters: Optional property_name / vendor / document_type / date_from / date_to
+                 restricting the search to matching documents (None values are ignored)
+        neighbor_window: Also return up to this many chunks before and after each match
+                         (as chunk["neighbors"]) in the same round trip
+        client: Authenticated client to use - pass one when calling from a worker
+                thread (defaults to the current session's)
     
     Returns:
         List of most relevant chunks with similarity scores and document metadata
+        (empty list means nothing matched)
+    
+    Raises:
+        SearchUnavailableError if the search failed or timed out
     """
-    from auth import get_authenticated_client
-    supabase = get_authenticated_client()
+    if not _search_breaker.allow():
+        raise SearchUnavailableError("Search is temporarily unavailable after repeated failures. Please try again shortly.")
     
+    # Everything after allow() must end in record_success, record_failure or release,
+    # or a half-open breaker would keep its trial slot taken and refuse every search
+    started = time.monotonic()
     try:
-        # match_chunks function uses auth.uid() automatically for security
-        response = supabase.rpc(
-            "match_chunks",
-            {
-                "query_embedding": query_embedding,
-                "match_threshold": match_threshold,
-                "match_count": match_count
-            }
-        ).execute()
+        from auth import get_authenticated_client
+        # Resolve the client here - worker threads can't read Streamlit session state
+        supabase = client or get_authenticated_client()
         
-        # Format response to match expected structure
-        results = []
-        if response.data:
-            for chunk in response.data:
-                results.append({
-                    "content": chunk.get("chunk_text", ""),
-                    "similarity": chunk.get("similarity", 0.0),
-                    "metadata": chunk.get("metadata", {}),
-                    "chunk_index": chunk.get("chunk_index", 0),
-                    "document_id": chunk.get("document_id")
-                })
+        params = _search_params(query_embedding, match_threshold, match_count, filters, neighbor_window)
         
-        return results
+        results = call_with_deadline(
+            lambda: _run_chunk_search(supabase, params),
+            timeout=timeout,
+            hedge_after=_hedge_delay(timeout) if hedge else None
+        )
     except Exception as e:
-        print(f"Error in semantic search: {e}")
-        import traceback
-        traceback.print_exc()
-        return []
+        _search_breaker.record_failure()
+        print(f"Error in semantic search: {e!r}")
+        raise SearchUnavailableError(f"Search failed: {e}") from e
+    except BaseException:
+        # Interrupted, not failed - neither success nor failure
+        _search_breaker.release()
+        raise
+    
+    _search_breaker.record_success()
+    _search_latency.record(time.monotonic() - started)
+    return results
 
 
-def delete_document(document_id: str, user_id: str) -> bool:
+def delete_document(document_id: str, user_id: str, client: Optional['Client'] = None) -> bool:
     """
     Deletes a document (with user verification for security)
     
     Args:
         document_id: ID of document to delete
         user_id: User ID (must own the document)
+        client: Authenticated client to use (defaults to the current session's)
     
     Returns:
         True if deleted successfully
     """
     from auth import get_authenticated_client
-    supabase = get_authenticated_client()
+    supabase = client or get_authenticated_client()
     
     try:
+        # Remove chunks in batches first so the delete doesn't cascade through all of them
+        _delete_chunks_in_batches(supabase, [document_id], 1000)
+        
         response = supabase.table("documents")\
             .delete()\
             .eq("id", document_id)\
             .eq("user_id", user_id)\
             .execute()
         
-        return len(response.data) > 0 if response.data else False
+        deleted = len(response.data) > 0 if response.data else False
+        if deleted:
+            bump_corpus_version(user_id)
+        return deleted
     except Exception as e:
         print(f"Error deleting document: {e}")
         return False
 
 
-def get_document_stats(user_id: str) -> Dict:
+# Documents deleted per request in delete_documents (keeps the id list in the URL short)
+DELETE_DOCUMENT_BATCH = 200
+
+# Flipped off if delete_document_chunks_batch hasn't been created yet (ADD_BULK_DELETE.sql)
+_batched_chunk_delete_available = True
+
+
+def _delete_chunks_in_batches(supabase, document_ids: List[str], batch_size: int) -> int:
+    """
+    Removes chunks for the given documents a batch at a time, so the final
+    document delete has nothing left to cascade
+    
+    Args:
+        supabase: Authenticated Supabase client
+        document_ids: Documents whose chunks should be removed
+        batch_size: Maximum chunks removed per call
+    
+    Returns:
+        Number of chunks deleted (0 if the batch function isn't installed - CASCADE still cleans up)
+    """
+    global _batched_chunk_delete_available
+    if not _batched_chunk_delete_available:
+        return 0
+    
+    total = 0
+    try:
+        while True:
+            response = supabase.rpc(
+                "delete_document_chunks_batch",
+                {"document_ids": document_ids, "batch_size": batch_size}
+            ).execute()
+            deleted = response.data or 0
+            total += deleted
+            if deleted < batch_size:
+                break
+    except Exception as e:
+        if "delete_document_chunks_batch" not in str(e):
+            raise
+        print(f"Warning: delete_document_chunks_batch not available, relying on CASCADE: {e}")
+        print("Run ADD_BULK_DELETE.sql in Supabase to enable batched chunk deletes.")
+        _batched_chunk_delete_available = False
+    
+    return total
+
+
+def delete_documents(
+    user_id: str,
+    document_ids: List[str] = None,
+    property_name: str = None,
+    document_type: str = None,
+    chunk_batch_size: int = 1000
+) -> int:
+    """
+    Deletes many documents at once, either by id list or by property/type filter
+    Chunks are removed in batches first, then documents go in one set-based
+    delete per DELETE_DOCUMENT_BATCH ids
+    
+    Args:
+        user_id: User ID (must own the documents)
+        document_ids: Specific documents to delete
+        property_name: Delete every document for this property
+        document_type: Delete every document of this type
+        chunk_batch_size: Maximum chunks removed per call
+    
+    Returns:
+        Number of documents deleted
+    """
+    if not document_ids and not property_name and not document_type:
+        # Refuse to treat "no filter" as "delete everything"
+        return 0
+    
+    from auth import get_authenticated_client
+    from postgrest.types import CountMethod, ReturnMethod
+    supabase = get_authenticated_client()
+    
+    def id_batches():
+        if document_ids:
+            for start in range(0, len(document_ids), DELETE_DOCUMENT_BATCH):
+                yield document_ids[start:start + DELETE_DOCUMENT_BATCH]
+            return
+        
+        # Filter mode: keep taking the first batch of matches until none are left
+        while True:
+            query = supabase.table("documents").select("id").eq("user_id", user_id)
+            if property_name:
+                query = query.eq("property_name", property_name)
+            if document_type:
+                query = query.eq("document_type", document_type)
+            response = query.limit(DELETE_DOCUMENT_BATCH).execute()
+            ids = [row["id"] for row in (response.data or [])]
+            if not ids:
+                return
+            yield ids
+    
+    deleted = 0
+    try:
+        for ids in id_batches():
+            _delete_chunks_in_batches(supabase, ids, chunk_batch_size)
+            response = supabase.table("documents")\
+                .delete(count=CountMethod.exact, returning=ReturnMethod.minimal)\
+                .in_("id", ids)\
+                .eq("user_id", user_id)\
+                .execute()
+            # count is None if the response carried no Content-Range header (and
+            # returning=minimal means there are no rows to count either)
+            batch_deleted = response.count if response.count is not None else len(ids)
+            if not batch_deleted and not document_ids:
+                # Filter matched rows we couldn't delete - stop instead of looping forever
+                break
+            deleted += batch_deleted
+            bump_corpus_version(user_id)
+        
+        return deleted
+    except Exception as e:
+        print(f"Error bulk deleting documents: {e}")
+        return deleted
+
+
+def get_document_stats(user_id: str, client: Optional['Client'] = None) -> Dict:
     """
     Gets statistics about user's documents
     (Total count, properties, document types, etc.)
     
     Args:
         user_id: The user ID
+        client: Authenticated client to use (defaults to the current session's)
     
     Returns:
         Dictionary with statistics
     """
-    docs = get_user_documents(user_id)
+    from auth import get_authenticated_client
+    supabase = client or get_authenticated_client()
+    
+    # Only the columns the stats need, not the full document text
+    try:
+        response = supabase.table("documents")\
+            .select("property_name,document_type,amount")\
+            .eq("user_id", user_id)\
+            .execute()
+        docs = response.data or []
+    except Exception as e:
+        print(f"Error getting document stats: {e}")
+        docs = []
+    
+    return _summarize_documents(docs)
+
+
+def _summarize_documents(docs: List[Dict]) -> Dict:
+    """
+    Calculates document statistics from document rows
+    Only needs property_name, document_type and amount on each row
     
+    Args:
+        docs: Document rows
+    
+    Returns:
+        Dictionary with statistics
+    """
     if not docs:
         return {
             "total_documents": 0,
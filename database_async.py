@@ -0,0 +1,570 @@
+"""
+database_async.py
+Asyncio versions of the database operations (built on the async Supabase client)
+Lets callers overlap independent queries - e.g. document list, stats and search - with asyncio.gather
+"""
+
+import asyncio
+import threading
+import time
+import weakref
+from typing import List, Dict, Optional, Tuple, TYPE_CHECKING
+from datetime import datetime
+import database
+from database import (
+    _get_supabase_credentials,
+    _attach_document_metadata,
+    _format_legacy_matches,
+    _search_params,
+    _base_search_params,
+    _downgrade_search_params,
+    _build_document_record,
+    _build_chunk_records,
+    _summarize_documents,
+    _collect_facets,
+    _aggregate_params,
+    SearchUnavailableError,
+    SEARCH_TIMEOUT
+)
+from resilience import acall_with_deadline
+from vectors import Vector
+
+if TYPE_CHECKING:
+    from supabase import AsyncClient
+
+# The async client's HTTP connections belong to the event loop that created them,
+# so clients are cached per loop - and per user, as (access token, client): a
+# refreshed token replaces the user's client instead of adding another one
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Tuple[Optional[str], AsyncClient]]]" = weakref.WeakKeyDictionary()
+
+# Seconds a replaced client stays open, so requests already using it can finish
+SUPERSEDED_CLIENT_GRACE = 60
+
+# Long-lived event loop that run() and the question runners (qa_async.py) share,
+# so cached clients and their connections are reused across calls (started on first use)
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_loop_lock = threading.Lock()
+
+
+async def create_async_client(access_token: Optional[str] = None) -> 'AsyncClient':
+    """
+    Creates an async Supabase client for data access
+    The access token is attached directly to PostgREST requests, so no auth call is made
+
+    Args:
+        access_token: The user's access token (None for an anonymous client)
+
+    Returns:
+        AsyncClient instance
+    """
+    # Lazy import Supabase - only load when actually needed
+    from supabase import acreate_client
+
+    url, key = _get_supabase_credentials()
+    client = await acreate_client(url, key)
+    if access_token:
+        client.postgrest.auth(access_token)
+    return client
+
+
+async def get_authenticated_async_client(access_token: Optional[str] = None) -> 'AsyncClient':
+    """
+    Returns an async client for the current user, reusing one per event loop
+
+    Args:
+        access_token: Token to use. If None, it's read from the Streamlit session
+                      (only works on the script thread - pass it explicitly elsewhere)
+
+    Returns:
+        AsyncClient instance with the user's token attached
+    """
+    if access_token is None:
+        from auth import get_session_tokens
+        access_token, _ = get_session_tokens()
+
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    cache_key = _client_key(access_token)
+    cached = clients.get(cache_key)
+    if cached is not None and cached[0] == access_token:
+        return cached[1]
+
+    client = await create_async_client(access_token)
+    clients[cache_key] = (access_token, client)
+    if cached is not None:
+        # The user's token was refreshed - retire the client that has the old one
+        _retire_client(loop, clients, cached[1])
+    return client
+
+
+def _client_key(access_token: Optional[str]) -> str:
+    """The user an access token belongs to (its "sub" claim), so their refreshed tokens share a slot"""
+    if not access_token:
+        return ""
+    import jwt
+
+    try:
+        return jwt.decode(access_token, options={"verify_signature": False}).get("sub") or access_token
+    except Exception:
+        return access_token
+
+
+def _retire_client(loop: asyncio.AbstractEventLoop, clients: Dict, client: 'AsyncClient') -> None:
+    """Closes a replaced client after SUPERSEDED_CLIENT_GRACE seconds (or with its loop's clients)"""
+    retired_key = f"retired:{id(client)}"
+    clients[retired_key] = (None, client)
+
+    def close():
+        if clients.pop(retired_key, None) is not None:
+            loop.create_task(close_async_client(client))
+
+    loop.call_later(SUPERSEDED_CLIENT_GRACE, close)
+
+
+async def release_async_client(access_token: Optional[str]) -> None:
+    """Closes and forgets the running loop's client for this token's user (e.g. on logout)"""
+    clients = _async_clients.get(asyncio.get_running_loop(), {})
+    cached = clients.pop(_client_key(access_token), None)
+    if cached is not None:
+        await close_async_client(cached[1])
+
+
+async def close_async_client(client: 'AsyncClient') -> None:
+    """Closes an async client's HTTP connection pools (data and auth)"""
+    for close in (client.postgrest.aclose, client.auth.close):
+        try:
+            await close()
+        except Exception as e:
+            print(f"Warning: could not close async Supabase client: {e}")
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """Returns the shared background event loop, starting its thread the first time"""
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            _background_loop = asyncio.new_event_loop()
+            threading.Thread(target=_background_loop.run_forever, name="database-async", daemon=True).start()
+        return _background_loop
+
+
+def run(coro):
+    """
+    Runs a coroutine to completion from synchronous code (e.g. the Streamlit script)
+    It runs on the shared background loop, so the async clients it uses (cached
+    per loop and user) stay connected for the next call.
+
+    Args:
+        coro: Coroutine to run
+
+    Returns:
+        The coroutine's result
+    """
+    loop = get_background_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        # Blocking here would deadlock the loop
+        coro.close()
+        raise RuntimeError("run() called from the background loop - await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+async def get_corpus_version(user_id: str, client: 'AsyncClient') -> Tuple[Optional[int], int]:
+    """Async version of database.get_corpus_version (same cache)"""
+    stored = database._stored_corpus_versions.get(user_id)
+    if stored is None and database._corpus_versions_table_available:
+        try:
+            response = await client.table("corpus_versions").select("version").eq("user_id", user_id).limit(1).execute()
+            stored = database._store_corpus_version(user_id, response.data)
+        except Exception as e:
+            database._corpus_versions_error(e)
+    return stored, database._local_corpus_version(user_id)
+
+
+async def save_document(
+    user_id: str,
+    filename: str,
+    file_content: str,
+    property_name: str = None,
+    document_type: str = None,
+    vendor: str = None,
+    amount: float = None,
+    document_date: datetime = None,
+    chunks: List[Dict] = None,
+    client: Optional['AsyncClient'] = None,
+    simhash: Optional[int] = None
+) -> Optional[Dict]:
+    """
+    Async version of database.save_document
+
+    Returns:
+        The saved document data or None on error
+    """
+    supabase = client or await get_authenticated_async_client()
+
+    try:
+        document_data = _build_document_record(
+            user_id, filename, file_content, property_name,
+            document_type, vendor, amount, document_date, simhash
+        )
+        doc_response = await _insert_document(supabase, document_data)
+
+        if not doc_response.data:
+            print(f"No data returned from document insert")
+            return None
+
+        document_id = doc_response.data[0]["id"]
+        database.bump_corpus_version(user_id)
+
+        if chunks:
+            try:
+                chunk_records = _build_chunk_records(document_id, user_id, chunks)
+                await supabase.table("document_chunks").insert(chunk_records).execute()
+                print(f"Saved {len(chunk_records)} chunks for document {document_id}")
+            except Exception as chunk_error:
+                print(f"Warning: Could not save chunks (table might not exist): {chunk_error}")
+                print("Run the ADD_CHUNKS_TABLE.sql in Supabase to enable chunking.")
+
+        return doc_response.data[0]
+
+    except Exception as e:
+        print(f"Error saving document: {e}")
+        return None
+
+
+async def _insert_document(supabase, document_data: Dict):
+    """Async version of database._insert_document (retries without the simhash columns)"""
+    try:
+        return await supabase.table("documents").insert(document_data).execute()
+    except Exception as e:
+        if "simhash" not in str(e) or "simhash" not in document_data:
+            raise
+        print(f"Warning: documents table has no simhash columns, near-duplicate detection is off: {e}")
+        print("Run ADD_NEAR_DUPLICATES.sql in Supabase to enable it.")
+        database._simhash_columns_available = False
+        document_data = {key: value for key, value in document_data.items() if not key.startswith("simhash")}
+        return await supabase.table("documents").insert(document_data).execute()
+
+
+async def get_user_documents(user_id: str, client: Optional['AsyncClient'] = None) -> List[Dict]:
+    """
+    Async version of database.get_user_documents
+
+    Returns:
+        List of all documents belonging to this user
+    """
+    supabase = client or await get_authenticated_async_client()
+
+    try:
+        response = await supabase.table("documents")\
+            .select("*")\
+            .eq("user_id", user_id)\
+            .order("uploaded_at", desc=True)\
+            .execute()
+
+        return response.data if response.data else []
+    except Exception as e:
+        print(f"Error getting user documents: {e}")
+        return []
+
+
+async def get_document_stats(user_id: str, client: Optional['AsyncClient'] = None) -> Dict:
+    """
+    Async version of database.get_document_stats
+    Only fetches the columns the stats need, not the full document text
+
+    Returns:
+        Dictionary with statistics
+    """
+    supabase = client or await get_authenticated_async_client()
+
+    try:
+        response = await supabase.table("documents")\
+            .select("property_name,document_type,amount")\
+            .eq("user_id", user_id)\
+            .execute()
+        docs = response.data or []
+    except Exception as e:
+        print(f"Error getting document stats: {e}")
+        docs = []
+
+    return _summarize_documents(docs)
+
+
+async def get_document_filenames(user_id: str, client: Optional['AsyncClient'] = None) -> List[str]:
+    """
+    Async version of database.get_document_filenames
+
+    Returns:
+        List of filenames
+    """
+    supabase = client or await get_authenticated_async_client()
+
+    try:
+        response = await supabase.table("documents")\
+            .select("filename")\
+            .eq("user_id", user_id)\
+            .execute()
+
+        return [row["filename"] for row in (response.data or []) if row.get("filename")]
+    except Exception as e:
+        print(f"Error getting document filenames: {e}")
+        return []
+
+
+async def get_document_facets(user_id: str, client: Optional['AsyncClient'] = None) -> Dict:
+    """Async version of database.get_document_facets"""
+    supabase = client or await get_authenticated_async_client()
+
+    try:
+        response = await supabase.rpc("document_facets", {}).execute()
+        if response.data:
+            return response.data
+    except Exception as e:
+        print(f"Warning: document_facets not available, building facets from documents: {e}")
+
+    try:
+        response = await supabase.table("documents")\
+            .select("property_name,vendor,document_type")\
+            .eq("user_id", user_id)\
+            .execute()
+        docs = response.data or []
+    except Exception as e:
+        print(f"Error getting document facets: {e}")
+        docs = []
+
+    return _collect_facets(docs)
+
+
+async def aggregate_documents(
+    property_name: str = None,
+    vendor: str = None,
+    document_type: str = None,
+    date_from: str = None,
+    date_to: str = None,
+    min_amount: float = None,
+    max_amount: float = None,
+    row_limit: int = 50,
+    client: Optional['AsyncClient'] = None
+) -> Optional[Dict]:
+    """
+    Async version of database.aggregate_documents
+
+    Returns:
+        Aggregation result dictionary or None on error
+    """
+    supabase = client or await get_authenticated_async_client()
+
+    try:
+        response = await supabase.rpc(
+            "aggregate_documents",
+            _aggregate_params(property_name, vendor, document_type, date_from, date_to, min_amount, max_amount, row_limit)
+        ).execute()
+        return response.data
+    except Exception as e:
+        print(f"Error aggregating documents (run ADD_AGGREGATE_QUERIES.sql?): {e}")
+        return None
+
+
+async def _run_chunk_search(supabase: 'AsyncClient', params: Dict) -> List[Dict]:
+    """Async version of database._run_chunk_search (raises on errors)"""
+    if database._compact_search_available:
+        try:
+            response = await supabase.rpc("match_chunks_compact", params).execute()
+            return _attach_document_metadata(response.data)
+        except Exception as compact_error:
+            if "match_chunks_compact" not in str(compact_error):
+                raise
+            downgraded = _downgrade_search_params(params, compact_error)
+            if downgraded is not None:
+                return await _run_chunk_search(supabase, downgraded)
+            print(f"Warning: match_chunks_compact not available, using match_chunks: {compact_error}")
+            database._compact_search_available = False
+
+    response = await supabase.rpc("match_chunks", _base_search_params(params)).execute()
+    return _format_legacy_matches(response.data)
+
+
+async def search_documents_semantic(
+    query_embedding: Vector,
+    match_threshold: float = 0.3,
+    match_count: int = 10,
+    client: Optional['AsyncClient'] = None,
+    timeout: float = SEARCH_TIMEOUT,
+    hedge: bool = True,
+    filters: Optional[Dict] = None,
+    neighbor_window: int = 0
+) -> List[Dict]:
+    """
+    Async version of database.search_documents_semantic
+    Shares its deadline, hedging and circuit breaker behaviour
+
+    Returns:
+        List of most relevant chunks with similarity scores and document metadata
+
+    Raises:
+        SearchUnavailableError if the search failed or timed out
+    """
+    if not database._search_breaker.allow():
+        raise SearchUnavailableError("Search is temporarily unavailable after repeated failures. Please try again shortly.")
+
+    # As in database.search_documents_semantic, every path out releases the trial slot
+    started = time.monotonic()
+    try:
+        supabase = client or await get_authenticated_async_client()
+
+        params = _search_params(query_embedding, match_threshold, match_count, filters, neighbor_window)
+
+        results = await acall_with_deadline(
+            lambda: _run_chunk_search(supabase, params),
+            timeout=timeout,
+            hedge_after=database._hedge_delay(timeout) if hedge else None
+        )
+    except Exception as e:
+        database._search_breaker.record_failure()
+        print(f"Error in semantic search: {e!r}")
+        raise SearchUnavailableError(f"Search failed: {e}") from e
+    except BaseException:
+        # Cancelled (e.g. the question was superseded) - neither success nor failure
+        database._search_breaker.release()
+        raise
+
+    database._search_breaker.record_success()
+    database._search_latency.record(time.monotonic() - started)
+    return results
+
+
+async def delete_document(document_id: str, user_id: str, client: Optional['AsyncClient'] = None) -> bool:
+    """
+    Async version of database.delete_document
+
+    Returns:
+        True if deleted successfully
+    """
+    supabase = client or await get_authenticated_async_client()
+
+    try:
+        # Remove chunks in batches first so the delete doesn't cascade through all of them
+        await _delete_chunks_in_batches(supabase, [document_id], 1000)
+
+        response = await supabase.table("documents")\
+            .delete()\
+            .eq("id", document_id)\
+            .eq("user_id", user_id)\
+            .execute()
+
+        deleted = len(response.data) > 0 if response.data else False
+        if deleted:
+            database.bump_corpus_version(user_id)
+        return deleted
+    except Exception as e:
+        print(f"Error deleting document: {e}")
+        return False
+
+
+async def _delete_chunks_in_batches(supabase: 'AsyncClient', document_ids: List[str], batch_size: int) -> int:
+    """Async version of database._delete_chunks_in_batches (shares its availability flag)"""
+    if not database._batched_chunk_delete_available:
+        return 0
+
+    total = 0
+    try:
+        while True:
+            response = await supabase.rpc(
+                "delete_document_chunks_batch",
+                {"document_ids": document_ids, "batch_size": batch_size}
+            ).execute()
+            deleted = response.data or 0
+            total += deleted
+            if deleted < batch_size:
+                break
+    except Exception as e:
+        if "delete_document_chunks_batch" not in str(e):
+            raise
+        print(f"Warning: delete_document_chunks_batch not available, relying on CASCADE: {e}")
+        print("Run ADD_BULK_DELETE.sql in Supabase to enable batched chunk deletes.")
+        database._batched_chunk_delete_available = False
+
+    return total
+
+
+async def load_dashboard(
+    user_id: str,
+    query_embedding: Optional[Vector] = None,
+    client: Optional['AsyncClient'] = None
+) -> Dict:
+    """
+    Loads the document filenames, stats and (optionally) search results concurrently
+    Neither query fetches document text - the document browser pages through
+    documents itself (database.get_document_page)
+
+    Args:
+        user_id: The user ID
+        query_embedding: If given, a semantic search runs alongside the other queries
+        client: Async client to use (defaults to the current session's)
+
+    Returns:
+        {"filenames": [...], "stats": {...}, "search_results": [...] or None}
+    """
+    supabase = client or await get_authenticated_async_client()
+
+    tasks = [
+        get_document_filenames(user_id, client=supabase),
+        get_document_stats(user_id, client=supabase)
+    ]
+    if query_embedding is not None:
+        tasks.append(search_documents_semantic(query_embedding, client=supabase))
+
+    results = await asyncio.gather(*tasks)
+
+    return {
+        "filenames": results[0],
+        "stats": results[1],
+        "search_results": results[2] if query_embedding is not None else None
+    }
+
+
+def get_dashboard_data(user_id: str, access_token: Optional[str] = None) -> Dict:
+    """
+    Returns the document filenames and stats for the sidebar and upload tab (blocking)
+    Reruns are served from memory until a document is saved or deleted
+    (database.get_cached_user_data)
+
+    Args:
+        user_id: The user ID
+        access_token: The user's access token. If None, it's read from the Streamlit
+                      session (only works on the script thread)
+
+    Returns:
+        {"filenames": [...], "stats": {...}}
+    """
+    return database.get_cached_user_data(
+        user_id,
+        "dashboard",
+        lambda: _fetch_dashboard_data(user_id, access_token),
+        should_cache=lambda dashboard: bool(dashboard["filenames"]),
+        client=database.create_user_client(access_token) if access_token else None
+    )
+
+
+def _fetch_dashboard_data(user_id: str, access_token: Optional[str]) -> Dict:
+    """
+    Loads the document filenames and stats concurrently (one round trip of wall time)
+    Falls back to the blocking database functions if the async client fails
+    """
+    async def load():
+        client = await get_authenticated_async_client(access_token)
+        return await load_dashboard(user_id, client=client)
+
+    try:
+        return run(load())
+    except Exception as e:
+        print(f"Async dashboard load failed, falling back to sync: {e}")
+        client = database.create_user_client(access_token) if access_token else None
+        return {
+            "filenames": database.get_document_filenames(user_id, client=client),
+            "stats": database.get_document_stats(user_id, client=client)
+        }
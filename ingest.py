@@ -5,16 +5,54 @@ WITH safety fixes for PDF extraction, JSON parsing, and metadata normalization
 """
 
 import os
+import io
+import codecs
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
 from openai import OpenAI
 from dotenv import load_dotenv
-from typing import Dict, Optional, List, Tuple
+from typing import Callable, Dict, Optional, List, Tuple, Union, Iterable, Iterator
 import json
 from datetime import datetime
 import re
+from vectors import Vector, from_openai
+from simhash import simhash
 # PyPDF2 imported lazily - only when processing PDFs
 
 load_dotenv()
 
+# Embedding model used for both document chunks and questions
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# Texts sent per embeddings request by create_embeddings
+EMBEDDING_BATCH_SIZE = 100
+
+# Uploads larger than this are spooled to a private temp file instead of being
+# kept in memory while they wait to be processed (see spool_to_disk)
+IN_MEMORY_UPLOAD_LIMIT = 25 * 1024 * 1024
+
+# Raw file contents: bytes, bytearray or a memoryview (e.g. UploadedFile.getbuffer())
+FileData = Union[bytes, bytearray, memoryview]
+
+# Looks up already saved documents similar to a SimHash fingerprint
+# (e.g. database.find_near_duplicates) - see process_document's find_duplicate
+DuplicateFinder = Callable[[int], List[Dict]]
+
+# Uploads up to this size go through process_document in one pass and keep their
+# full text in file_content; larger ones use process_document_streaming
+STREAMING_THRESHOLD_BYTES = 2 * 1024 * 1024
+
+# Streaming ingest (process_document_streaming) reads, chunks, embeds and saves a
+# window at a time, so memory use doesn't grow with the document:
+# bytes of a text file decoded per read
+TEXT_WINDOW_BYTES = 256 * 1024
+# text kept in documents.file_content for a streamed document (the preview and
+# metadata only need the start; the chunks hold all of it)
+STREAMED_CONTENT_CHARS = 20000
+# longest run of text without a blank line kept as one paragraph before it's cut
+MAX_PARAGRAPH_CHARS = 20000
+
 # Lazy initialization - only create client when needed
 _client = None
 
@@ -58,6 +96,28 @@ def extract_text_from_file(file_path: str) -> str:
             return ""
 
 
+def extract_text_from_bytes(data: FileData, filename: str) -> str:
+    """
+    Extracts text from a file's contents (TXT or PDF) without writing it to disk
+    The buffer is read in place - a memoryview is not copied first
+    
+    Args:
+        data: File contents
+        filename: Name of the file (its extension picks the parser)
+    
+    Returns:
+        Extracted text content
+    """
+    if filename.lower().endswith('.pdf'):
+        return _extract_pdf_text(_BufferReader(data))
+    
+    try:
+        return str(data, 'utf-8')
+    except Exception as e:
+        print(f"Error reading TXT file: {e}")
+        return ""
+
+
 def extract_text_from_pdf(file_path: str) -> str:
     """
     Extracts text from a PDF file with safety fixes
@@ -68,27 +128,191 @@ def extract_text_from_pdf(file_path: str) -> str:
     Returns:
         Extracted text
     """
+    try:
+        with open(file_path, 'rb') as f:
+            return _extract_pdf_text(f)
+    except Exception as e:
+        print(f"Error extracting PDF: {e}")
+        return ""
+
+
+def _extract_pdf_text(stream) -> str:
+    """Extracts text from a binary PDF stream (open file or _BufferReader)"""
     try:
         # Lazy import PyPDF2 - only load when actually processing PDFs
         import PyPDF2
-        with open(file_path, 'rb') as f:
-            pdf_reader = PyPDF2.PdfReader(f)
-            text = ""
-            for page in pdf_reader.pages:
-                # FIX: Handle None from extract_text()
-                page_text = page.extract_text()
-                text += (page_text or "") + "\n"
-            
-            # Check if this might be a scanned PDF
-            if len(text.strip()) < 50:
-                return "ERROR: This appears to be a scanned PDF. OCR required."
-            
-            return text
+        pdf_reader = PyPDF2.PdfReader(stream)
+        text = ""
+        for page in pdf_reader.pages:
+            # FIX: Handle None from extract_text()
+            page_text = page.extract_text()
+            text += (page_text or "") + "\n"
+        
+        # Check if this might be a scanned PDF
+        if len(text.strip()) < 50:
+            return "ERROR: This appears to be a scanned PDF. OCR required."
+        
+        return text
     except Exception as e:
         print(f"Error extracting PDF: {e}")
         return ""
 
 
+class _BufferReader(io.RawIOBase):
+    """
+    Read-only, seekable binary stream over an in-memory buffer
+    Unlike io.BytesIO(memoryview), it doesn't copy the whole buffer up front -
+    each read copies only the bytes asked for
+    """
+    
+    def __init__(self, data: FileData):
+        self._view = memoryview(data).cast('B')
+        self._pos = 0
+    
+    def readable(self) -> bool:
+        return True
+    
+    def seekable(self) -> bool:
+        return True
+    
+    def tell(self) -> int:
+        return self._pos
+    
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self._pos + offset
+        elif whence == io.SEEK_END:
+            position = len(self._view) + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if position < 0:
+            raise ValueError("Negative seek position")
+        self._pos = position
+        return position
+    
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else min(self._pos + size, len(self._view))
+        chunk = self._view[self._pos:end].tobytes() if end > self._pos else b""
+        self._pos = max(self._pos, end)
+        return chunk
+    
+    def readall(self) -> bytes:
+        return self.read()
+    
+    def readinto(self, buffer) -> int:
+        chunk = self._view[self._pos:self._pos + len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self._pos += len(chunk)
+        return len(chunk)
+
+
+@contextmanager
+def _open_source(source: Union[str, FileData]):
+    """Opens a path or in-memory file contents as a binary stream"""
+    if isinstance(source, str):
+        with open(source, 'rb') as f:
+            yield f
+    else:
+        yield _BufferReader(source)
+
+
+def iter_document_text(source: Union[str, FileData], filename: str) -> Iterator[str]:
+    """
+    Yields a document's text a piece at a time: a PDF page, or a window of a text file
+    Joined, the pieces are the text extract_text_from_file / extract_text_from_bytes return
+    
+    Args:
+        source: Path to the file, or its contents
+        filename: Name of the file (its extension picks the parser)
+    
+    Yields:
+        Pieces of text, in order
+    """
+    with _open_source(source) as stream:
+        if filename.lower().endswith('.pdf'):
+            # Lazy import PyPDF2 - only load when actually processing PDFs
+            import PyPDF2
+            for page in PyPDF2.PdfReader(stream).pages:
+                # FIX: Handle None from extract_text()
+                yield (page.extract_text() or "") + "\n"
+            return
+        
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        while True:
+            data = stream.read(TEXT_WINDOW_BYTES)
+            if not data:
+                break
+            text = decoder.decode(data)
+            if text:
+                yield text
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
+
+
+def _sample_document_text(source: Union[str, FileData], filename: str, head_chars: int, tail_chars: int) -> Tuple[str, str, bool]:
+    """
+    Reads the start and end of a document without reading the middle
+    
+    Returns:
+        (first head_chars characters, last tail_chars characters, whether the head is the whole text)
+    """
+    pieces = iter_document_text(source, filename)
+    head = ""
+    try:
+        for piece in pieces:
+            head += piece
+            if len(head) > head_chars:
+                break
+        else:
+            return head, head[-tail_chars:], True
+    finally:
+        pieces.close()
+    
+    with _open_source(source) as stream:
+        if filename.lower().endswith('.pdf'):
+            import PyPDF2
+            pages = PyPDF2.PdfReader(stream).pages
+            tail = ""
+            for number in range(len(pages) - 1, -1, -1):
+                tail = (pages[number].extract_text() or "") + "\n" + tail
+                if len(tail) >= tail_chars:
+                    break
+        else:
+            # UTF-8 is at most 4 bytes per character
+            stream.seek(0, io.SEEK_END)
+            stream.seek(max(0, stream.tell() - tail_chars * 4))
+            tail = stream.read().decode('utf-8', errors='ignore')
+    
+    return head[:head_chars], tail[-tail_chars:], False
+
+
+def spool_to_disk(data: FileData, filename: str) -> str:
+    """
+    Writes a large upload to its own temp file (for uploads over IN_MEMORY_UPLOAD_LIMIT)
+    Every call gets a new, uniquely named file readable only by this process's user,
+    so concurrent sessions uploading the same filename never touch each other's files.
+    The caller deletes the file when done.
+    
+    Args:
+        data: File contents
+        filename: Name of the file (its extension is kept, it picks the parser)
+    
+    Returns:
+        Path to the temp file
+    """
+    fd, path = tempfile.mkstemp(prefix="upload-", suffix=Path(filename).suffix)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+    except Exception:
+        os.unlink(path)
+        raise
+    return path
+
+
 def normalize_document_type(doc_type: str) -> str:
     """
     Normalizes document type to consistent format
@@ -287,26 +511,44 @@ def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[Dict
     if not text or len(text.strip()) == 0:
         return []
     
-    # Split by paragraphs first (better semantic boundaries)
-    paragraphs = text.split('\n\n')
+    return list(iter_chunks([text], chunk_size=chunk_size, overlap=overlap))
+
+
+def iter_chunks(pieces: Iterable[str], chunk_size: int = 500, overlap: int = 50) -> Iterator[Dict[str, any]]:
+    """
+    Incremental chunk_text: takes the text a piece at a time (e.g. a PDF page) and
+    yields the chunks chunk_text would produce for the joined text, holding only
+    the current paragraph and chunk in memory
     
-    chunks = []
+    Args:
+        pieces: The document text, in order, in any number of pieces
+        chunk_size: Target size in characters (roughly 300-500 tokens)
+        overlap: Number of characters to overlap between chunks
+    
+    Yields:
+        Chunk dictionaries with text and metadata
+    """
     current_chunk = ""
     chunk_index = 0
+    chunk_count = 0
     
-    for para in paragraphs:
+    # Split by paragraphs first (better semantic boundaries)
+    for para in _iter_paragraphs(pieces):
         para = para.strip()
         if not para:
             continue
         
         # If adding this paragraph would exceed chunk size, save current chunk
         if current_chunk and len(current_chunk) + len(para) + 2 > chunk_size:
-            chunks.append({
+            for chunk in _split_long_chunk({
                 "text": current_chunk.strip(),
-                "chunk_index": chunk_index,
-                "start_char": len(chunks) * (chunk_size - overlap) if chunks else 0
-            })
-            chunk_index += 1
+                "start_char": chunk_count * (chunk_size - overlap)
+            }, chunk_size):
+                # Numbered here - a split chunk yields several, and indexes must stay unique
+                chunk["chunk_index"] = chunk_index
+                chunk_index += 1
+                yield chunk
+            chunk_count += 1
             
             # Start new chunk with overlap (last part of previous chunk)
             if overlap > 0 and current_chunk:
@@ -323,47 +565,65 @@ def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[Dict
     
     # Add the last chunk
     if current_chunk.strip():
-        chunks.append({
+        for chunk in _split_long_chunk({
             "text": current_chunk.strip(),
-            "chunk_index": chunk_index,
-            "start_char": len(chunks) * (chunk_size - overlap) if chunks else 0
-        })
-    
-    # If we have very long paragraphs, split them further
-    final_chunks = []
-    for chunk in chunks:
-        if len(chunk["text"]) > chunk_size * 1.5:
-            # Split long chunks by sentences
-            sentences = re.split(r'(?<=[.!?])\s+', chunk["text"])
-            temp_chunk = ""
-            temp_index = chunk["chunk_index"]
-            
-            for sentence in sentences:
-                if len(temp_chunk) + len(sentence) + 1 > chunk_size:
-                    if temp_chunk:
-                        final_chunks.append({
-                            "text": temp_chunk.strip(),
-                            "chunk_index": temp_index,
-                            "start_char": chunk["start_char"]
-                        })
-                        temp_index += 1
-                    temp_chunk = sentence
-                else:
-                    temp_chunk += " " + sentence if temp_chunk else sentence
-            
-            if temp_chunk.strip():
-                final_chunks.append({
+            "start_char": chunk_count * (chunk_size - overlap)
+        }, chunk_size):
+            chunk["chunk_index"] = chunk_index
+            chunk_index += 1
+            yield chunk
+
+
+def _iter_paragraphs(pieces: Iterable[str]) -> Iterator[str]:
+    """
+    Yields the paragraphs (text between blank lines) of text that arrives in pieces
+    A stretch longer than MAX_PARAGRAPH_CHARS without a blank line is cut there,
+    so a document with no paragraph breaks doesn't end up in memory whole
+    """
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        paragraphs = buffer.split('\n\n')
+        buffer = paragraphs.pop()
+        yield from paragraphs
+        if len(buffer) > MAX_PARAGRAPH_CHARS:
+            yield buffer
+            buffer = ""
+    yield buffer
+
+
+def _split_long_chunk(chunk: Dict, chunk_size: int) -> Iterator[Dict]:
+    """
+    Yields a chunk as is, or split by sentences if it's a very long paragraph
+    (without chunk_index - iter_chunks numbers the pieces)
+    """
+    if len(chunk["text"]) <= chunk_size * 1.5:
+        yield chunk
+        return
+    
+    # Split long chunks by sentences
+    sentences = re.split(r'(?<=[.!?])\s+', chunk["text"])
+    temp_chunk = ""
+    
+    for sentence in sentences:
+        if len(temp_chunk) + len(sentence) + 1 > chunk_size:
+            if temp_chunk:
+                yield {
                     "text": temp_chunk.strip(),
-                    "chunk_index": temp_index,
                     "start_char": chunk["start_char"]
-                })
+                }
+            temp_chunk = sentence
         else:
-            final_chunks.append(chunk)
+            temp_chunk += " " + sentence if temp_chunk else sentence
     
-    return final_chunks
+    if temp_chunk.strip():
+        yield {
+            "text": temp_chunk.strip(),
+            "start_char": chunk["start_char"]
+        }
 
 
-def create_embedding(text: str) -> Optional[List[float]]:
+def create_embedding(text: str) -> Optional[Vector]:
     """
     Creates a vector embedding of the text using OpenAI
     This converts text into 1536 numbers that represent its meaning
@@ -372,7 +632,7 @@ def create_embedding(text: str) -> Optional[List[float]]:
         text: Text to embed
     
     Returns:
-        List of 1536 floats (the embedding vector) or None on error
+        float32 array of 1536 numbers (the embedding vector) or None on error
     """
     try:
         # Truncate text if too long (OpenAI has token limits)
@@ -382,39 +642,72 @@ def create_embedding(text: str) -> Optional[List[float]]:
         
         client = get_openai_client()
         response = client.embeddings.create(
-            model="text-embedding-3-small",
-            input=text
+            model=EMBEDDING_MODEL,
+            input=text,
+            encoding_format="base64"
         )
         
-        embedding = response.data[0].embedding
-        
-        # FIX: Verify dimension
-        if len(embedding) != 1536:
-            print(f"WARNING: Embedding dimension is {len(embedding)}, expected 1536")
-            return None
-        
-        return embedding
+        # FIX: Verify dimension (from_openai returns None if it's wrong)
+        return from_openai(response.data[0].embedding)
         
     except Exception as e:
         print(f"Error creating embedding: {e}")
         return None
 
 
-def process_document(file_path: str, filename: str) -> Dict:
+def create_embeddings(texts: List[str]) -> List[Optional[Vector]]:
+    """
+    Creates embeddings for several texts with one OpenAI request per batch
+    Vectors are requested base64-encoded and decoded straight into float32 arrays
+    
+    Args:
+        texts: Texts to embed
+    
+    Returns:
+        One float32 embedding per text, in the same order (None where it failed)
+    """
+    embeddings: List[Optional[Vector]] = [None] * len(texts)
+    
+    for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+        batch = [text[:8000] for text in texts[start:start + EMBEDDING_BATCH_SIZE]]
+        try:
+            client = get_openai_client()
+            response = client.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=batch,
+                encoding_format="base64"
+            )
+            for item in response.data:
+                embeddings[start + item.index] = from_openai(item.embedding)
+        except Exception as e:
+            print(f"Error creating embeddings: {e}")
+    
+    return embeddings
+
+
+def process_document(source: Union[str, FileData], filename: str, find_duplicate: Optional[DuplicateFinder] = None) -> Dict:
     """
     Full pipeline: Extract text → Get metadata → Chunk text → Create embeddings for chunks
     
     Args:
-        file_path: Path to the document file
+        source: Path to the document file, or its contents (bytes or a memoryview,
+                read in place without a temp file)
         filename: Name of the file
+        find_duplicate: Called with the document's SimHash before any OpenAI call;
+                        if it returns matches, processing stops there
     
     Returns:
-        Dictionary with all extracted data, chunks, and chunk embeddings
+        Dictionary with all extracted data, chunks, and chunk embeddings, plus the
+        document's "simhash". For a near-duplicate, only "filename", "simhash" and
+        "duplicate_of" (the closest match).
     """
     print(f"Processing document: {filename}")
     
     # Step 1: Extract text
-    text = extract_text_from_file(file_path)
+    if isinstance(source, str):
+        text = extract_text_from_file(source)
+    else:
+        text = extract_text_from_bytes(source, filename)
     if not text:
         return {"error": "Could not extract text from file"}
     
@@ -423,6 +716,11 @@ def process_document(file_path: str, filename: str) -> Dict:
     
     print(f"  [OK] Extracted {len(text)} characters")
     
+    fingerprint = simhash([text])
+    duplicate = _find_duplicate(find_duplicate, fingerprint, filename)
+    if duplicate:
+        return {"filename": filename, "simhash": fingerprint, "duplicate_of": duplicate}
+    
     # Step 2: Extract metadata using AI
     metadata = extract_metadata_with_ai(text, filename)
     if metadata.get("property_name") or metadata.get("document_type") or metadata.get("vendor"):
@@ -434,20 +732,8 @@ def process_document(file_path: str, filename: str) -> Dict:
     chunks = chunk_text(text, chunk_size=500, overlap=50)
     print(f"  [OK] Created {len(chunks)} chunks")
     
-    # Step 4: Create embeddings for each chunk
-    chunk_embeddings = []
-    for i, chunk in enumerate(chunks):
-        embedding = create_embedding(chunk["text"])
-        if embedding:
-            chunk_embeddings.append({
-                "chunk_index": chunk["chunk_index"],
-                "text": chunk["text"],
-                "embedding": embedding,
-                "start_char": chunk.get("start_char", 0)
-            })
-            print(f"  [OK] Created embedding for chunk {i+1}/{len(chunks)}")
-        else:
-            print(f"  [WARNING] Failed to create embedding for chunk {i+1}")
+    # Step 4: Create embeddings for the chunks (one request per batch)
+    chunk_embeddings = [chunk for batch in iter_embedded_chunks(chunks) for chunk in batch]
     
     if not chunk_embeddings:
         print(f"  [WARNING] No embeddings created, document will not be searchable")
@@ -461,5 +747,125 @@ def process_document(file_path: str, filename: str) -> Dict:
         "vendor": metadata.get("vendor"),
         "amount": metadata.get("amount"),
         "document_date": metadata.get("document_date"),
+        "simhash": fingerprint,
         "chunks": chunk_embeddings  # List of chunks with embeddings
     }
+
+
+def _find_duplicate(find_duplicate: Optional[DuplicateFinder], fingerprint: int, filename: str) -> Optional[Dict]:
+    """The closest already saved near-duplicate, if there's a finder and it finds one"""
+    if find_duplicate is None:
+        return None
+    matches = find_duplicate(fingerprint)
+    if not matches:
+        return None
+    print(f"  [SKIP] Near-duplicate of {matches[0].get('filename')} ({matches[0].get('distance')} bits apart)")
+    return matches[0]
+
+
+def process_document_streaming(source: Union[str, FileData], filename: str, find_duplicate: Optional[DuplicateFinder] = None) -> Dict:
+    """
+    Bounded-memory version of process_document for documents of any size
+    Metadata comes from the start and end of the document (the same excerpt
+    extract_metadata_with_ai uses), and the chunks are produced lazily: iterating
+    "chunk_batches" reads, chunks and embeds the document one batch at a time,
+    so the caller can save each batch before the next one is made.
+    The SimHash takes one extra pass over the text (no API calls) when the
+    document doesn't fit in the sampled start.
+    
+    Args:
+        source: Path to the document file, or its contents (must stay available
+                until chunk_batches has been consumed)
+        filename: Name of the file
+        find_duplicate: As for process_document
+    
+    Returns:
+        Dictionary like process_document's, except file_content holds at most
+        STREAMED_CONTENT_CHARS characters and "chunk_batches" (an iterator of lists
+        of chunks with embeddings) replaces "chunks"
+    """
+    print(f"Processing document (streaming): {filename}")
+    
+    # Step 1: Read the start and end of the text
+    try:
+        head, tail, complete = _sample_document_text(source, filename, max(STREAMED_CONTENT_CHARS, 3000), 1000)
+    except Exception as e:
+        print(f"Error extracting text: {e}")
+        return {"error": "Could not extract text from file"}
+    
+    if not head.strip():
+        return {"error": "Could not extract text from file"}
+    
+    # Check if this might be a scanned PDF
+    if complete and filename.lower().endswith('.pdf') and len(head.strip()) < 50:
+        return {"error": "ERROR: This appears to be a scanned PDF. OCR required."}
+    
+    print(f"  [OK] Read {len(head)} characters{'' if complete else ' from the start (and the end)'}")
+    
+    fingerprint = simhash([head] if complete else iter_document_text(source, filename))
+    duplicate = _find_duplicate(find_duplicate, fingerprint, filename)
+    if duplicate:
+        return {"filename": filename, "simhash": fingerprint, "duplicate_of": duplicate}
+    
+    # Step 2: Extract metadata using AI
+    metadata = extract_metadata_with_ai(head if complete else head[:2000] + "\n...\n" + tail, filename)
+    if metadata.get("property_name") or metadata.get("document_type") or metadata.get("vendor"):
+        print(f"  [OK] Extracted metadata: {metadata.get('document_type', 'unknown')}")
+    else:
+        print("  [WARNING] Metadata extraction returned empty values - check OpenAI API key and logs")
+    
+    # Steps 3 and 4 run as the caller consumes chunk_batches
+    chunks = iter_chunks(iter_document_text(source, filename), chunk_size=500, overlap=50)
+    
+    return {
+        "filename": filename,
+        "file_content": head[:STREAMED_CONTENT_CHARS],
+        "property_name": metadata.get("property_name"),
+        "document_type": metadata.get("document_type"),
+        "vendor": metadata.get("vendor"),
+        "amount": metadata.get("amount"),
+        "document_date": metadata.get("document_date"),
+        "simhash": fingerprint,
+        "chunk_batches": iter_embedded_chunks(chunks)
+    }
+
+
+def iter_embedded_chunks(chunks: Iterable[Dict], batch_size: int = EMBEDDING_BATCH_SIZE) -> Iterator[List[Dict]]:
+    """
+    Embeds chunks a batch at a time (one OpenAI request per batch)
+    
+    Args:
+        chunks: Chunk dictionaries (from iter_chunks)
+        batch_size: Chunks per batch
+    
+    Yields:
+        Lists of chunks with embeddings (chunks whose embedding failed are left out)
+    """
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) == batch_size:
+            yield _embed_chunks(batch)
+            batch = []
+    if batch:
+        yield _embed_chunks(batch)
+
+
+def _embed_chunks(chunks: List[Dict]) -> List[Dict]:
+    """Adds embeddings to a batch of chunks"""
+    embeddings = create_embeddings([chunk["text"] for chunk in chunks])
+    
+    embedded = []
+    for chunk, embedding in zip(chunks, embeddings):
+        if embedding is not None:
+            embedded.append({
+                "chunk_index": chunk["chunk_index"],
+                "text": chunk["text"],
+                "embedding": embedding,
+                "start_char": chunk.get("start_char", 0)
+            })
+        else:
+            print(f"  [WARNING] Failed to create embedding for chunk {chunk['chunk_index']}")
+    
+    print(f"  [OK] Created embeddings for {len(embedded)}/{len(chunks)} chunks")
+    return embedded
@@ -0,0 +1,374 @@
+"""
+jobs.py
+Background document ingestion
+Uploaded files are queued and processed by worker threads instead of the Streamlit
+script. Each file's status is kept in the ingest_jobs table (ADD_INGEST_JOBS.sql),
+so the upload tab can show progress across reruns and browser refreshes, and a
+file that was already processed is never processed again.
+"""
+
+import hashlib
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+import database
+import ingest
+
+# Files processed at the same time (each makes its own OpenAI and Supabase calls)
+INGEST_WORKERS = 2
+
+# How many of a user's most recent jobs the upload tab lists
+RECENT_JOBS = 50
+
+_queue: "queue.Queue[Dict]" = queue.Queue()
+_workers: List[threading.Thread] = []
+_lock = threading.Lock()
+
+# Jobs started in this process, by job id (kept current by the workers)
+# These are the live view; the table is the record that outlives the process
+_live_jobs: Dict[str, Dict] = {}
+
+# Flipped off if the ingest_jobs table hasn't been created yet (ADD_INGEST_JOBS.sql)
+# Jobs still run, but their status only lives in this process
+_jobs_table_available = True
+
+
+def content_hash(data: ingest.FileData) -> str:
+    """SHA-256 of a file's bytes - identifies the same upload under any filename"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _disable_jobs_table(error: Exception) -> None:
+    """Remembers that the ingest_jobs table is missing"""
+    global _jobs_table_available
+    if _jobs_table_available:
+        print(f"Warning: ingest_jobs table not available, job status won't survive restarts: {error}")
+        print("Run ADD_INGEST_JOBS.sql in Supabase to persist upload progress.")
+    _jobs_table_available = False
+
+
+def _fetch_job_rows(client, user_id: str) -> List[Dict]:
+    """The user's most recent job rows from the table (empty if it doesn't exist)"""
+    if not _jobs_table_available:
+        return []
+    try:
+        response = client.table("ingest_jobs")\
+            .select("id,filename,content_hash,status,stage,error,document_id,created_at,updated_at")\
+            .eq("user_id", user_id)\
+            .order("created_at", desc=True)\
+            .limit(RECENT_JOBS)\
+            .execute()
+        return response.data or []
+    except Exception as e:
+        _disable_jobs_table(e)
+        return []
+
+
+def _record_job(client, job: Dict) -> Dict:
+    """
+    Creates (or resets, for a file that failed before) the job's row
+    Returns the job with its id set
+    """
+    if _jobs_table_available:
+        try:
+            response = client.table("ingest_jobs").upsert(
+                {
+                    "user_id": job["user_id"],
+                    "filename": job["filename"],
+                    "content_hash": job["content_hash"],
+                    "status": "queued",
+                    "stage": None,
+                    "error": None,
+                    "document_id": None,
+                    "updated_at": _now()
+                },
+                on_conflict="user_id,content_hash"
+            ).execute()
+            if response.data:
+                return {**job, "id": response.data[0]["id"], "created_at": response.data[0].get("created_at")}
+        except Exception as e:
+            _disable_jobs_table(e)
+
+    return {**job, "id": str(uuid.uuid4()), "created_at": _now()}
+
+
+def _update_job(job: Dict, **changes) -> None:
+    """Updates a live job's status in memory and (best effort) in the table"""
+    changes["updated_at"] = _now()
+    with _lock:
+        _live_jobs[job["id"]].update(changes)
+
+    if _jobs_table_available:
+        try:
+            job["client"].table("ingest_jobs").update(changes).eq("id", job["id"]).execute()
+        except Exception as e:
+            print(f"Warning: could not update ingest job {job['id']}: {e}")
+
+
+def list_jobs(user_id: str, client=None) -> List[Dict]:
+    """
+    Returns the user's recent upload jobs, newest first
+
+    Args:
+        user_id: The user ID
+        client: Authenticated Supabase client (defaults to the current session's)
+
+    Returns:
+        List of {"id", "filename", "status", "stage", "error", "document_id", ...}
+        Status is "queued", "processing", "done" or "error". Jobs the table says
+        are unfinished but that no worker in this process is running (the server
+        restarted) are reported as errors so the file can be uploaded again.
+    """
+    from auth import get_authenticated_client
+    rows = _fetch_job_rows(client or get_authenticated_client(), user_id)
+
+    with _lock:
+        live = {
+            job_id: {key: value for key, value in job.items() if key not in ("client", "data", "path")}
+            for job_id, job in _live_jobs.items()
+            if job["user_id"] == user_id
+        }
+
+    jobs = []
+    for row in rows:
+        if row["id"] in live:
+            jobs.append(live.pop(row["id"]))
+        elif row["status"] in ("queued", "processing"):
+            jobs.append({**row, "status": "error", "error": "Interrupted - please upload the file again"})
+        else:
+            jobs.append(row)
+
+    # Live jobs the table doesn't know about (table missing or not yet visible)
+    jobs.extend(live.values())
+    jobs.sort(key=lambda job: job.get("created_at") or "", reverse=True)
+    return jobs
+
+
+def has_active_jobs(user_id: str) -> bool:
+    """Whether any of the user's files are still queued or processing in this process"""
+    with _lock:
+        return any(
+            job["user_id"] == user_id and job["status"] in ("queued", "processing")
+            for job in _live_jobs.values()
+        )
+
+
+def enqueue_files(
+    user_id: str,
+    access_token: str,
+    files: List[Tuple[str, ingest.FileData]],
+    skip_near_duplicates: bool = True,
+    refresh_token: Optional[str] = None
+) -> Dict[str, List[str]]:
+    """
+    Queues uploaded files for background processing
+
+    Args:
+        user_id: The user who owns the files
+        access_token: The user's access token (read it on the Streamlit script thread)
+        files: (filename, file contents) pairs - bytes or a memoryview from
+               UploadedFile.getbuffer(); files over ingest.IN_MEMORY_UPLOAD_LIMIT
+               are spooled to a private temp file until a worker gets to them
+        skip_near_duplicates: Stop before any OpenAI call when a file's text is a
+                              near-duplicate (SimHash) of a document already saved
+        refresh_token: The session's refresh token - lets the workers renew the
+                       access token when a long batch outlives it
+
+    Returns:
+        {"queued": [filenames], "skipped": [filenames already processed or in progress]}
+    """
+    client = database.create_user_client(access_token)
+    # Shared by the batch's jobs, so the token is refreshed once for all of them
+    session = {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "client": client,
+        "lock": threading.Lock()
+    }
+    known = {row["content_hash"]: row for row in _fetch_job_rows(client, user_id)}
+    with _lock:
+        _forget_finished_jobs(user_id)
+        in_progress = {
+            job["content_hash"] for job in _live_jobs.values()
+            if job["user_id"] == user_id and job["status"] in ("queued", "processing")
+        }
+
+    queued, skipped = [], []
+    for filename, data in files:
+        digest = content_hash(data)
+        previous = known.get(digest)
+        # A finished job whose document was deleted since (document_id set to NULL) can run again
+        if digest in in_progress or (previous and previous["status"] == "done" and previous.get("document_id")):
+            skipped.append(filename)
+            continue
+
+        job = _record_job(client, {
+            "user_id": user_id,
+            "filename": filename,
+            "content_hash": digest,
+            "status": "queued",
+            "stage": None,
+            "error": None,
+            "document_id": None
+        })
+        with _lock:
+            _live_jobs[job["id"]] = job
+
+        in_progress.add(digest)
+        _queue.put({
+            **job,
+            "client": client,
+            "session": session,
+            "skip_near_duplicates": skip_near_duplicates,
+            **_job_source(data, filename)
+        })
+        queued.append(filename)
+
+    _ensure_workers()
+    return {"queued": queued, "skipped": skipped}
+
+
+def _job_source(data: ingest.FileData, filename: str) -> Dict:
+    """What a queued job processes: the upload buffer itself, or a temp file for large uploads"""
+    if len(data) > ingest.IN_MEMORY_UPLOAD_LIMIT:
+        try:
+            return {"path": ingest.spool_to_disk(data, filename)}
+        except OSError as e:
+            print(f"Warning: could not spool {filename} to disk, keeping it in memory: {e}")
+    return {"data": data}
+
+
+def _refresh_job_client(job: Dict) -> None:
+    """Points job["client"] at a fresh access token if the current one is about to expire"""
+    session = job.get("session")
+    if not session or not session["refresh_token"]:
+        return
+
+    import auth
+    with session["lock"]:
+        # Long batches outlive the token they were queued with
+        if (auth._token_expiry(session["access_token"]) or 0) - time.time() < auth.REFRESH_MARGIN:
+            tokens = auth.refresh_session_tokens(session["refresh_token"])
+            if tokens and tokens[0] != session["access_token"]:
+                session["access_token"], session["refresh_token"] = tokens
+                session["client"] = database.create_user_client(tokens[0])
+        job["client"] = session["client"]
+
+
+def _forget_finished_jobs(user_id: str) -> None:
+    """Keeps only the user's RECENT_JOBS newest finished jobs in memory (call with _lock held)"""
+    finished = sorted(
+        (job for job in _live_jobs.values() if job["user_id"] == user_id and job["status"] in ("done", "error")),
+        key=lambda job: job.get("created_at") or "",
+        reverse=True
+    )
+    for job in finished[RECENT_JOBS:]:
+        _live_jobs.pop(job["id"], None)
+
+
+def _ensure_workers() -> None:
+    """Starts the worker threads the first time they're needed"""
+    with _lock:
+        while len(_workers) < INGEST_WORKERS:
+            worker = threading.Thread(target=_work, name=f"ingest-worker-{len(_workers)}", daemon=True)
+            worker.start()
+            _workers.append(worker)
+
+
+def _work() -> None:
+    """Worker thread loop: processes queued jobs one at a time"""
+    while True:
+        job = _queue.get()
+        try:
+            _process_job(job)
+        except Exception as e:
+            print(f"Error processing {job['filename']}: {e}")
+            _update_job(job, status="error", stage=None, error=str(e))
+        finally:
+            _queue.task_done()
+
+
+def _process_job(job: Dict) -> None:
+    """
+    Extracts, embeds and saves one uploaded file
+    Files over ingest.STREAMING_THRESHOLD_BYTES use streaming ingestion: the document
+    row is saved first, then its chunks are embedded and saved a batch at a time, so
+    memory use doesn't depend on file size. Smaller files are processed in one pass
+    and keep their full text.
+    """
+    _refresh_job_client(job)
+    _update_job(job, status="processing", stage="reading the document and extracting metadata")
+    temp_path = job.get("path")
+    find_duplicate = None
+    if job.get("skip_near_duplicates"):
+        find_duplicate = lambda fingerprint: database.find_near_duplicates(fingerprint, client=job["client"])
+    try:
+        size = os.path.getsize(temp_path) if temp_path else len(job["data"])
+        if size > ingest.STREAMING_THRESHOLD_BYTES:
+            result = ingest.process_document_streaming(temp_path or job["data"], job["filename"], find_duplicate)
+        else:
+            result = ingest.process_document(temp_path or job["data"], job["filename"], find_duplicate)
+            chunks = result.pop("chunks", [])
+            result["chunk_batches"] = [
+                chunks[start:start + ingest.EMBEDDING_BATCH_SIZE]
+                for start in range(0, len(chunks), ingest.EMBEDDING_BATCH_SIZE)
+            ]
+
+        if "error" in result:
+            _update_job(job, status="error", stage=None, error=result["error"])
+            return
+
+        if result.get("duplicate_of"):
+            # No document_id, so the file can be uploaded again with skipping turned off
+            _update_job(job, status="done", stage=f"near-duplicate of {result['duplicate_of']['filename']}, not processed")
+            return
+
+        if not result.get("property_name") and not result.get("document_type") and not result.get("vendor"):
+            _update_job(job, status="error", stage=None, error="Metadata extraction may have failed. Check logs for details.")
+            return
+
+        _update_job(job, stage="saving")
+        saved_doc = database.save_document(
+            user_id=job["user_id"],
+            filename=result["filename"],
+            file_content=result["file_content"],
+            property_name=result["property_name"],
+            document_type=result["document_type"],
+            vendor=result["vendor"],
+            amount=result["amount"],
+            document_date=result["document_date"],
+            client=job["client"],
+            simhash=result["simhash"]
+        )
+        if not saved_doc:
+            _update_job(job, status="error", stage=None, error="Failed to save the document")
+            return
+
+        saved = 0
+        try:
+            for batch in result["chunk_batches"]:
+                _refresh_job_client(job)
+                saved += database.save_document_chunks(saved_doc["id"], job["user_id"], batch, client=job["client"])
+                _update_job(job, stage=f"creating embeddings ({saved} chunks saved)")
+        except Exception:
+            # Don't leave a document that's only partly searchable
+            database.delete_document(saved_doc["id"], job["user_id"], client=job["client"])
+            raise
+
+        if not saved:
+            print(f"  [WARNING] No embeddings created, {job['filename']} will not be searchable")
+        _update_job(job, status="done", stage=None, document_id=saved_doc["id"])
+    finally:
+        if temp_path:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
@@ -0,0 +1,105 @@
+"""
+migrate_chunks.py
+Copies existing document_chunks rows into the partitioned table in small batches
+(run PARTITION_CHUNKS_BY_USER.sql first - see PARTITIONING_MIGRATION.md)
+
+Usage:
+    python migrate_chunks.py                      # backfill, resuming from the last checkpoint
+    python migrate_chunks.py --finish             # swap tables once the backfill is done
+    python migrate_chunks.py --promote <user_id>  # give a large tenant its own partition
+"""
+
+import argparse
+import os
+import time
+from typing import Optional
+from database import get_service_client
+
+CHECKPOINT_FILE = ".chunk_migration_checkpoint"
+
+
+def _read_checkpoint() -> Optional[str]:
+    """Returns the last copied chunk id, or None to start from the beginning"""
+    if not os.path.exists(CHECKPOINT_FILE):
+        return None
+    with open(CHECKPOINT_FILE, "r") as f:
+        return f.read().strip() or None
+
+
+def _write_checkpoint(last_id: str):
+    """Saves progress so an interrupted backfill can resume where it stopped"""
+    with open(CHECKPOINT_FILE, "w") as f:
+        f.write(last_id)
+
+
+def backfill(batch_size: int = 1000, pause: float = 0.2) -> int:
+    """
+    Copies rows batch by batch until the partitioned table has caught up
+    New inserts, updates and deletes are mirrored by a trigger, so the app can keep running
+
+    Args:
+        batch_size: Rows copied per call (each call is its own short transaction)
+        pause: Seconds to sleep between batches to leave room for live traffic
+
+    Returns:
+        Number of rows copied
+    """
+    supabase = get_service_client()
+    last_id = _read_checkpoint()
+    total_copied = 0
+
+    if last_id:
+        print(f"Resuming after chunk {last_id}")
+
+    while True:
+        response = supabase.rpc(
+            "backfill_chunk_partitions",
+            {"after_id": last_id, "batch_size": batch_size}
+        ).execute()
+
+        row = response.data[0] if response.data else {}
+        if not row.get("last_id"):
+            break
+
+        last_id = row["last_id"]
+        total_copied += row.get("copied", 0)
+        _write_checkpoint(last_id)
+        print(f"  [OK] Scanned {row.get('scanned', 0)}, copied {row.get('copied', 0)} (total {total_copied})")
+
+        time.sleep(pause)
+
+    print(f"Backfill complete: {total_copied} chunks copied")
+    return total_copied
+
+
+def finish():
+    """Swaps the partitioned table in as document_chunks"""
+    supabase = get_service_client()
+    response = supabase.rpc("finish_chunk_partition_migration", {}).execute()
+    print(response.data)
+
+    if os.path.exists(CHECKPOINT_FILE):
+        os.remove(CHECKPOINT_FILE)
+
+
+def promote(user_id: str):
+    """Moves one tenant's chunks into a dedicated partition"""
+    supabase = get_service_client()
+    response = supabase.rpc("promote_tenant_chunk_partition", {"tenant": user_id}).execute()
+    print(response.data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate document_chunks to per-user partitions")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows copied per batch")
+    parser.add_argument("--pause", type=float, default=0.2, help="Seconds between batches")
+    parser.add_argument("--finish", action="store_true", help="Swap tables after the backfill")
+    parser.add_argument("--promote", metavar="USER_ID", help="Give this user a dedicated partition")
+    args = parser.parse_args()
+
+    if args.promote:
+        promote(args.promote)
+    elif args.finish:
+        finish()
+    else:
+        backfill(batch_size=args.batch_size, pause=args.pause)
@@ -5,14 +5,53 @@ WITH improved context handling and "I don't know" logic
 """
 
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 from dotenv import load_dotenv
-from typing import List, Dict
-from database import search_documents_semantic
-from ingest import create_embedding
+from typing import List, Dict, Optional, Tuple
+from database import (
+    search_documents_semantic,
+    SearchUnavailableError,
+    get_corpus_version,
+    get_document_facets,
+    aggregate_documents,
+    SEARCH_FILTER_PARAMS
+)
+from ingest import create_embedding, create_embeddings, EMBEDDING_MODEL
+from cache import TTLCache
+from vectors import Vector
+from context_builder import pack_context
+from query_filters import detect_intent, extract_filters
+from rerank import rerank
 
 load_dotenv()
 
+# Question embeddings, shared by every Streamlit session in this process
+# Keyed by (model, enhanced question text) so repeat questions skip the API call
+_query_embedding_cache = TTLCache(maxsize=1024, ttl=24 * 3600)
+
+# Finished answers keyed by (user, normalized question, corpus version)
+# Saving or deleting a document bumps the corpus version, so stale answers are never served
+_answer_cache = TTLCache(maxsize=512, ttl=6 * 3600)
+
+# Each user's known properties, vendors and document types, keyed by (user, corpus version)
+# Used to recognise names in questions without a database round trip per question
+_lexicon_cache = TTLCache(maxsize=256, ttl=3600)
+
+# Chunks fetched by vector search, and how many the local reranker keeps
+SEARCH_CANDIDATES = 20
+RERANK_TOP_K = 5
+
+# Chunks either side of each match fetched with the search, for wider context
+NEIGHBOR_WINDOW = 1
+
+# Below this best similarity the search results aren't worth answering from
+MIN_TOP_SIMILARITY = 0.4
+
+# Maximum estimated prompt tokens spent on retrieved document text
+CONTEXT_TOKEN_BUDGET = 1500
+
 # Lazy initialization - only create client when needed
 _client = None
 
@@ -24,6 +63,125 @@ def get_openai_client():
     return _client
 
 
+def get_query_embedding(text: str) -> Optional[Vector]:
+    """
+    Returns the embedding for a question, using the shared LRU+TTL cache
+    
+    Args:
+        text: The (enhanced) question text that gets embedded
+    
+    Returns:
+        Embedding vector or None on error (errors are not cached)
+    """
+    key = (EMBEDDING_MODEL, text)
+    embedding = _query_embedding_cache.get(key)
+    if embedding is not None:
+        return embedding
+    
+    embedding = create_embedding(text)
+    if embedding is not None:
+        _query_embedding_cache.set(key, embedding)
+    return embedding
+
+
+def get_query_embeddings(texts: List[str]) -> List[Optional[Vector]]:
+    """
+    Batch version of get_query_embedding - texts not in the cache are embedded
+    together in one API request
+    
+    Args:
+        texts: The (enhanced) question texts
+    
+    Returns:
+        One embedding per text, in order (None where embedding failed)
+    """
+    embeddings = [_query_embedding_cache.get((EMBEDDING_MODEL, text)) for text in texts]
+    missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+    
+    if missing:
+        created = dict(zip(missing, create_embeddings(missing)))
+        for text, embedding in created.items():
+            if embedding is not None:
+                _query_embedding_cache.set((EMBEDDING_MODEL, text), embedding)
+        embeddings = [created.get(text) if embedding is None else embedding for text, embedding in zip(texts, embeddings)]
+    
+    return embeddings
+
+
+def get_embedding_cache_stats() -> Dict:
+    """Returns hit/miss statistics for the question embedding cache"""
+    return _query_embedding_cache.stats()
+
+
+def get_search_lexicon(user_id: str, client=None) -> Dict:
+    """
+    Returns the user's properties, vendors and document types (cached per corpus version)
+    
+    Args:
+        user_id: Current user ID
+        client: Authenticated Supabase client (defaults to the current session's)
+    
+    Returns:
+        {"properties": [...], "vendors": [...], "document_types": [...]}
+    """
+    key = (user_id, get_corpus_version(user_id, client))
+    lexicon = _lexicon_cache.get(key)
+    if lexicon is None:
+        lexicon = get_document_facets(user_id, client=client)
+        if _has_facets(lexicon):
+            _lexicon_cache.set(key, lexicon)
+    return lexicon
+
+
+def _has_facets(lexicon: Dict) -> bool:
+    """
+    Whether a lexicon lists anything - empty ones aren't cached, since
+    get_document_facets also returns them when the lookup failed
+    """
+    return any(lexicon.get(name) for name in ("properties", "vendors", "document_types"))
+
+
+def get_search_filters(question: str, user_id: str, client=None) -> Dict:
+    """
+    Structured search filters named in a question ("Oak Street electric bill in March")
+    
+    Args:
+        question: User's question
+        user_id: Current user ID
+        client: Authenticated Supabase client (defaults to the current session's)
+    
+    Returns:
+        Dictionary with the property_name / vendor / document_type / date_from / date_to
+        that were recognised (empty if the question names none)
+    """
+    return _search_filters_from_lexicon(question, get_search_lexicon(user_id, client=client))
+
+
+def _search_filters_from_lexicon(question: str, lexicon: Dict) -> Dict:
+    """get_search_filters with the lexicon already loaded"""
+    filters = extract_filters(question, lexicon)
+    
+    # A type keyword for a type this user has no documents of can only empty the search
+    known_types = lexicon.get("document_types") or []
+    if known_types and filters["document_type"] not in known_types:
+        filters["document_type"] = None
+    
+    return {key: filters[key] for key in SEARCH_FILTER_PARAMS if filters[key] is not None}
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalizes a question for cache lookups
+    ("What is the rent?" and "  what is the RENT " are the same question)
+    """
+    return " ".join(question.lower().split()).rstrip("?.! ")
+
+
+def get_answer_cache_stats() -> Dict:
+    """Returns hit/miss statistics for the answer cache"""
+    return _answer_cache.stats()
+
+
 def answer_question(question: str, user_id: str) -> Dict:
     """
     Answers a question using RAG:
@@ -32,41 +190,438 @@ def answer_question(question: str, user_id: str) -> Dict:
     3. Generate answer using only those documents
     4. Return answer with sources
     
+    Repeat questions against an unchanged document set are served from the
+    answer cache (the result then has "cached": True)
+    
     Args:
         question: User's question
-        user_id: Current user ID (for display purposes, RLS handles security)
+        user_id: Current user ID (answer cache key - RLS handles security)
     
     Returns:
         Dictionary with answer and source documents
     """
+    cache_key = (user_id, normalize_question(question), get_corpus_version(user_id))
+    cached = _answer_cache.get(cache_key)
+    if cached is not None:
+        return {**cached, "cached": True}
     
-    # Step 1: Enhance question for better semantic matching
-    # Add context keywords that might help match property documents
+    result = _answer_question_uncached(question, user_id)
+    
+    # Errors are worth retrying, so they're never cached
+    if result.get("confidence") != "error":
+        _answer_cache.set(cache_key, result)
+    
+    return result
+
+
+def _answer_question_uncached(question: str, user_id: str) -> Dict:
+    """Runs the full RAG pipeline for answer_question (no answer cache)"""
+    # Totals/counts/lists over document metadata are answered exactly with SQL
+    aggregate = _answer_aggregate(question, user_id)
+    if aggregate is not None:
+        return aggregate
+    
+    retrieval = _retrieve(question, user_id)
+    if "answer" in retrieval:
+        # Retrieval already decided the answer (error / nothing relevant found)
+        return retrieval
+    
+    return _generate(question, retrieval)
+
+
+def _generate(question: str, retrieval: Dict) -> Dict:
+    """Generates the answer from retrieved chunks (the last step of the pipeline)"""
+    relevant_docs = retrieval["chunks"]
+    
+    # Step 6: Generate answer using GPT
+    print("Generating answer...")
+    try:
+        client = get_openai_client()
+        response = client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=_build_messages(question, retrieval["context"]),
+            temperature=0.2  # Lower temperature = more focused answers
+        )
+        
+        answer = response.choices[0].message.content
+        
+        return {
+            "answer": answer,
+            "sources": _format_sources(relevant_docs),
+            "confidence": _compute_confidence(relevant_docs)
+        }
+        
+    except Exception as e:
+        print(f"Error generating answer: {e}")
+        return {
+            "answer": f"Sorry, I encountered an error: {str(e)}",
+            "sources": [],
+            "confidence": "error"
+        }
+
+
+def answer_questions(questions: List[str], user_id: str, max_concurrency: int = 4) -> List[Dict]:
+    """
+    Answers many questions at once (e.g. the same monthly report questions per property)
+    
+    Compared to calling answer_question in a loop:
+    - questions already in the answer cache, and repeats within the batch, are answered once
+    - all question embeddings are created in one API request
+    - searches run concurrently, and questions that need the same search share its chunks
+    - aggregate answers and GPT generations run in parallel, at most max_concurrency at a time
+    
+    Args:
+        questions: Questions to answer
+        user_id: Current user ID (answer cache key - RLS handles security)
+        max_concurrency: Maximum searches / generations in flight at once
+    
+    Returns:
+        One result per question, in order - each like answer_question's, plus
+        "question", "cached" and "timings" (seconds per stage for this question -
+        aggregate / embedding / search / generation - plus batch_total for the whole call)
+    """
+    from auth import get_authenticated_client
+    batch_started = time.monotonic()
+    
+    # Worker threads can't read Streamlit session state, so resolve everything
+    # session-dependent here and pass it down
+    supabase = get_authenticated_client()
+    version = get_corpus_version(user_id, client=supabase)
+    get_search_lexicon(user_id, client=supabase)
+    
+    results: Dict[str, Dict] = {}
+    timings: Dict[str, Dict] = {}
+    
+    # Identical questions (after normalization) are answered once
+    unique: Dict[str, str] = {}
+    for question in questions:
+        unique.setdefault(normalize_question(question), question)
+    
+    pending = []
+    for key, question in unique.items():
+        cached = _answer_cache.get((user_id, key, version))
+        timings[key] = {}
+        if cached is not None:
+            results[key] = {**cached, "cached": True}
+        else:
+            pending.append(key)
+    
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as pool:
+        # One embeddings request for every question, made while aggregates run
+        embedding_keys = list(pending)
+        embedding_job = pool.submit(_timed, get_query_embeddings, [_enhance_question(unique[key]) for key in embedding_keys])
+        
+        # Aggregate questions are answered with SQL and skip retrieval entirely
+        aggregates = {
+            key: pool.submit(_timed, _answer_aggregate, unique[key], user_id, supabase)
+            for key in pending
+        }
+        for key, future in aggregates.items():
+            aggregate, timings[key]["aggregate"] = future.result()
+            if aggregate is not None:
+                results[key] = aggregate
+        pending = [key for key in pending if key not in results]
+        
+        embedded, embedding_seconds = embedding_job.result()
+        embeddings = dict(zip(embedding_keys, embedded))
+        for key in pending:
+            timings[key]["embedding"] = embedding_seconds
+            if embeddings[key] is None:
+                results[key] = {
+                    "answer": "Sorry, I encountered an error processing your question.",
+                    "sources": [],
+                    "confidence": "error"
+                }
+        pending = [key for key in pending if key not in results]
+        
+        # Questions with the same embedding text and filters need the same search
+        search_keys = {}
+        for key in pending:
+            filters = get_search_filters(unique[key], user_id, client=supabase)
+            search_keys[key] = (_enhance_question(unique[key]), tuple(sorted(filters.items())))
+        searches = {}
+        for key in pending:
+            if search_keys[key] not in searches:
+                filters = dict(search_keys[key][1])
+                searches[search_keys[key]] = pool.submit(_timed, _search_chunks, embeddings[key], filters, supabase)
+        
+        generations = {}
+        for key in pending:
+            try:
+                relevant_docs, timings[key]["search"] = searches[search_keys[key]].result()
+            except SearchUnavailableError as e:
+                results[key] = _search_error(e)
+                continue
+            
+            retrieval = _select_context(unique[key], relevant_docs)
+            if "answer" in retrieval:
+                results[key] = retrieval
+            else:
+                generations[key] = pool.submit(_timed, _generate, unique[key], retrieval)
+        
+        for key, future in generations.items():
+            results[key], timings[key]["generation"] = future.result()
+    
+    total = time.monotonic() - batch_started
+    answers = []
+    for question in questions:
+        key = normalize_question(question)
+        result = results[key]
+        if not result.get("cached") and result.get("confidence") != "error":
+            _answer_cache.set((user_id, key, version), result)
+        answers.append({
+            **result,
+            "question": question,
+            "cached": bool(result.get("cached")),
+            "timings": {**timings[key], "batch_total": total}
+        })
+    
+    return answers
+
+
+def _timed(fn, *args):
+    """Calls fn(*args) and returns (result, seconds it took)"""
+    started = time.monotonic()
+    result = fn(*args)
+    return result, time.monotonic() - started
+
+
+def _answer_aggregate(question: str, user_id: str, client=None) -> Optional[Dict]:
+    """
+    Answers aggregate/filter questions ("total spent on HVAC", "utility bills over $400")
+    with one SQL aggregation over the documents table. The LLM only phrases the result.
+    
+    Args:
+        question: User's question
+        user_id: Current user ID
+        client: Authenticated Supabase client (defaults to the current session's)
+    
+    Returns:
+        Result dictionary, or None if the question should go through semantic search
+    """
+    if detect_intent(question) is None:
+        return None
+    
+    plan = _plan_aggregate(question, get_search_lexicon(user_id, client=client))
+    if plan is None:
+        return None
+    
+    intent, filters = plan
+    print(f"Answering with SQL aggregation ({intent}): {filters}")
+    result = aggregate_documents(**filters, client=client)
+    if result is None:
+        return None
+    
+    if not result.get("document_count"):
+        return _no_aggregate_matches()
+    
+    return _aggregate_result(_phrase_aggregate(question, intent, result), result)
+
+
+def _plan_aggregate(question: str, lexicon: Dict) -> Optional[Tuple[str, Dict]]:
+    """
+    Decides whether a question can be answered with aggregate_documents
+    
+    Returns:
+        (intent, aggregate_documents keyword arguments), or None for semantic search
+    """
+    intent = detect_intent(question)
+    if intent is None:
+        return None
+    
+    filters = extract_filters(question, lexicon)
+    if filters["unmatched"]:
+        # The question is about something filters can't express (e.g. "repairs")
+        return None
+    
+    keys = ("property_name", "vendor", "document_type", "date_from", "date_to", "min_amount", "max_amount")
+    if intent == "list" and all(filters[key] is None for key in keys):
+        return None
+    
+    return intent, {key: filters[key] for key in keys}
+
+
+def _no_aggregate_matches() -> Dict:
+    """Result for an aggregate question that no document matches"""
+    return {
+        "answer": "I don't know based on the available documents. No documents match what you asked about.",
+        "sources": [],
+        "confidence": "none"
+    }
+
+
+def _aggregate_result(answer: str, result: Dict) -> Dict:
+    """Result dictionary for an aggregate answer (matching documents as sources)"""
+    sources = []
+    for doc in result.get("documents", []):
+        sources.append({
+            "filename": doc.get("filename", "Unknown"),
+            "property": doc.get("property_name"),
+            "type": doc.get("document_type"),
+            "vendor": doc.get("vendor"),
+            "amount": doc.get("amount"),
+            "similarity": 1.0  # Exact match on metadata
+        })
+    
+    return {
+        "answer": answer,
+        "sources": sources,
+        "confidence": "high"
+    }
+
+
+def _describe_aggregate(intent: str, result: Dict) -> str:
+    """Plain-text answer for an aggregation (also the fallback if phrasing fails)"""
+    count = result.get("document_count", 0)
+    total = float(result.get("total_amount") or 0)
+    docs = result.get("documents", [])
+    
+    if intent == "count":
+        return f"There are {count} matching document(s)."
+    if intent == "average" and result.get("average_amount") is not None:
+        return f"The average amount is ${float(result['average_amount']):,.2f} across {result.get('amount_count', count)} document(s)."
+    if intent in ("max", "min") and docs:
+        priced = [d for d in docs if d.get("amount") is not None]
+        if priced:
+            pick = max(priced, key=lambda d: d["amount"]) if intent == "max" else min(priced, key=lambda d: d["amount"])
+            return f"{pick.get('filename')} ({pick.get('property_name') or 'unknown property'}) has the {'highest' if intent == 'max' else 'lowest'} amount: ${float(pick['amount']):,.2f}."
+    if intent == "list":
+        lines = [f"{count} matching document(s):"]
+        for doc in docs:
+            amount = f" - ${float(doc['amount']):,.2f}" if doc.get("amount") is not None else ""
+            lines.append(f"- {doc.get('filename')} ({doc.get('property_name') or 'unknown property'}){amount}")
+        return "\n".join(lines)
+    return f"The total is ${total:,.2f} across {count} document(s)."
+
+
+def _aggregate_messages(question: str, intent: str, result: Dict) -> List[Dict]:
+    """Chat messages asking GPT to phrase an aggregation result"""
+    facts = _describe_aggregate(intent, result)
+    details = "\n".join(
+        f"- {d.get('filename')} | property: {d.get('property_name')} | type: {d.get('document_type')} | "
+        f"vendor: {d.get('vendor')} | amount: {d.get('amount')} | date: {d.get('document_date')}"
+        for d in result.get("documents", [])[:20]
+    )
+    return [
+        {"role": "system", "content": "You are PropertyAI. Answer the question in one or two sentences using ONLY the computed result below. Copy numbers exactly - never recalculate them."},
+        {"role": "user", "content": f"Question: {question}\n\nComputed result: {facts}\n\nMatching documents:\n{details}"}
+    ]
+
+
+def _phrase_aggregate(question: str, intent: str, result: Dict) -> str:
+    """Has GPT phrase the exact aggregation result as an answer (no arithmetic by the model)"""
+    try:
+        client = get_openai_client()
+        response = client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=_aggregate_messages(question, intent, result),
+            temperature=0
+        )
+        return response.choices[0].message.content
+    except Exception as e:
+        print(f"Error phrasing aggregate answer: {e}")
+        return _describe_aggregate(intent, result)
+
+
+def _enhance_question(question: str) -> str:
+    """
+    Enhance question for better semantic matching
+    Add context keywords that might help match property documents
+    """
     enhanced_question = question
     if "bill" in question.lower():
         enhanced_question += " utility invoice payment amount cost"
     if "oak" in question.lower() or "street" in question.lower() or "property" in question.lower():
         enhanced_question += " property address location"
+    return enhanced_question
+
+
+def _retrieve(question: str, user_id: str) -> Dict:
+    """
+    Retrieval half of the pipeline: embed the question, search chunks, build context
+    
+    Properties, vendors, document types and dates named in the question narrow the
+    search to matching documents; if that finds nothing relevant, the search is
+    repeated over all documents.
+    
+    Args:
+        question: User's question
+        user_id: Current user ID (for the search lexicon)
+    
+    Returns:
+        Either a finished result ({"answer", "sources", "confidence"}) when there is
+        nothing to generate from, or {"chunks": [...], "context": str}
+    """
+    # Step 1: Enhance question for better semantic matching
+    enhanced_question = _enhance_question(question)
     
     print(f"Creating embedding for question: {question}")
-    query_embedding = create_embedding(enhanced_question)
+    query_embedding = get_query_embedding(enhanced_question)
     
-    if not query_embedding:
+    if query_embedding is None:
         return {
             "answer": "Sorry, I encountered an error processing your question.",
             "sources": [],
             "confidence": "error"
         }
     
-    # Step 2: Search for relevant documents (lower threshold for better recall)
-    print("Searching for relevant documents...")
+    try:
+        relevant_docs = _search_chunks(query_embedding, get_search_filters(question, user_id))
+    except SearchUnavailableError as e:
+        # Don't turn a search failure into "I don't know" - tell the user what happened
+        return _search_error(e)
+    
+    return _select_context(question, relevant_docs)
+
+
+def _search_chunks(query_embedding: Vector, search_filters: Dict, client=None) -> List[Dict]:
+    """
+    Step 2 of retrieval: vector search, narrowed by the question's filters when it has any
+    
+    Raises:
+        SearchUnavailableError if the search failed or timed out
+    """
+    # Lower threshold for better recall
+    print(f"Searching for relevant documents... filters: {search_filters or 'none'}")
     relevant_docs = search_documents_semantic(
         query_embedding=query_embedding,
         match_threshold=0.3,  # Lower threshold (30%) to catch more documents
-        match_count=10  # Get more candidates to filter
+        match_count=SEARCH_CANDIDATES,  # Get more candidates for the reranker
+        filters=search_filters,
+        neighbor_window=NEIGHBOR_WINDOW,
+        client=client
     )
+    if search_filters and _top_similarity(relevant_docs) < MIN_TOP_SIMILARITY:
+        # The filters may have been wrong (e.g. a document without a date)
+        print("Nothing relevant with filters, searching all documents...")
+        relevant_docs = search_documents_semantic(
+            query_embedding=query_embedding,
+            match_threshold=0.3,
+            match_count=SEARCH_CANDIDATES,
+            neighbor_window=NEIGHBOR_WINDOW,
+            client=client
+        )
     
     print(f"Found {len(relevant_docs)} relevant documents")
+    return relevant_docs
+
+
+def _search_error(error: Exception) -> Dict:
+    """Result returned when search is unavailable"""
+    return {
+        "answer": f"Sorry, document search is unavailable right now. {error}",
+        "sources": [],
+        "confidence": "error"
+    }
+
+
+def _select_context(question: str, relevant_docs: List[Dict]) -> Dict:
+    """
+    Steps 3-4 of retrieval: relevance checks, reranking and context packing
+    
+    Returns:
+        Either a finished "I don't know" result or {"chunks": [...], "context": str}
+    """
     
     # Step 3: Check if we found any relevant documents
     if not relevant_docs or len(relevant_docs) == 0:
@@ -76,52 +631,55 @@ def answer_question(question: str, user_id: str) -> Dict:
             "confidence": "none"
         }
     
-    # Filter to top 5 most relevant and check if top similarity is reasonable
-    relevant_docs = relevant_docs[:5]
-    top_similarity = relevant_docs[0].get("similarity", 0) if relevant_docs else 0
-    
     # Only reject if similarity is very low (below 0.4)
-    if top_similarity < 0.4:
+    if _top_similarity(relevant_docs) < MIN_TOP_SIMILARITY:
         return {
             "answer": "I don't know based on the available documents. The information I found doesn't seem relevant enough to provide a confident answer.",
             "sources": [],
             "confidence": "low"
         }
     
-    # Step 4: Build context from relevant CHUNKS (IMPROVED)
-    context = ""
-    seen_documents = set()  # Track which documents we've seen
+    # Keep the best few by BM25 + similarity, spread across documents (MMR)
+    relevant_docs = rerank(question, relevant_docs, top_k=RERANK_TOP_K)
     
-    for i, chunk in enumerate(relevant_docs, 1):
-        metadata = chunk.get("metadata", {})
-        chunk_text = chunk.get("content", "")
-        similarity = chunk.get("similarity", 0)
-        document_id = chunk.get("document_id")
-        chunk_index = chunk.get("chunk_index", 0)
-        
-        # Group chunks by document for better context
-        doc_key = f"{metadata.get('filename', 'Unknown')}_{document_id}"
-        is_new_doc = doc_key not in seen_documents
-        seen_documents.add(doc_key)
-        
-        if is_new_doc:
-            context += f"\n--- Document: {metadata.get('filename', 'Unknown')} ---\n"
-            context += f"Property: {metadata.get('property_name', 'Unknown')}\n"
-            context += f"Type: {metadata.get('document_type', 'Unknown')}\n"
-            if metadata.get('vendor'):
-                context += f"Vendor: {metadata.get('vendor')}\n"
-            if metadata.get('amount'):
-                context += f"Amount: ${metadata.get('amount')}\n"
-            if metadata.get('document_date'):
-                context += f"Date: {metadata.get('document_date')}\n"
-            context += f"Relevant sections:\n"
-        
-        # Add chunk with its relevance score
-        context += f"  [Section {chunk_index + 1}, Relevance: {similarity:.1%}]\n"
-        context += f"  {chunk_text}\n"
+    # Add the chunks just before/after each one (fetched with the search) so
+    # sentences cut at a chunk boundary are complete
+    relevant_docs = _with_neighbors(relevant_docs)
     
-    # Step 5: Create the prompt for GPT
-    system_prompt = """You are PropertyAI, a helpful assistant that answers questions about property documents.
+    # Step 4: Build context from relevant CHUNKS - merged, de-duplicated and
+    # packed into the token budget (sources only list chunks that made it in)
+    context, used_chunks = pack_context(relevant_docs, token_budget=CONTEXT_TOKEN_BUDGET)
+    return {
+        "chunks": used_chunks,
+        "context": context
+    }
+
+
+def _with_neighbors(chunks: List[Dict]) -> List[Dict]:
+    """
+    Adds each chunk's neighbouring chunks (chunk["neighbors"] from the search)
+    Neighbours take the similarity of the chunk they surround and are marked
+    "neighbor": True; chunks already present are not added twice
+    """
+    seen = {(c.get("document_id"), c.get("chunk_index")) for c in chunks}
+    expanded = list(chunks)
+    for chunk in chunks:
+        for neighbor in chunk.get("neighbors") or []:
+            key = (neighbor.get("document_id"), neighbor.get("chunk_index"))
+            if key in seen:
+                continue
+            seen.add(key)
+            expanded.append({**neighbor, "similarity": chunk.get("similarity", 0), "neighbor": True})
+    return expanded
+
+
+def _top_similarity(chunks: List[Dict]) -> float:
+    """Best similarity among search results (0 if there are none)"""
+    return max((c.get("similarity", 0) or 0 for c in chunks), default=0)
+
+
+# Step 5: System prompt for answer generation (user prompt built in _build_messages)
+SYSTEM_PROMPT = """You are PropertyAI, a helpful assistant that answers questions about property documents.
 
 CRITICAL RULES:
 1. Answer ONLY using information from the provided documents
@@ -138,6 +696,9 @@ CRITICAL RULES:
 
 When citing numbers (amounts, dates), always mention which document/property they came from."""
 
+
+def _build_messages(question: str, context: str) -> List[Dict]:
+    """Builds the chat messages for answer generation"""
     user_prompt = f"""Question: {question}
 
 Available documents:
@@ -151,81 +712,67 @@ Instructions:
 - Provide a clear, direct answer with the specific information found
 
 Please answer the question using ONLY the information above. If the answer is not clearly stated in the documents, say you don't know."""
+    
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
 
-    # Step 6: Generate answer using GPT
-    print("Generating answer...")
-    try:
-        client = get_openai_client()
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.2  # Lower temperature = more focused answers
-        )
-        
-        answer = response.choices[0].message.content
-        
-        # Determine confidence based on similarity scores
-        avg_similarity = sum(d.get("similarity", 0) for d in relevant_docs) / len(relevant_docs)
-        
-        if avg_similarity > 0.75:
-            confidence = "high"
-        elif avg_similarity > 0.6:
-            confidence = "medium"
-        else:
-            confidence = "low"
-        
-        # Format sources for display (chunks grouped by document)
-        sources = []
-        seen_docs = {}
-        for chunk in relevant_docs:
-            metadata = chunk.get("metadata", {})
-            document_id = chunk.get("document_id")
-            chunk_index = chunk.get("chunk_index", 0)
-            similarity = chunk.get("similarity", 0)
-            
-            # Group chunks by document
-            if document_id not in seen_docs:
-                seen_docs[document_id] = {
-                    "filename": metadata.get("filename", "Unknown"),
-                    "property": metadata.get("property_name"),
-                    "type": metadata.get("document_type"),
-                    "vendor": metadata.get("vendor"),
-                    "amount": metadata.get("amount"),
-                    "similarity": similarity,  # Use highest similarity chunk
-                    "chunks": []
-                }
-            
-            # Track which chunks from this document were used
-            seen_docs[document_id]["chunks"].append(chunk_index)
-            # Update similarity if this chunk is more relevant
-            if similarity > seen_docs[document_id]["similarity"]:
-                seen_docs[document_id]["similarity"] = similarity
-        
-        # Convert to list format
-        for doc_data in seen_docs.values():
-            chunk_info = f" (sections: {', '.join(map(str, sorted(set(doc_data['chunks']))))})" if doc_data["chunks"] else ""
-            sources.append({
-                "filename": doc_data["filename"] + chunk_info,
-                "property": doc_data["property"],
-                "type": doc_data["type"],
-                "vendor": doc_data["vendor"],
-                "amount": doc_data["amount"],
-                "similarity": doc_data["similarity"]
-            })
-        
-        return {
-            "answer": answer,
-            "sources": sources,
-            "confidence": confidence
-        }
-        
-    except Exception as e:
-        print(f"Error generating answer: {e}")
-        return {
-            "answer": f"Sorry, I encountered an error: {str(e)}",
-            "sources": [],
-            "confidence": "error"
-        }
+
+def _compute_confidence(relevant_docs: List[Dict]) -> str:
+    """Determine confidence based on similarity scores"""
+    # Neighbouring chunks only borrow their match's score, so they don't count
+    scored = [d for d in relevant_docs if not d.get("neighbor")] or relevant_docs
+    avg_similarity = sum(d.get("similarity", 0) for d in scored) / len(scored)
+    
+    if avg_similarity > 0.75:
+        confidence = "high"
+    elif avg_similarity > 0.6:
+        confidence = "medium"
+    else:
+        confidence = "low"
+    
+    return confidence
+
+
+def _format_sources(relevant_docs: List[Dict]) -> List[Dict]:
+    """Format sources for display (chunks grouped by document)"""
+    sources = []
+    seen_docs = {}
+    for chunk in relevant_docs:
+        metadata = chunk.get("metadata", {})
+        document_id = chunk.get("document_id")
+        chunk_index = chunk.get("chunk_index", 0)
+        similarity = chunk.get("similarity", 0)
+    
+        # Group chunks by document
+        if document_id not in seen_docs:
+            seen_docs[document_id] = {
+                "filename": metadata.get("filename", "Unknown"),
+                "property": metadata.get("property_name"),
+                "type": metadata.get("document_type"),
+                "vendor": metadata.get("vendor"),
+                "amount": metadata.get("amount"),
+                "similarity": similarity,  # Use highest similarity chunk
+                "chunks": []
+            }
+    
+        # Track which chunks from this document were used
+        seen_docs[document_id]["chunks"].append(chunk_index)
+        # Update similarity if this chunk is more relevant
+        if similarity > seen_docs[document_id]["similarity"]:
+            seen_docs[document_id]["similarity"] = similarity
+    
+    # Convert to list format
+    for doc_data in seen_docs.values():
+        chunk_info = f" (sections: {', '.join(map(str, sorted(set(doc_data['chunks']))))})" if doc_data["chunks"] else ""
+        sources.append({
+            "filename": doc_data["filename"] + chunk_info,
+            "property": doc_data["property"],
+            "type": doc_data["type"],
+            "vendor": doc_data["vendor"],
+            "amount": doc_data["amount"],
+            "similarity": doc_data["similarity"]
+        })
+    
+    return sources
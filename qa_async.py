@@ -0,0 +1,357 @@
+"""
+qa_async.py
+Asyncio version of the question-answering pipeline (qa.answer_question)
+Independent stages overlap - the question is embedded while the search lexicon
+and aggregate query load - and a question superseded by an edit can be cancelled
+before it spends more search time or generation tokens
+"""
+
+import asyncio
+import os
+import queue
+import threading
+import weakref
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+import database_async
+from database import SearchUnavailableError
+from ingest import EMBEDDING_MODEL
+from vectors import Vector, from_openai
+from qa import (
+    _answer_cache,
+    _query_embedding_cache,
+    _lexicon_cache,
+    normalize_question,
+    SEARCH_CANDIDATES,
+    NEIGHBOR_WINDOW,
+    MIN_TOP_SIMILARITY,
+    _enhance_question,
+    _search_filters_from_lexicon,
+    _has_facets,
+    _search_error,
+    _select_context,
+    _top_similarity,
+    _plan_aggregate,
+    _no_aggregate_matches,
+    _aggregate_result,
+    _aggregate_messages,
+    _describe_aggregate,
+    _build_messages,
+    _compute_confidence,
+    _format_sources
+)
+
+if TYPE_CHECKING:
+    from supabase import AsyncClient
+
+load_dotenv()
+
+# AsyncOpenAI's HTTP connections belong to the event loop that created them
+_openai_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """Get the AsyncOpenAI client for the running event loop (lazy initialization)"""
+    loop = asyncio.get_running_loop()
+    client = _openai_clients.get(loop)
+    if client is None:
+        client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        _openai_clients[loop] = client
+    return client
+
+
+async def get_query_embedding(text: str) -> Optional[Vector]:
+    """Async version of qa.get_query_embedding (same cache)"""
+    key = (EMBEDDING_MODEL, text)
+    embedding = _query_embedding_cache.get(key)
+    if embedding is not None:
+        return embedding
+
+    try:
+        response = await get_async_openai_client().embeddings.create(
+            model=EMBEDDING_MODEL,
+            input=text[:8000],
+            encoding_format="base64"
+        )
+        embedding = from_openai(response.data[0].embedding)
+    except Exception as e:
+        print(f"Error creating embedding: {e}")
+        return None
+
+    if embedding is not None:
+        _query_embedding_cache.set(key, embedding)
+    return embedding
+
+
+async def get_search_lexicon(user_id: str, client: 'AsyncClient') -> Dict:
+    """Async version of qa.get_search_lexicon (same cache)"""
+    key = (user_id, await database_async.get_corpus_version(user_id, client))
+    lexicon = _lexicon_cache.get(key)
+    if lexicon is None:
+        lexicon = await database_async.get_document_facets(user_id, client=client)
+        if _has_facets(lexicon):
+            _lexicon_cache.set(key, lexicon)
+    return lexicon
+
+
+async def answer_question_async(
+    question: str,
+    user_id: str,
+    client: Optional['AsyncClient'] = None,
+    on_token: Optional[Callable[[str], None]] = None
+) -> Dict:
+    """
+    Async version of qa.answer_question with overlapped stages:
+    the question embedding starts right away, while the search lexicon loads and
+    aggregate questions are answered with SQL. Shares qa's caches.
+
+    Cancelling the task stops whatever stage is running - including a streaming
+    generation, so no more tokens are produced for a superseded question.
+
+    Args:
+        question: User's question
+        user_id: Current user ID (cache key - RLS handles security)
+        client: Async Supabase client (defaults to the current session's)
+        on_token: Called with each piece of answer text as it is generated
+                  (not called for cached, aggregate or "I don't know" answers)
+
+    Returns:
+        Dictionary with answer, sources and confidence (like qa.answer_question)
+    """
+    supabase = client or await database_async.get_authenticated_async_client()
+    cache_key = (user_id, normalize_question(question), await database_async.get_corpus_version(user_id, supabase))
+    cached = _answer_cache.get(cache_key)
+    if cached is not None:
+        return {**cached, "cached": True}
+
+    # The embedding doesn't depend on the lexicon or the aggregate check, so start it now
+    embedding_task = asyncio.ensure_future(get_query_embedding(_enhance_question(question)))
+    try:
+        lexicon = await get_search_lexicon(user_id, supabase)
+        result = await _answer_aggregate(question, lexicon, supabase)
+        if result is None:
+            result = await _answer_from_search(question, lexicon, embedding_task, supabase, on_token)
+    finally:
+        # Still running only if an aggregate answered (or we were cancelled)
+        embedding_task.cancel()
+
+    # Errors are worth retrying, so they're never cached
+    if result.get("confidence") != "error":
+        _answer_cache.set(cache_key, result)
+    return result
+
+
+async def _answer_aggregate(question: str, lexicon: Dict, client: 'AsyncClient') -> Optional[Dict]:
+    """Async version of qa._answer_aggregate"""
+    plan = _plan_aggregate(question, lexicon)
+    if plan is None:
+        return None
+
+    intent, filters = plan
+    print(f"Answering with SQL aggregation ({intent}): {filters}")
+    result = await database_async.aggregate_documents(**filters, client=client)
+    if result is None:
+        return None
+
+    if not result.get("document_count"):
+        return _no_aggregate_matches()
+
+    try:
+        response = await get_async_openai_client().chat.completions.create(
+            model="gpt-4o-mini",
+            messages=_aggregate_messages(question, intent, result),
+            temperature=0
+        )
+        answer = response.choices[0].message.content
+    except Exception as e:
+        print(f"Error phrasing aggregate answer: {e}")
+        answer = _describe_aggregate(intent, result)
+
+    return _aggregate_result(answer, result)
+
+
+async def _answer_from_search(
+    question: str,
+    lexicon: Dict,
+    embedding_task: 'asyncio.Future',
+    client: 'AsyncClient',
+    on_token: Optional[Callable[[str], None]]
+) -> Dict:
+    """Semantic search path: wait for the embedding, search, build context, generate"""
+    query_embedding = await embedding_task
+    if query_embedding is None:
+        return {
+            "answer": "Sorry, I encountered an error processing your question.",
+            "sources": [],
+            "confidence": "error"
+        }
+
+    try:
+        relevant_docs = await _search_chunks(query_embedding, _search_filters_from_lexicon(question, lexicon), client)
+    except SearchUnavailableError as e:
+        return _search_error(e)
+
+    retrieval = _select_context(question, relevant_docs)
+    if "answer" in retrieval:
+        return retrieval
+
+    return await _generate(question, retrieval, on_token)
+
+
+async def _search_chunks(query_embedding: Vector, search_filters: Dict, client: 'AsyncClient') -> List[Dict]:
+    """Async version of qa._search_chunks (filtered search, then unfiltered if nothing relevant)"""
+    print(f"Searching for relevant documents... filters: {search_filters or 'none'}")
+    relevant_docs = await database_async.search_documents_semantic(
+        query_embedding=query_embedding,
+        match_threshold=0.3,
+        match_count=SEARCH_CANDIDATES,
+        client=client,
+        filters=search_filters,
+        neighbor_window=NEIGHBOR_WINDOW
+    )
+    if search_filters and _top_similarity(relevant_docs) < MIN_TOP_SIMILARITY:
+        print("Nothing relevant with filters, searching all documents...")
+        relevant_docs = await database_async.search_documents_semantic(
+            query_embedding=query_embedding,
+            match_threshold=0.3,
+            match_count=SEARCH_CANDIDATES,
+            client=client,
+            neighbor_window=NEIGHBOR_WINDOW
+        )
+
+    print(f"Found {len(relevant_docs)} relevant documents")
+    return relevant_docs
+
+
+async def _generate(question: str, retrieval: Dict, on_token: Optional[Callable[[str], None]]) -> Dict:
+    """
+    Async version of qa._generate
+    Always streams, so a cancelled question closes the stream and stops generation
+    """
+    relevant_docs = retrieval["chunks"]
+
+    print("Generating answer...")
+    pieces = []
+    try:
+        response = await get_async_openai_client().chat.completions.create(
+            model="gpt-4o-mini",
+            messages=_build_messages(question, retrieval["context"]),
+            temperature=0.2,
+            stream=True
+        )
+        try:
+            async for event in response:
+                if not event.choices:
+                    continue
+                delta = event.choices[0].delta.content
+                if delta:
+                    pieces.append(delta)
+                    if on_token:
+                        on_token(delta)
+        finally:
+            await response.close()
+    except Exception as e:
+        print(f"Error generating answer: {e}")
+        return {
+            "answer": f"Sorry, I encountered an error: {str(e)}",
+            "sources": [],
+            "confidence": "error"
+        }
+
+    return {
+        "answer": "".join(pieces),
+        "sources": _format_sources(relevant_docs),
+        "confidence": _compute_confidence(relevant_docs)
+    }
+
+
+class LatestQuestionRunner:
+    """
+    Runs answer_question_async on a background event loop, one question at a time
+    Submitting a new question cancels the previous one if it's still running, so an
+    edited question doesn't keep paying for an answer nobody will read.
+    Keep one runner per user session. All runners share one loop and its clients
+    (one Supabase client per user), so a session that ends without logging out
+    leaves no thread or event loop behind.
+    """
+
+    def __init__(self):
+        self._loop = database_async.get_background_loop()
+        self._lock = threading.Lock()
+        self._current: Optional[Future] = None
+        self._access_token: Optional[str] = None
+
+    def submit(
+        self,
+        question: str,
+        user_id: str,
+        access_token: Optional[str],
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> Future:
+        """
+        Starts answering a question, cancelling the previous one
+
+        Args:
+            question: User's question
+            user_id: Current user ID
+            access_token: The user's access token (read it on the Streamlit script thread)
+            on_token: Called from the background loop with each piece of answer text
+
+        Returns:
+            concurrent.futures.Future with the result dictionary
+            (raises CancelledError if a newer question replaced it)
+        """
+        async def run():
+            client = await database_async.get_authenticated_async_client(access_token)
+            return await answer_question_async(question, user_id, client=client, on_token=on_token)
+
+        with self._lock:
+            self._access_token = access_token
+            if self._current is not None:
+                self._current.cancel()
+            self._current = asyncio.run_coroutine_threadsafe(run(), self._loop)
+            return self._current
+
+    def stream(self, question: str, user_id: str, access_token: Optional[str]) -> Tuple[Future, Iterator[str]]:
+        """
+        Like submit, but also returns an iterator over the answer text as it is generated
+        The iterator ends when the question finishes, fails or is cancelled.
+        """
+        pieces: "queue.Queue[Optional[str]]" = queue.Queue()
+        future = self.submit(question, user_id, access_token, on_token=pieces.put)
+        future.add_done_callback(lambda _: pieces.put(None))
+
+        def tokens() -> Iterator[str]:
+            while True:
+                piece = pieces.get()
+                if piece is None:
+                    return
+                yield piece
+
+        return future, tokens()
+
+    def warm_up(self, access_token: Optional[str]):
+        """
+        Creates this runner's Supabase and OpenAI clients ahead of the first question
+        Returns immediately - the clients are created on the background loop
+        """
+        async def warm():
+            await database_async.get_authenticated_async_client(access_token)
+            get_async_openai_client()
+
+        self._access_token = access_token
+        asyncio.run_coroutine_threadsafe(warm(), self._loop)
+
+    def cancel(self) -> bool:
+        """Cancels the running question, if any (True if one was cancelled)"""
+        with self._lock:
+            return self._current is not None and self._current.cancel()
+
+    def close(self):
+        """Cancels the running question and closes the user's Supabase client (on logout)"""
+        self.cancel()
+        if self._access_token:
+            asyncio.run_coroutine_threadsafe(database_async.release_async_client(self._access_token), self._loop)
+            self._access_token = None
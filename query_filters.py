@@ -0,0 +1,307 @@
+"""
+query_filters.py
+Recognises structured filters (property, vendor, document type, date range, amount)
+in a question, and whether the question asks for an aggregate (total, count, list...)
+"""
+
+import calendar
+import re
+from datetime import date
+from typing import Dict, List, Optional, Set, Tuple
+
+# Words that carry no subject of their own
+STOPWORDS = {
+    "a", "an", "the", "of", "on", "in", "at", "to", "for", "from", "by", "with",
+    "and", "or", "is", "are", "was", "were", "be", "been", "did", "do", "does",
+    "we", "our", "us", "i", "my", "me", "you", "your", "it", "its", "this", "that",
+    "what", "whats", "when", "where", "which", "who", "how", "much", "many", "had",
+    "has", "have", "there", "their", "any", "all", "each", "every", "so", "far",
+    "ever", "up", "please", "tell", "show", "list", "give", "find", "get"
+}
+
+# Words too common in names to identify a property or vendor on their own
+GENERIC_NAME_WORDS = {
+    "street", "st", "avenue", "ave", "road", "rd", "drive", "dr", "lane", "ln",
+    "boulevard", "blvd", "court", "ct", "place", "unit", "apt", "suite",
+    "inc", "llc", "ltd", "co", "corp", "company", "services", "service",
+    "group", "the", "and", "property", "properties"
+}
+
+# Question words that map directly to a normalized document_type
+TYPE_KEYWORDS = {
+    "utility": "utility_bill",
+    "utilities": "utility_bill",
+    "invoice": "invoice",
+    "invoices": "invoice",
+    "lease": "lease",
+    "leases": "lease",
+    "inspection": "inspection_report",
+    "inspections": "inspection_report",
+    "insurance": "insurance",
+    "tax": "tax_document",
+    "taxes": "tax_document"
+}
+
+# Words that say the question is about money (required for sum/average/min/max)
+MONEY_WORDS = {
+    "spent", "spend", "spending", "paid", "pay", "payment", "payments", "cost",
+    "costs", "amount", "amounts", "expense", "expenses", "charges", "charged",
+    "bill", "bills", "billed", "dollars", "money", "owed", "due"
+}
+
+# Aggregate intents, checked in order
+INTENT_PATTERNS: List[Tuple[str, str]] = [
+    ("average", r"\b(average|avg|mean)\b"),
+    ("max", r"\b(highest|largest|biggest|most expensive|maximum|max)\b"),
+    ("min", r"\b(lowest|smallest|cheapest|least expensive|minimum|min)\b"),
+    ("count", r"\bhow many\b"),
+    ("sum", r"\b(total|sum|altogether|combined|in all)\b|\bhow much\b.*\b(spent|spend|paid|pay|cost)\b"),
+    ("list", r"\b(list|show me|show all|which|all)\b")
+]
+
+# "total" / "how much" only means a sum over documents with plural or aggregate
+# phrasing - "the total amount due on the March bill" is a lookup in one document
+AGGREGATE_SUM_WORDS = {
+    "all", "every", "altogether", "combined", "sum", "bills", "invoices", "payments",
+    "expenses", "charges", "costs", "amounts", "utilities", "receipts", "statements"
+}
+AGGREGATE_SUM_PATTERN = re.compile(r"\b(in all|so far|to date)\b")
+SINGLE_DOCUMENT_PATTERN = re.compile(
+    r"\b(amount|total|balance)\s+(due|owed)\b"
+    r"|\b(the|this|that|one|last|latest)\s+(?:\w+\s+){0,3}?(bill|invoice|statement|receipt)\b"
+)
+SPENDING_PATTERN = re.compile(r"\b(spent|spend|spending|paid|pay)\b")
+
+# Words consumed by the intent patterns above
+INTENT_WORDS = {
+    "average", "avg", "mean", "highest", "largest", "biggest", "most", "expensive",
+    "maximum", "max", "lowest", "smallest", "cheapest", "least", "minimum", "min",
+    "total", "sum", "altogether", "combined"
+}
+
+MONTHS = {
+    name.lower(): number
+    for number in range(1, 13)
+    for name in (calendar.month_name[number], calendar.month_abbr[number])
+}
+MONTHS.pop("may", None)
+MONTHS["may"] = 5  # month_abbr and month_name are both "May"
+
+_MONTH_NAMES = "|".join(sorted(MONTHS, key=len, reverse=True))
+MONTH_YEAR_PATTERN = re.compile(rf"\b({_MONTH_NAMES})\.?\s+(?:of\s+)?((?:19|20)\d\d)\b")
+QUARTER_PATTERN = re.compile(r"\bq([1-4])\s+((?:19|20)\d\d)\b")
+YEAR_PATTERN = re.compile(r"\b((?:19|20)\d\d)\b")
+MONTH_PATTERN = re.compile(rf"\b(?:in|during|for|from|last|this)\s+({_MONTH_NAMES})\b")
+RELATIVE_PATTERN = re.compile(r"\b(last|this|past|previous|current)\s+(month|year)\b")
+
+AMOUNT_PATTERN = re.compile(
+    r"\b(over|above|more than|greater than|exceeding|under|below|less than)\s+\$?\s*([\d,]+(?:\.\d+)?)"
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens (apostrophes dropped, so "what's" -> "whats")"""
+    return re.findall(r"[a-z0-9]+", text.lower().replace("'", ""))
+
+
+def _name_tokens(name: str) -> Set[str]:
+    """Distinctive tokens of a property/vendor name ("123 Oak Street" -> {"123", "oak"})"""
+    return {t for t in tokenize(name) if t not in GENERIC_NAME_WORDS and (len(t) >= 3 or t.isdigit())}
+
+
+def _month_range(year: int, month: int) -> Tuple[date, date]:
+    """First and last day of a month"""
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+def extract_date_range(question: str, today: Optional[date] = None) -> Tuple[Optional[str], Optional[str], Set[str]]:
+    """
+    Turns date phrases into a document_date range
+    ("January 2024", "Q1 2024", "in 2023", "last month", "this year", "in March")
+
+    Args:
+        question: User's question
+        today: Reference date for relative phrases (defaults to today)
+
+    Returns:
+        (date_from, date_to, consumed tokens) - dates as YYYY-MM-DD, or None if no date phrase
+    """
+    text = question.lower()
+    today = today or date.today()
+
+    match = MONTH_YEAR_PATTERN.search(text)
+    if match:
+        start, end = _month_range(int(match.group(2)), MONTHS[match.group(1)])
+        return start.isoformat(), end.isoformat(), set(tokenize(match.group(0)))
+
+    match = QUARTER_PATTERN.search(text)
+    if match:
+        quarter, year = int(match.group(1)), int(match.group(2))
+        start, _ = _month_range(year, quarter * 3 - 2)
+        _, end = _month_range(year, quarter * 3)
+        return start.isoformat(), end.isoformat(), set(tokenize(match.group(0)))
+
+    match = RELATIVE_PATTERN.search(text)
+    if match:
+        previous = match.group(1) in ("last", "past", "previous")
+        if match.group(2) == "month":
+            year, month = today.year, today.month
+            if previous:
+                year, month = (year - 1, 12) if month == 1 else (year, month - 1)
+            start, end = _month_range(year, month)
+        else:
+            year = today.year - 1 if previous else today.year
+            start, end = date(year, 1, 1), date(year, 12, 31)
+        return start.isoformat(), end.isoformat(), set(tokenize(match.group(0)))
+
+    match = YEAR_PATTERN.search(text)
+    if match:
+        year = int(match.group(1))
+        return date(year, 1, 1).isoformat(), date(year, 12, 31).isoformat(), {match.group(1)}
+
+    match = MONTH_PATTERN.search(text)
+    if match:
+        # A month without a year means its most recent occurrence
+        month = MONTHS[match.group(1)]
+        year = today.year if month <= today.month else today.year - 1
+        start, end = _month_range(year, month)
+        return start.isoformat(), end.isoformat(), set(tokenize(match.group(0)))
+
+    return None, None, set()
+
+
+def match_facet(question_tokens: Set[str], values: List[str]) -> Tuple[Optional[str], Set[str]]:
+    """
+    Finds which known property/vendor a question refers to
+
+    Args:
+        question_tokens: Tokens of the question
+        values: Known names (e.g. all vendors for this user)
+
+    Returns:
+        (filter text, question tokens it consumed). The filter text is the full
+        name when one name matches best, or the shared word when several match
+        equally ("plumbing" for two plumbing vendors). (None, set()) if nothing matches.
+    """
+    best_score = 0
+    best: List[Tuple[str, Set[str]]] = []
+    for value in values:
+        tokens = _name_tokens(value)
+        # Numbers alone (e.g. a house number) aren't enough to identify a name
+        matched = tokens & question_tokens
+        if not matched or all(t.isdigit() for t in matched):
+            continue
+        score = len(matched)
+        if score > best_score:
+            best_score, best = score, [(value, matched)]
+        elif score == best_score:
+            best.append((value, matched))
+
+    if not best:
+        return None, set()
+    if len(best) == 1:
+        return best[0]
+
+    shared = set.intersection(*(matched for _, matched in best))
+    shared_words = sorted(t for t in shared if not t.isdigit())
+    if not shared_words:
+        # Different names matched different words - too ambiguous to filter on
+        return None, set()
+    return shared_words[0], shared
+
+
+def detect_intent(question: str) -> Optional[str]:
+    """
+    Returns the aggregate intent of a question, or None
+
+    Returns:
+        "sum", "average", "max", "min", "count", "list" or None
+    """
+    text = question.lower()
+    tokens = set(tokenize(text))
+    for intent, pattern in INTENT_PATTERNS:
+        if re.search(pattern, text):
+            if intent in ("sum", "average", "max", "min") and not (tokens & MONEY_WORDS or "$" in text):
+                # "total square footage" is not a money question
+                return None
+            if intent == "sum" and not _is_aggregate_sum(text, tokens):
+                return None
+            return intent
+    return None
+
+
+def _is_aggregate_sum(text: str, tokens: Set[str]) -> bool:
+    """
+    Whether a "total" / "how much" question adds up several documents
+    ("total spent on HVAC", "all Oak Street bills") rather than asking for one
+    document's amount ("the total amount due on the Oak Street electric bill")
+    """
+    if tokens & AGGREGATE_SUM_WORDS or AGGREGATE_SUM_PATTERN.search(text):
+        return True
+    if SINGLE_DOCUMENT_PATTERN.search(text):
+        return False
+    return bool(SPENDING_PATTERN.search(text))
+
+
+def extract_filters(question: str, facets: Dict) -> Dict:
+    """
+    Extracts structured filters from a question
+
+    Args:
+        question: User's question
+        facets: {"properties": [...], "vendors": [...], "document_types": [...]}
+
+    Returns:
+        Dictionary with property_name, vendor, document_type, date_from, date_to,
+        min_amount, max_amount (None when not mentioned) and "unmatched": content
+        words no filter explains
+    """
+    text = question.lower()
+    tokens = tokenize(text)
+    token_set = set(tokens)
+    consumed: Set[str] = set()
+
+    property_name, used = match_facet(token_set, facets.get("properties", []))
+    consumed |= used
+    vendor, used = match_facet(token_set - consumed, facets.get("vendors", []))
+    consumed |= used
+
+    document_type = None
+    for token in tokens:
+        mapped = TYPE_KEYWORDS.get(token)
+        if mapped:
+            document_type = document_type or mapped
+            consumed.add(token)
+
+    date_from, date_to, used = extract_date_range(question)
+    consumed |= used
+
+    min_amount = max_amount = None
+    for direction, number in AMOUNT_PATTERN.findall(text):
+        value = float(number.replace(",", ""))
+        if direction in ("under", "below", "less than"):
+            max_amount = value
+        else:
+            min_amount = value
+        consumed |= set(tokenize(direction)) | set(tokenize(number))
+
+    unmatched = [
+        t for t in tokens
+        if t not in consumed
+        and t not in STOPWORDS
+        and t not in MONEY_WORDS
+        and t not in INTENT_WORDS
+        and t not in GENERIC_NAME_WORDS
+        and not t.isdigit()
+    ]
+
+    return {
+        "property_name": property_name,
+        "vendor": vendor,
+        "document_type": document_type,
+        "date_from": date_from,
+        "date_to": date_to,
+        "min_amount": min_amount,
+        "max_amount": max_amount,
+        "unmatched": unmatched
+    }
@@ -0,0 +1,128 @@
+"""
+rerank.py
+Local reranking of search candidates before context building:
+BM25 over the candidate text, blended with vector similarity, then MMR
+so the final chunks aren't near-copies of each other or all from one document
+"""
+
+from collections import Counter
+from typing import List, Dict
+import numpy as np
+from query_filters import tokenize, STOPWORDS
+
+
+def _terms(text: str) -> List[str]:
+    """Content words used for lexical scoring"""
+    return [t for t in tokenize(text) if t not in STOPWORDS]
+
+
+def _term_matrix(token_lists: List[List[str]], vocabulary: Dict[str, int]) -> np.ndarray:
+    """Term-frequency matrix (candidates x vocabulary)"""
+    matrix = np.zeros((len(token_lists), len(vocabulary)), dtype=np.float32)
+    for row, tokens in enumerate(token_lists):
+        for term, count in Counter(tokens).items():
+            column = vocabulary.get(term)
+            if column is not None:
+                matrix[row, column] = count
+    return matrix
+
+
+def bm25_scores(query: str, texts: List[str], k1: float = 1.5, b: float = 0.75) -> np.ndarray:
+    """
+    BM25 score of each text for the query, with IDF computed over the candidate set
+
+    Args:
+        query: Question text
+        texts: Candidate chunk texts
+        k1: Term frequency saturation
+        b: Length normalization strength
+
+    Returns:
+        Array of scores, one per text
+    """
+    query_terms = sorted(set(_terms(query)))
+    if not texts or not query_terms:
+        return np.zeros(len(texts), dtype=np.float32)
+
+    token_lists = [_terms(text) for text in texts]
+    tf = _term_matrix(token_lists, {term: i for i, term in enumerate(query_terms)})
+
+    n = len(texts)
+    df = (tf > 0).sum(axis=0)
+    idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    lengths = np.array([len(tokens) for tokens in token_lists], dtype=np.float32)
+    avg_length = max(lengths.mean(), 1.0)
+    norm = k1 * (1 - b + b * lengths / avg_length)
+
+    return (idf * tf * (k1 + 1) / (tf + norm[:, None])).sum(axis=1)
+
+
+def _min_max(values: np.ndarray) -> np.ndarray:
+    """Scales values to 0-1 (all equal -> all 1)"""
+    spread = values.max() - values.min()
+    if spread <= 1e-9:
+        return np.ones_like(values)
+    return (values - values.min()) / spread
+
+
+def rerank(
+    question: str,
+    candidates: List[Dict],
+    top_k: int = 5,
+    lexical_weight: float = 0.3,
+    diversity: float = 0.3,
+    same_document_penalty: float = 0.5
+) -> List[Dict]:
+    """
+    Picks the best top_k candidates by blended relevance with MMR diversity
+
+    Args:
+        question: User's question
+        candidates: Search results (content, similarity, document_id, ...)
+        top_k: How many candidates to keep
+        lexical_weight: Share of relevance from BM25 (rest from vector similarity)
+        diversity: MMR trade-off - 0 = pure relevance, 1 = pure novelty
+        same_document_penalty: Minimum redundancy between chunks of the same document
+
+    Returns:
+        The selected candidates in selection order, each with a "rerank_score"
+    """
+    if len(candidates) <= 1:
+        return list(candidates)
+
+    texts = [c.get("content", "") for c in candidates]
+    similarity = np.array([c.get("similarity", 0) or 0 for c in candidates], dtype=np.float32)
+    lexical = bm25_scores(question, texts)
+    relevance = (1 - lexical_weight) * _min_max(similarity) + lexical_weight * _min_max(lexical)
+
+    # Redundancy between candidates: cosine of their term vectors, raised to at
+    # least same_document_penalty for chunks from the same document
+    token_lists = [_terms(text) for text in texts]
+    vocabulary = {term: i for i, term in enumerate(sorted({t for tokens in token_lists for t in tokens}))}
+    vectors = _term_matrix(token_lists, vocabulary)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.maximum(norms, 1e-9)
+    redundancy = vectors @ vectors.T
+    document_ids = np.array([str(c.get("document_id")) for c in candidates])
+    same_document = document_ids[:, None] == document_ids[None, :]
+    redundancy = np.where(same_document, np.maximum(redundancy, same_document_penalty), redundancy)
+
+    selected: List[int] = []
+    remaining = np.ones(len(candidates), dtype=bool)
+    max_redundancy = np.zeros(len(candidates), dtype=np.float32)
+
+    for _ in range(min(top_k, len(candidates))):
+        scores = (1 - diversity) * relevance - diversity * max_redundancy
+        scores[~remaining] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        remaining[best] = False
+        max_redundancy = np.maximum(max_redundancy, redundancy[best])
+
+    results = []
+    for index in selected:
+        candidate = dict(candidates[index])
+        candidate["rerank_score"] = float(relevance[index])
+        results.append(candidate)
+    return results
@@ -0,0 +1,242 @@
+"""
+resilience.py
+Deadlines, hedged requests and a circuit breaker for network calls
+(used around the search RPC so a slow or failing backend can't stall answers)
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from typing import Callable, Awaitable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Hedge calls are only started while fewer attempts than this are running
+# (attempts past their deadline keep running until the call returns)
+MAX_ATTEMPTS_IN_FLIGHT = 8
+
+_attempts_in_flight = 0
+_attempts_lock = threading.Lock()
+
+
+def _start_attempt(fn: Callable[[], T]) -> "Future[T]":
+    """
+    Runs fn on its own daemon thread
+    A blocking call can't be interrupted, so an abandoned attempt (timed out, or a
+    hedge that lost) holds only its own thread - never a slot later calls wait for
+    """
+    global _attempts_in_flight
+    future: "Future[T]" = Future()
+    future.set_running_or_notify_cancel()
+
+    def run():
+        global _attempts_in_flight
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with _attempts_lock:
+                _attempts_in_flight -= 1
+
+    with _attempts_lock:
+        _attempts_in_flight += 1
+    threading.Thread(target=run, name="deadline-call", daemon=True).start()
+    return future
+
+
+def _can_hedge() -> bool:
+    with _attempts_lock:
+        return _attempts_in_flight < MAX_ATTEMPTS_IN_FLIGHT
+
+
+class LatencyTracker:
+    """
+    Keeps a rolling window of call durations to estimate percentiles
+    (used to pick the hedge delay: hedge only the slowest ~5% of calls)
+    """
+
+    def __init__(self, window: int = 200, min_samples: int = 20, default: float = 1.0):
+        """
+        Args:
+            window: How many recent samples to keep
+            min_samples: Below this many samples, percentile() returns the default
+            default: Seconds to assume before enough samples are collected
+        """
+        self._samples = deque(maxlen=window)
+        self._min_samples = min_samples
+        self._default = default
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        """Adds one call duration"""
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float) -> float:
+        """
+        Returns the p-th percentile of recent durations in seconds
+
+        Args:
+            p: Percentile (0-100)
+        """
+        with self._lock:
+            if len(self._samples) < self._min_samples:
+                return self._default
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing dependency for a while instead of piling up timeouts
+
+    closed    -> calls go through; failure_threshold consecutive failures opens the circuit
+    open      -> calls are refused until reset_timeout seconds have passed
+    half-open -> one trial call is let through; success closes, failure re-opens
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """'closed', 'open' or 'half-open'"""
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        """Returns True if a call may be attempted now"""
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            # Half-open: let exactly one trial call through
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        """Closes the circuit"""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        """Counts a failure, opening the circuit at the threshold (or after a failed trial)"""
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def release(self):
+        """Frees the trial slot without counting a success or a failure (e.g. the call was cancelled)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+def call_with_deadline(fn: Callable[[], T], timeout: float, hedge_after: Optional[float] = None) -> T:
+    """
+    Runs a blocking call with a deadline, optionally hedging it
+
+    If hedge_after seconds pass without a result, an identical second call is
+    started (unless MAX_ATTEMPTS_IN_FLIGHT attempts are already running) and
+    whichever finishes first wins. The caller never waits past timeout.
+
+    Args:
+        fn: Zero-argument callable doing the (idempotent) work
+        timeout: Total seconds to wait for a result
+        hedge_after: Seconds before starting the hedge call (None = no hedging)
+
+    Returns:
+        The first successful result
+
+    Raises:
+        TimeoutError if no call finished in time, or the call's own exception if all attempts failed
+    """
+    deadline = time.monotonic() + timeout
+    futures = [_start_attempt(fn)]
+
+    if hedge_after is not None and hedge_after < timeout:
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done and _can_hedge():
+            futures.append(_start_attempt(fn))
+
+    pending = set(futures)
+    errors = []
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            errors.append(future.exception())
+
+    if errors and len(errors) == len(futures):
+        raise errors[0]
+    raise TimeoutError(f"Call did not finish within {timeout:.1f}s")
+
+
+async def acall_with_deadline(
+    factory: Callable[[], Awaitable[T]],
+    timeout: float,
+    hedge_after: Optional[float] = None
+) -> T:
+    """
+    Async version of call_with_deadline
+
+    Args:
+        factory: Zero-argument callable returning a new coroutine for each attempt
+        timeout: Total seconds to wait for a result
+        hedge_after: Seconds before starting the hedge attempt (None = no hedging)
+
+    Returns:
+        The first successful result
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    tasks = [asyncio.ensure_future(factory())]
+
+    try:
+        if hedge_after is not None and hedge_after < timeout:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+            if not done:
+                tasks.append(asyncio.ensure_future(factory()))
+
+        pending = set(tasks)
+        errors = []
+        while pending:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                errors.append(task.exception())
+
+        if errors and len(errors) == len(tasks):
+            raise errors[0]
+        raise TimeoutError(f"Call did not finish within {timeout:.1f}s")
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
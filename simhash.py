@@ -0,0 +1,110 @@
+"""
+simhash.py
+Similarity sketches for near-duplicate document detection
+A document's SimHash is a 64-bit fingerprint of its word 3-grams: near-identical
+copies (a re-upload, a re-scan with a few OCR differences) get fingerprints a few
+bits apart. Documents that merely share a template - e.g. next month's bill from
+the same vendor - usually differ by far more and aren't flagged. The fingerprint
+is stored in four 16-bit bands (ADD_NEAR_DUPLICATES.sql) - two fingerprints within
+NEAR_DUPLICATE_DISTANCE bits agree on at least one band, so an index lookup on the
+bands finds every candidate without comparing against the whole corpus.
+"""
+
+import hashlib
+import re
+from typing import Iterable, List
+import numpy as np
+
+SIMHASH_BITS = 64
+
+# Words per shingle
+SHINGLE_WORDS = 3
+
+# The fingerprint is split into this many bands of SIMHASH_BITS // SIMHASH_BANDS bits
+SIMHASH_BANDS = 4
+BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+
+# Fingerprints at most this many bits apart are near-duplicates
+# Must be below SIMHASH_BANDS, or band lookups could miss matches
+NEAR_DUPLICATE_DISTANCE = 3
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def simhash(pieces: Iterable[str]) -> int:
+    """
+    Computes a document's SimHash from its text, a piece at a time
+
+    Args:
+        pieces: The document's text, whole or in pieces (e.g. iter_document_text) -
+                only one piece is held at a time
+
+    Returns:
+        64-bit fingerprint (0 for a document without words)
+    """
+    weights = np.zeros(SIMHASH_BITS, dtype=np.int64)
+    window: List[str] = []
+    partial = ""
+    total_words = 0
+
+    for piece in pieces:
+        # A word cut off at the end of a piece continues in the next one
+        text = (partial + piece).lower()
+        words = _WORD_PATTERN.findall(text)
+        partial = words.pop() if words and text.endswith(words[-1]) else ""
+        total_words += len(words)
+        window = _add_shingles(weights, window, words)
+
+    if partial:
+        total_words += 1
+        window = _add_shingles(weights, window, [partial])
+    if 0 < total_words < SHINGLE_WORDS:
+        # Too short for a full shingle - use what there is
+        _add_hashes(weights, [_hash_shingle(window)])
+
+    fingerprint = 0
+    for bit in np.flatnonzero(weights > 0):
+        fingerprint |= 1 << int(bit)
+    return fingerprint
+
+
+def _add_shingles(weights: np.ndarray, window: List[str], words: List[str]) -> List[str]:
+    """Adds the shingles ending in the given words; returns the last SHINGLE_WORDS - 1 words"""
+    words = window + words
+    hashes = [
+        _hash_shingle(words[i:i + SHINGLE_WORDS])
+        for i in range(len(words) - SHINGLE_WORDS + 1)
+    ]
+    if hashes:
+        _add_hashes(weights, hashes)
+    return words[-(SHINGLE_WORDS - 1):] if len(words) >= SHINGLE_WORDS else words
+
+
+def _hash_shingle(words: List[str]) -> int:
+    return int.from_bytes(hashlib.blake2b(" ".join(words).encode(), digest_size=8).digest(), "little")
+
+
+def _add_hashes(weights: np.ndarray, hashes: List[int]) -> None:
+    """Each shingle votes +1 for the bits set in its hash and -1 for the others"""
+    bits = np.unpackbits(
+        np.array(hashes, dtype="<u8").view(np.uint8).reshape(-1, 8),
+        axis=1,
+        bitorder="little"
+    )
+    weights += 2 * bits.sum(axis=0, dtype=np.int64) - len(hashes)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of bits two fingerprints differ in"""
+    return bin(a ^ b).count("1")
+
+
+def band_values(fingerprint: int) -> List[int]:
+    """The fingerprint's SIMHASH_BANDS bands, lowest bits first"""
+    mask = (1 << BAND_BITS) - 1
+    return [(fingerprint >> (band * BAND_BITS)) & mask for band in range(SIMHASH_BANDS)]
+
+
+def to_signed(fingerprint: int) -> int:
+    """The fingerprint as a signed 64-bit integer (how Postgres BIGINT stores it)"""
+    return fingerprint - (1 << SIMHASH_BITS) if fingerprint >= 1 << (SIMHASH_BITS - 1) else fingerprint
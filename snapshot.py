@@ -0,0 +1,412 @@
+"""
+snapshot.py
+Exports a user's documents and chunks (with their embeddings) to one file, and
+restores them - into the same project or another one - without calling OpenAI
+
+The snapshot is an .npz archive (readable with numpy.load) holding columns:
+    manifest.json            format version, source user, row counts
+    documents.jsonl          one document row per line (metadata and file_content)
+    chunk_document.npy       int32: position of each chunk's document in documents.jsonl
+    chunk_index.npy          int32
+    chunk_start.npy          int32: start_char
+    chunk_has_embedding.npy  bool: False where the chunk has no embedding
+    chunk_text.jsonl         one JSON string per line
+    embeddings.npy           float32 (chunks x 1536), contiguous
+
+Both directions stream: export spools embeddings to a temp file, and import reads
+them from the archive a batch at a time, so memory use doesn't grow with the corpus.
+Uses the service role key (SUPABASE_SERVICE_KEY) - run it as an admin.
+
+Usage:
+    python snapshot.py export <user_id> snapshot.npz
+    python snapshot.py import snapshot.npz                 # back into the same user
+    python snapshot.py import snapshot.npz --user <id>     # into another user (e.g. on another project)
+"""
+
+import argparse
+import hashlib
+import json
+import shutil
+import tempfile
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+import numpy as np
+import database
+from database import DELETE_DOCUMENT_BATCH, get_service_client
+from simhash import band_values, to_signed
+from vectors import EMBEDDING_DIMENSIONS, from_pgvector, to_pgvector
+
+SNAPSHOT_FORMAT = 1
+
+# Rows fetched per request when exporting
+EXPORT_PAGE_SIZE = 1000
+
+# Rows inserted per request when importing (500 chunks are ~10 MB of JSON)
+IMPORT_BATCH_SIZE = 500
+
+# Chunk batches inserted at the same time when importing
+IMPORT_WORKERS = 4
+
+# Documents whose text is fetched per request when checking what's already there
+CONTENT_PAGE_SIZE = 100
+
+# Columns of the documents table that are exported (ids are reassigned on import)
+DOCUMENT_COLUMNS = ("filename", "file_content", "property_name", "document_type", "vendor", "amount", "document_date", "uploaded_at")
+
+# Exported too when the source project has it (ADD_NEAR_DUPLICATES.sql); its bands
+# are recomputed on import, and it's dropped if the target project lacks the columns
+SIMHASH_COLUMN = "simhash"
+
+
+def _iter_rows(supabase, table: str, columns: str, user_id: str) -> Iterator[Dict]:
+    """Yields all of a user's rows in a table, EXPORT_PAGE_SIZE at a time (keyset paging on id)"""
+    last_id = None
+    while True:
+        query = supabase.table(table).select(columns).eq("user_id", user_id)
+        if last_id:
+            query = query.gt("id", last_id)
+        rows = query.order("id").limit(EXPORT_PAGE_SIZE).execute().data or []
+        yield from rows
+        if len(rows) < EXPORT_PAGE_SIZE:
+            break
+        last_id = rows[-1]["id"]
+
+
+def _export_columns(supabase, user_id: str) -> List[str]:
+    """The document columns to export: DOCUMENT_COLUMNS, plus simhash if the source has it"""
+    columns = list(DOCUMENT_COLUMNS) + [SIMHASH_COLUMN]
+    try:
+        supabase.table("documents").select(",".join(columns)).eq("user_id", user_id).limit(1).execute()
+    except Exception as e:
+        if SIMHASH_COLUMN not in str(e):
+            raise
+        columns.remove(SIMHASH_COLUMN)
+    return columns
+
+
+def _write_array(archive: zipfile.ZipFile, name: str, array: np.ndarray):
+    with archive.open(name, "w", force_zip64=True) as f:
+        np.lib.format.write_array(f, array, allow_pickle=False)
+
+
+def export_snapshot(user_id: str, path: str) -> Dict:
+    """
+    Writes a user's documents and chunks to a snapshot file
+
+    Args:
+        user_id: The user whose corpus is exported
+        path: Where to write the .npz file
+
+    Returns:
+        The snapshot's manifest (row counts etc.)
+    """
+    supabase = get_service_client()
+    document_positions: Dict[str, int] = {}
+    chunk_document: List[int] = []
+    chunk_index: List[int] = []
+    chunk_start: List[int] = []
+    chunk_has_embedding: List[bool] = []
+    zero_vector = np.zeros(EMBEDDING_DIMENSIONS, dtype="<f4").tobytes()
+
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as archive, \
+            tempfile.TemporaryFile() as embeddings:
+
+        columns = _export_columns(supabase, user_id)
+        with archive.open("documents.jsonl", "w", force_zip64=True) as f:
+            for row in _iter_rows(supabase, "documents", ",".join(["id"] + columns), user_id):
+                document_positions[row["id"]] = len(document_positions)
+                document = {column: row.get(column) for column in columns}
+                f.write((json.dumps(document) + "\n").encode("utf-8"))
+        print(f"  [OK] Exported {len(document_positions)} documents")
+
+        with archive.open("chunk_text.jsonl", "w", force_zip64=True) as f:
+            columns = "id,document_id,chunk_index,chunk_text,start_char,embedding"
+            for row in _iter_rows(supabase, "document_chunks", columns, user_id):
+                position = document_positions.get(row["document_id"])
+                if position is None:
+                    continue  # Document was added after the documents were read
+
+                chunk_document.append(position)
+                chunk_index.append(row.get("chunk_index") or 0)
+                chunk_start.append(row.get("start_char") or 0)
+                chunk_has_embedding.append(row.get("embedding") is not None)
+                f.write((json.dumps(row.get("chunk_text") or "") + "\n").encode("utf-8"))
+
+                if row.get("embedding") is not None:
+                    embeddings.write(from_pgvector(row["embedding"]).astype("<f4").tobytes())
+                else:
+                    embeddings.write(zero_vector)
+
+                if len(chunk_document) % 10000 == 0:
+                    print(f"  [OK] Exported {len(chunk_document)} chunks")
+
+        _write_array(archive, "chunk_document.npy", np.array(chunk_document, dtype=np.int32))
+        _write_array(archive, "chunk_index.npy", np.array(chunk_index, dtype=np.int32))
+        _write_array(archive, "chunk_start.npy", np.array(chunk_start, dtype=np.int32))
+        _write_array(archive, "chunk_has_embedding.npy", np.array(chunk_has_embedding, dtype=bool))
+
+        # Header first, then the spooled float32 rows as they are
+        embeddings.seek(0)
+        with archive.open("embeddings.npy", "w", force_zip64=True) as f:
+            np.lib.format.write_array_header_1_0(f, {
+                "descr": "<f4",
+                "fortran_order": False,
+                "shape": (len(chunk_document), EMBEDDING_DIMENSIONS)
+            })
+            shutil.copyfileobj(embeddings, f, 1024 * 1024)
+
+        manifest = {
+            "format": SNAPSHOT_FORMAT,
+            "user_id": user_id,
+            "exported_at": datetime.now(timezone.utc).isoformat(),
+            "documents": len(document_positions),
+            "chunks": len(chunk_document),
+            "embedding_dimensions": EMBEDDING_DIMENSIONS
+        }
+        archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+
+    print(f"Export complete: {manifest['documents']} documents, {manifest['chunks']} chunks -> {path}")
+    return manifest
+
+
+def _read_array(archive: zipfile.ZipFile, name: str) -> np.ndarray:
+    with archive.open(name) as f:
+        return np.lib.format.read_array(f, allow_pickle=False)
+
+
+def _iter_embedding_batches(archive: zipfile.ZipFile, batch_size: int) -> Iterator[np.ndarray]:
+    """Reads embeddings.npy batch_size rows at a time"""
+    with archive.open("embeddings.npy") as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+        rows, dimensions = shape
+        row_bytes = dimensions * dtype.itemsize
+
+        for start in range(0, rows, batch_size):
+            count = min(batch_size, rows - start)
+            yield np.frombuffer(f.read(count * row_bytes), dtype=dtype).reshape(count, dimensions)
+
+
+def _content_key(document: Dict) -> str:
+    """Identifies a document by its filename and text"""
+    text = (document.get("filename") or "") + "\0" + (document.get("file_content") or "")
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _existing_content_keys(supabase, user_id: str, filenames: set) -> set:
+    """
+    Content keys of the user's documents named like one in the snapshot
+    Only those documents' text is fetched, CONTENT_PAGE_SIZE at a time
+    """
+    ids = [
+        row["id"] for row in _iter_rows(supabase, "documents", "id,filename", user_id)
+        if row["filename"] in filenames
+    ]
+    keys = set()
+    for start in range(0, len(ids), CONTENT_PAGE_SIZE):
+        rows = supabase.table("documents")\
+            .select("filename,file_content")\
+            .in_("id", ids[start:start + CONTENT_PAGE_SIZE])\
+            .execute().data or []
+        keys.update(_content_key(row) for row in rows)
+    return keys
+
+
+def _document_record(document: Dict, document_id: str, user_id: str) -> Dict:
+    """The row inserted for a snapshot document (only known columns, simhash bands recomputed)"""
+    record = {column: document.get(column) for column in DOCUMENT_COLUMNS}
+    record.update({"id": document_id, "user_id": user_id})
+    fingerprint = document.get(SIMHASH_COLUMN)
+    if fingerprint is not None and database._simhash_columns_available:
+        fingerprint &= (1 << 64) - 1
+        record[SIMHASH_COLUMN] = to_signed(fingerprint)
+        for band, value in enumerate(band_values(fingerprint)):
+            record[f"simhash_band_{band}"] = value
+    return record
+
+
+def _insert_documents(supabase, records: List[Dict]):
+    """Inserts document rows, retrying without the simhash columns if the target lacks them"""
+    try:
+        supabase.table("documents").insert(records).execute()
+    except Exception as e:
+        if SIMHASH_COLUMN not in str(e) or not any(SIMHASH_COLUMN in record for record in records):
+            raise
+        print(f"Warning: documents table has no simhash columns, restoring without them: {e}")
+        database._simhash_columns_available = False
+        records = [
+            {key: value for key, value in record.items() if not key.startswith(SIMHASH_COLUMN)}
+            for record in records
+        ]
+        supabase.table("documents").insert(records).execute()
+
+
+def _remove_documents(supabase, user_id: str, document_ids: List[str]):
+    """
+    Deletes documents inserted by a failed import, chunks first
+    (filtered explicitly - the service role has no auth.uid() for the batched delete RPC)
+    """
+    for start in range(0, len(document_ids), DELETE_DOCUMENT_BATCH):
+        ids = document_ids[start:start + DELETE_DOCUMENT_BATCH]
+        supabase.table("document_chunks").delete().eq("user_id", user_id).in_("document_id", ids).execute()
+        supabase.table("documents").delete().eq("user_id", user_id).in_("id", ids).execute()
+
+
+def import_snapshot(
+    path: str,
+    user_id: Optional[str] = None,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    workers: int = IMPORT_WORKERS
+) -> Dict:
+    """
+    Restores a snapshot's documents and chunks (embeddings included - no OpenAI calls)
+    Documents the user already has (same filename and text) are skipped along with
+    their chunks, so restoring after deleting some documents only brings those back.
+    If any insert fails, the documents this import added are deleted again before
+    the error is raised, so no document is left without its chunks and the import
+    can simply be rerun.
+    The app's caches pick up the restored documents when they expire (10 minutes).
+
+    Args:
+        path: Snapshot file written by export_snapshot
+        user_id: The user to restore into (defaults to the user it was exported from)
+        batch_size: Rows inserted per request
+        workers: Chunk batches inserted at the same time
+
+    Returns:
+        {"documents": restored, "chunks": restored, "skipped_documents": skipped}
+    """
+    supabase = get_service_client()
+
+    with zipfile.ZipFile(path, "r") as archive:
+        manifest = json.loads(archive.read("manifest.json"))
+        if manifest.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported snapshot format: {manifest.get('format')}")
+        user_id = user_id or manifest["user_id"]
+
+        with archive.open("documents.jsonl") as f:
+            filenames = {json.loads(line).get("filename") for line in f}
+        existing = _existing_content_keys(supabase, user_id, filenames)
+
+        document_ids: List[Optional[str]] = []
+        inserted: List[str] = []
+        try:
+            # Step 1: Documents get new ids, so a snapshot can be restored next to its source
+            batch: List[Dict] = []
+            skipped = 0
+            with archive.open("documents.jsonl") as f:
+                for line in f:
+                    document = json.loads(line)
+                    if _content_key(document) in existing:
+                        document_ids.append(None)
+                        skipped += 1
+                        continue
+
+                    document_ids.append(str(uuid.uuid4()))
+                    batch.append(_document_record(document, document_ids[-1], user_id))
+                    if len(batch) == batch_size:
+                        inserted.extend(row["id"] for row in batch)
+                        _insert_documents(supabase, batch)
+                        batch = []
+            if batch:
+                inserted.extend(row["id"] for row in batch)
+                _insert_documents(supabase, batch)
+            restored_documents = len(document_ids) - skipped
+            print(f"  [OK] Restored {restored_documents} documents ({skipped} already there, skipped)")
+
+            # Step 2: Chunks, batch_size at a time, several batches in flight
+            restored_chunks = _import_chunks(archive, supabase, user_id, document_ids, batch_size, workers)
+        except BaseException:
+            if inserted:
+                print(f"  [ERROR] Import failed - removing the {len(inserted)} documents it added")
+                _remove_documents(supabase, user_id, inserted)
+            raise
+
+    print(f"Import complete: {restored_documents} documents, {restored_chunks} chunks for user {user_id}")
+    return {"documents": restored_documents, "chunks": restored_chunks, "skipped_documents": skipped}
+
+
+def _import_chunks(
+    archive: zipfile.ZipFile,
+    supabase,
+    user_id: str,
+    document_ids: List[Optional[str]],
+    batch_size: int,
+    workers: int
+) -> int:
+    """Inserts the chunks of the restored documents; returns how many were inserted"""
+    chunk_document = _read_array(archive, "chunk_document.npy")
+    chunk_index = _read_array(archive, "chunk_index.npy")
+    chunk_start = _read_array(archive, "chunk_start.npy")
+    chunk_has_embedding = _read_array(archive, "chunk_has_embedding.npy")
+
+    restored_chunks = 0
+    pending = []
+    with archive.open("chunk_text.jsonl") as texts, ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            for start, vectors in zip(range(0, len(chunk_document), batch_size), _iter_embedding_batches(archive, batch_size)):
+                records = []
+                for offset, vector in enumerate(vectors):
+                    row = start + offset
+                    text = json.loads(texts.readline())
+                    document_id = document_ids[chunk_document[row]]
+                    if document_id is None:
+                        continue
+                    records.append({
+                        "document_id": document_id,
+                        "user_id": user_id,
+                        "chunk_index": int(chunk_index[row]),
+                        "chunk_text": text,
+                        "embedding": to_pgvector(vector) if chunk_has_embedding[row] else None,
+                        "start_char": int(chunk_start[row])
+                    })
+
+                if records:
+                    pending.append(pool.submit(_insert_chunks, supabase, records))
+                # Bound the batches held in memory
+                while len(pending) >= workers * 2:
+                    restored_chunks += pending.pop(0).result()
+                if (start // batch_size) % 20 == 19:
+                    print(f"  [OK] Read {start + len(vectors)} of {len(chunk_document)} chunks")
+
+            while pending:
+                restored_chunks += pending.pop(0).result()
+        except BaseException:
+            # Don't start batches that are only going to be deleted again
+            for future in pending:
+                future.cancel()
+            raise
+
+    return restored_chunks
+
+
+def _insert_chunks(supabase, records: List[Dict]) -> int:
+    supabase.table("document_chunks").insert(records).execute()
+    return len(records)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or restore a user's documents, chunks and embeddings")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Write a user's corpus to a snapshot file")
+    export_parser.add_argument("user_id", help="User whose documents are exported")
+    export_parser.add_argument("path", help="Snapshot file to write (.npz)")
+
+    import_parser = commands.add_parser("import", help="Restore a snapshot file")
+    import_parser.add_argument("path", help="Snapshot file to read")
+    import_parser.add_argument("--user", metavar="USER_ID", help="Restore into this user instead of the original one")
+    import_parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE, help="Rows inserted per request")
+    import_parser.add_argument("--workers", type=int, default=IMPORT_WORKERS, help="Chunk batches inserted at once")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_snapshot(args.user_id, args.path)
+    else:
+        import_snapshot(args.path, user_id=args.user, batch_size=args.batch_size, workers=args.workers)
@@ -0,0 +1,124 @@
+"""
+Tests for auth.py's token verification and refresh (no network calls - Supabase Auth is stubbed)
+"""
+
+import time
+import jwt
+import pytest
+import auth
+
+JWT_SECRET = "test-jwt-secret-at-least-32-bytes-long"
+
+
+def _token(seconds_left: int) -> str:
+    return jwt.encode({"sub": "user-1", "exp": int(time.time()) + seconds_left}, JWT_SECRET)
+
+
+def _access_token(seconds_left: int = 3600, secret: str = JWT_SECRET, **claims) -> str:
+    payload = {"sub": "user-1", "email": "owner@example.com", "aud": "authenticated",
+               "exp": int(time.time()) + seconds_left, **claims}
+    return jwt.encode(payload, secret)
+
+
+@pytest.fixture
+def verify(monkeypatch):
+    """Verification with SUPABASE_JWT_SECRET set; returns the tokens sent to Supabase Auth"""
+    fetched = []
+
+    def fetch_claims(access_token):
+        fetched.append(access_token)
+        return None
+
+    monkeypatch.setenv("SUPABASE_JWT_SECRET", JWT_SECRET)
+    monkeypatch.setattr(auth, "_claims_cache", auth.TTLCache(maxsize=16, ttl=3600))
+    monkeypatch.setattr(auth, "_fetch_claims", fetch_claims)
+    return fetched
+
+
+def test_valid_token_is_verified_locally_and_cached(verify, monkeypatch):
+    token = _access_token()
+
+    claims = auth.verify_access_token(token)
+    monkeypatch.setattr(auth, "_decode_access_token", lambda access_token: pytest.fail("not cached"))
+
+    assert claims["sub"] == "user-1" and claims["email"] == "owner@example.com"
+    assert auth.verify_access_token(token) == claims
+    assert verify == []
+
+
+@pytest.mark.parametrize("token", [
+    _access_token(seconds_left=-10),
+    _access_token(aud="anon"),
+    _access_token(secret="another-secret-that-is-32-bytes-long!"),
+    _access_token()[:-4] + "AAAA",
+    "not-a-jwt",
+])
+def test_invalid_tokens_are_rejected(verify, token):
+    assert auth.verify_access_token(token) is None
+    assert len(auth._claims_cache) == 0
+    assert verify == []
+
+
+def test_token_without_subject_is_rejected(verify):
+    token = jwt.encode({"aud": "authenticated", "exp": int(time.time()) + 3600}, JWT_SECRET)
+
+    assert auth.verify_access_token(token) is None
+
+
+def test_hs256_without_the_secret_asks_supabase_auth(verify, monkeypatch):
+    monkeypatch.delenv("SUPABASE_JWT_SECRET")
+    token = _access_token()
+
+    assert auth.verify_access_token(token) is None
+    assert verify == [token]
+
+
+def test_asymmetric_token_is_checked_with_the_jwks(verify, monkeypatch):
+    ec = pytest.importorskip("cryptography.hazmat.primitives.asymmetric.ec")
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    signing_key = type("SigningKey", (), {"key": private_key.public_key()})
+    jwks_client = type("JWKSClient", (), {"get_signing_key_from_jwt": lambda self, token: signing_key})()
+    monkeypatch.setattr(auth, "_get_jwks_client", lambda: jwks_client)
+    payload = {"sub": "user-1", "aud": "authenticated", "exp": int(time.time()) + 3600}
+
+    claims = auth.verify_access_token(jwt.encode(payload, private_key, algorithm="ES256"))
+    forged = auth.verify_access_token(jwt.encode(payload, JWT_SECRET * 2, algorithm="HS384"))
+
+    assert claims["sub"] == "user-1"
+    assert forged is None
+
+
+@pytest.fixture
+def exchanges(monkeypatch):
+    """Stubs Supabase Auth; returns the refresh tokens it was asked to exchange"""
+    exchanged = []
+
+    def refresh_session(refresh_token):
+        exchanged.append(refresh_token)
+        number = int(refresh_token.split("-")[1]) + 1
+        session = type("Session", (), {"access_token": _token(3600), "refresh_token": f"refresh-{number}"})
+        return type("Response", (), {"session": session})
+
+    client = type("Client", (), {"auth": type("Auth", (), {"refresh_session": staticmethod(refresh_session)})})
+    monkeypatch.setattr(auth, "_create_auth_client", lambda: client)
+    monkeypatch.setattr(auth, "_refreshed_tokens", auth.TTLCache(maxsize=16, ttl=3600))
+    return exchanged
+
+
+def test_refresh_token_is_exchanged_once(exchanges):
+    first = auth.refresh_session_tokens("refresh-1")
+    again = auth.refresh_session_tokens("refresh-1")
+
+    assert exchanges == ["refresh-1"]
+    assert first == again and first[1] == "refresh-2"
+
+
+def test_refresh_follows_tokens_already_exchanged(exchanges):
+    auth.refresh_session_tokens("refresh-1")
+    # The newest access token is about to expire, so its refresh token is used next
+    auth._refreshed_tokens.set("refresh-1", (_token(60), "refresh-2"))
+
+    tokens = auth.refresh_session_tokens("refresh-1")
+
+    assert exchanges == ["refresh-1", "refresh-2"]
+    assert tokens[1] == "refresh-3"
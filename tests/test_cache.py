@@ -0,0 +1,72 @@
+"""
+Tests for cache.py's LRU/TTL cache
+"""
+
+import pytest
+import cache
+from cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replaces time.monotonic in cache.py; returns a one-element list holding the time"""
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_least_recently_used_entry_is_evicted():
+    entries = TTLCache(maxsize=2)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    entries.get("a")
+
+    entries.set("c", 3)
+
+    assert entries.get("b") is None
+    assert entries.get("a") == 1 and entries.get("c") == 3
+    assert entries.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    entries = TTLCache(ttl=10)
+    entries.set("a", 1)
+
+    clock[0] += 9.9
+    assert entries.get("a") == 1
+
+    clock[0] += 0.2
+    assert entries.get("a", "expired") == "expired"
+    assert len(entries) == 0
+
+
+def test_per_entry_ttl_overrides_the_default(clock):
+    entries = TTLCache(ttl=10)
+    entries.set("short", 1, ttl=1)
+    entries.set("long", 2)
+
+    clock[0] += 5
+
+    assert entries.get("short") is None
+    assert entries.get("long") == 2
+
+
+def test_cached_none_is_a_hit():
+    entries = TTLCache()
+    entries.set("a", None)
+
+    assert entries.get("a", "missing") is None
+    assert entries.get("b", "missing") == "missing"
+    assert entries.stats() == {
+        "size": 1, "maxsize": 256, "hits": 1, "misses": 1, "hit_rate": 0.5, "evictions": 0
+    }
+
+
+def test_pop_removes_without_counting():
+    entries = TTLCache()
+    entries.set("a", 1)
+
+    assert entries.pop("a") == 1
+    assert entries.pop("a", "gone") == "gone"
+    assert len(entries) == 0
+    assert entries.hits == 0 and entries.misses == 0
@@ -0,0 +1,83 @@
+"""
+Tests for context_builder.py's overlap removal, chunk merging and budget packing
+"""
+
+from context_builder import estimate_tokens, merge_chunks, pack_context, strip_overlap
+
+
+def _chunk(document_id, index, content, similarity=0.5, filename=None):
+    return {
+        "document_id": document_id,
+        "chunk_index": index,
+        "content": content,
+        "similarity": similarity,
+        "metadata": {"filename": filename or f"{document_id}.txt", "property_name": "Oak Street"}
+    }
+
+
+def test_strip_overlap_removes_the_repeated_tail():
+    previous = "The furnace was inspected on March 3. The filters were replaced."
+    current = "The filters were replaced. Next service is due in September."
+
+    assert strip_overlap(previous, current) == "Next service is due in September."
+
+
+def test_strip_overlap_ignores_short_coincidences():
+    # A shared word or two is below MIN_OVERLAP_CHARS and is not overlap
+    assert strip_overlap("paid in full", "full refund issued") == "full refund issued"
+    assert strip_overlap("no overlap here", "something else") == "something else"
+
+
+def test_adjacent_chunks_merge_without_the_overlap():
+    chunks = [
+        _chunk("doc-1", 1, "The filters were replaced. Next service in September.", similarity=0.9),
+        _chunk("doc-1", 0, "The furnace was inspected in March. The filters were replaced.", similarity=0.4),
+        _chunk("doc-1", 5, "Invoice total: $180.", similarity=0.6)
+    ]
+
+    segments = merge_chunks(chunks)
+
+    assert [segment["chunk_indexes"] for segment in segments] == [[0, 1], [5]]
+    assert segments[0]["text"] == (
+        "The furnace was inspected in March. The filters were replaced.\n\nNext service in September."
+    )
+    assert segments[0]["similarity"] == 0.9
+
+
+def test_pack_context_keeps_within_the_budget_best_first():
+    chunks = [
+        _chunk("doc-low", 0, "Low relevance text. " * 60, similarity=0.2),
+        _chunk("doc-high", 0, "High relevance text. " * 60, similarity=0.9)
+    ]
+
+    context, used = pack_context(chunks, token_budget=400)
+
+    assert estimate_tokens(context) <= 400
+    assert [chunk["document_id"] for chunk in used] == ["doc-high"]
+    assert "doc-high.txt" in context and "doc-low.txt" not in context
+
+
+def test_pack_context_truncates_the_last_segment_that_fits_in_part():
+    chunks = [
+        _chunk("doc-1", 0, "Short and relevant.", similarity=0.9),
+        _chunk("doc-2", 0, "Long sentence about the roof. " * 100, similarity=0.5)
+    ]
+
+    context, used = pack_context(chunks, token_budget=300)
+
+    assert [chunk["document_id"] for chunk in used] == ["doc-1", "doc-2"]
+    assert context.rstrip().endswith("...")
+    assert estimate_tokens(context) <= 300
+
+
+def test_pack_context_writes_each_document_header_once():
+    chunks = [
+        _chunk("doc-1", 0, "First section of the lease.", similarity=0.7),
+        _chunk("doc-1", 4, "Fifth section of the lease.", similarity=0.8)
+    ]
+
+    context, used = pack_context(chunks)
+
+    assert context.count("--- Document: doc-1.txt ---") == 1
+    assert context.index("Section 1,") < context.index("Section 5,")
+    assert len(used) == 2
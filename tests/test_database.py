@@ -0,0 +1,173 @@
+"""
+Tests for database.py's bulk delete, corpus versions and cached user data,
+against an in-memory stand-in for the Supabase client
+"""
+
+from types import SimpleNamespace
+import pytest
+import auth
+import database
+
+
+class FakeQuery:
+    """The slice of postgrest's query builder delete_documents uses"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.filters = []
+        self.row_limit = None
+        self.deleting = False
+
+    def select(self, columns):
+        return self
+
+    def delete(self, count=None, returning=None):
+        self.deleting = True
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def execute(self):
+        matches = [row for row in self.rows if all(f(row) for f in self.filters)]
+        if self.deleting:
+            for row in matches:
+                self.rows.remove(row)
+            # returning=minimal and no Content-Range header: no rows, no count
+            return SimpleNamespace(data=[], count=None)
+        return SimpleNamespace(data=matches[:self.row_limit], count=None)
+
+
+@pytest.fixture
+def documents(monkeypatch):
+    rows = [
+        {"id": f"doc-{i}", "user_id": "user-1", "property_name": "Oak Street" if i % 3 else "Elm Street"}
+        for i in range(500)
+    ]
+    client = SimpleNamespace(
+        table=lambda name: FakeQuery(rows),
+        rpc=lambda name, params: SimpleNamespace(execute=lambda: SimpleNamespace(data=0))
+    )
+    monkeypatch.setattr(auth, "get_authenticated_client", lambda: client)
+    return rows
+
+
+def test_filter_delete_spans_batches_without_a_count(documents):
+    oak_street = sum(row["property_name"] == "Oak Street" for row in documents)
+    assert oak_street > database.DELETE_DOCUMENT_BATCH
+
+    deleted = database.delete_documents("user-1", property_name="Oak Street")
+
+    assert deleted == oak_street
+    assert all(row["property_name"] == "Elm Street" for row in documents)
+
+
+def test_id_delete_counts_every_batch(documents):
+    ids = [row["id"] for row in documents[:450]]
+
+    deleted = database.delete_documents("user-1", document_ids=ids)
+
+    assert deleted == 450
+    assert len(documents) == 50
+
+
+def test_delete_without_filter_deletes_nothing(documents):
+    assert database.delete_documents("user-1") == 0
+    assert len(documents) == 500
+
+
+@pytest.fixture
+def stored_versions(monkeypatch):
+    """corpus_versions rows in an in-memory client; returns the rows"""
+    rows = [{"user_id": "user-1", "version": 7}]
+    client = SimpleNamespace(table=lambda name: FakeQuery(rows))
+    monkeypatch.setattr(auth, "get_authenticated_client", lambda: client)
+    monkeypatch.setattr(database, "_stored_corpus_versions", database.TTLCache(maxsize=16, ttl=60))
+    monkeypatch.setattr(database, "_corpus_versions_table_available", True)
+    return rows
+
+
+def test_corpus_version_sees_changes_made_elsewhere(stored_versions):
+    before = database.get_corpus_version("user-1")
+    # Another process (a snapshot import, another replica) changes the corpus
+    stored_versions[0]["version"] = 8
+    assert database.get_corpus_version("user-1") == before
+
+    database._stored_corpus_versions.clear()  # CORPUS_VERSION_TTL has passed
+    after = database.get_corpus_version("user-1")
+
+    assert before[0] == 7 and after[0] == 8
+
+
+def test_local_bump_changes_the_version_at_once(stored_versions):
+    before = database.get_corpus_version("user-1")
+    stored_versions[0]["version"] = 8
+
+    database.bump_corpus_version("user-1")
+
+    assert database.get_corpus_version("user-1") == (8, before[1] + 1)
+
+
+def test_corpus_version_without_the_table(monkeypatch, stored_versions):
+    def missing_table(name):
+        raise RuntimeError('relation "public.corpus_versions" does not exist')
+
+    monkeypatch.setattr(auth, "get_authenticated_client", lambda: SimpleNamespace(table=missing_table))
+    before = database.get_corpus_version("user-2")
+
+    database.bump_corpus_version("user-2")
+
+    assert before[0] is None and database._corpus_versions_table_available is False
+    assert database.get_corpus_version("user-2") == (None, before[1] + 1)
+
+
+@pytest.fixture
+def loads(monkeypatch, stored_versions):
+    """Fresh user data cache; returns the names loaded from the database"""
+    monkeypatch.setattr(database, "_user_data_cache", database.TTLCache(maxsize=16, ttl=60))
+    return []
+
+
+def _load(loads, name, value):
+    def loader():
+        loads.append(name)
+        return value
+    return database.get_cached_user_data("user-1", name, loader)
+
+
+def test_reruns_are_served_from_the_cache(loads):
+    first = _load(loads, "documents", [{"id": "doc-1"}])
+    second = _load(loads, "documents", [{"id": "doc-1"}])
+
+    assert first is second
+    assert loads == ["documents"]
+
+
+def test_corpus_change_invalidates_cached_data(loads, stored_versions):
+    _load(loads, "documents", [{"id": "doc-1"}])
+    database.bump_corpus_version("user-1")
+    _load(loads, "documents", [{"id": "doc-1"}, {"id": "doc-2"}])
+
+    # A change made by another process shows up once its stored version is read again
+    stored_versions[0]["version"] += 1
+    database._stored_corpus_versions.clear()
+    _load(loads, "documents", [])
+
+    assert loads == ["documents", "documents", "documents"]
+
+
+def test_empty_results_are_not_cached(loads):
+    _load(loads, "stats", {})
+    _load(loads, "stats", {})
+
+    assert loads == ["stats", "stats"]
@@ -0,0 +1,124 @@
+"""
+Tests for database_async.py's shared event loop, client cache and document saves
+"""
+
+import asyncio
+from types import SimpleNamespace
+import jwt
+import pytest
+import database
+import database_async
+from simhash import band_values, to_signed
+
+JWT_SECRET = "test-jwt-secret-at-least-32-bytes-long"
+
+
+@pytest.fixture
+def created(monkeypatch):
+    """Stubs client creation; returns the access tokens clients were created for"""
+    created = []
+
+    async def create_async_client(access_token=None):
+        created.append(access_token)
+        return object()
+
+    monkeypatch.setattr(database_async, "create_async_client", create_async_client)
+    return created
+
+
+def test_run_reuses_the_users_client(created):
+    token = jwt.encode({"sub": "user-run-1"}, JWT_SECRET)
+
+    first = database_async.run(database_async.get_authenticated_async_client(token))
+    second = database_async.run(database_async.get_authenticated_async_client(token))
+
+    assert first is second
+    assert created == [token]
+
+
+def test_run_from_the_background_loop_is_refused(created):
+    async def nested():
+        inner = database_async.get_authenticated_async_client("token")
+        with pytest.raises(RuntimeError):
+            database_async.run(inner)
+        return "refused"
+
+    assert database_async.run(nested()) == "refused"
+    assert created == []
+
+
+class FakeAsyncInsert:
+    def __init__(self, inserted, missing_columns):
+        self.inserted = inserted
+        self.missing_columns = missing_columns
+        self.row = None
+
+    def insert(self, row):
+        self.row = row
+        return self
+
+    async def execute(self):
+        missing = [column for column in self.missing_columns if column in self.row]
+        if missing:
+            raise RuntimeError(f'column "{missing[0]}" of relation "documents" does not exist')
+        self.inserted.append(self.row)
+        return SimpleNamespace(data=[{**self.row, "id": "doc-1"}])
+
+
+def _save(missing_columns=()):
+    inserted = []
+    client = SimpleNamespace(table=lambda name: FakeAsyncInsert(inserted, missing_columns))
+    fingerprint = 0xF00DCAFE12345678
+    saved = asyncio.run(database_async.save_document(
+        "user-1", "bill.txt", "Bill text", client=client, simhash=fingerprint
+    ))
+    return saved, inserted, fingerprint
+
+
+def test_save_document_stores_the_simhash_bands(monkeypatch):
+    monkeypatch.setattr(database, "_simhash_columns_available", True)
+
+    saved, inserted, fingerprint = _save()
+
+    assert saved["id"] == "doc-1"
+    assert inserted[0]["simhash"] == to_signed(fingerprint)
+    assert [inserted[0][f"simhash_band_{band}"] for band in range(4)] == band_values(fingerprint)
+
+
+def test_save_document_without_simhash_columns(monkeypatch):
+    monkeypatch.setattr(database, "_simhash_columns_available", True)
+
+    saved, inserted, _ = _save(missing_columns=("simhash_band_0",))
+
+    assert saved["id"] == "doc-1"
+    assert not any(key.startswith("simhash") for key in inserted[0])
+    assert database._simhash_columns_available is False
+
+
+class FakeAsyncSelect:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        self.rows = [row for row in self.rows if row[column] == value]
+        return self
+
+    def limit(self, count):
+        return self
+
+    async def execute(self):
+        return SimpleNamespace(data=self.rows)
+
+
+def test_corpus_version_is_read_and_shared_with_the_sync_cache(monkeypatch):
+    monkeypatch.setattr(database, "_stored_corpus_versions", database.TTLCache(maxsize=16, ttl=60))
+    monkeypatch.setattr(database, "_corpus_versions_table_available", True)
+    client = SimpleNamespace(table=lambda name: FakeAsyncSelect([{"user_id": "user-1", "version": 3}]))
+
+    version = asyncio.run(database_async.get_corpus_version("user-1", client))
+
+    assert version[0] == 3
+    assert database.get_corpus_version("user-1") == version
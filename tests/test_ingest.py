@@ -0,0 +1,66 @@
+"""
+Tests for ingest.py: chunk numbering and the streaming pipeline's memory ceiling
+OpenAI is never called - embeddings and metadata extraction are stubbed
+"""
+
+import tracemalloc
+import numpy as np
+import pytest
+import ingest
+from vectors import EMBEDDING_DIMENSIONS
+
+PARAGRAPH = "The HVAC unit at 123 Oak Street was serviced. Filters replaced and coils cleaned.\n\n"
+
+# Peak memory allowed while streaming a document through ingestion, whatever its size
+# (measured at ~9 MB for 1, 4 and 16 MB inputs)
+MEMORY_CEILING = 16 * 1024 * 1024
+
+
+@pytest.fixture
+def no_openai(monkeypatch):
+    monkeypatch.setattr(
+        ingest, "create_embeddings",
+        lambda texts: [np.zeros(EMBEDDING_DIMENSIONS, dtype=np.float32) for _ in texts]
+    )
+    monkeypatch.setattr(
+        ingest, "extract_metadata_with_ai",
+        lambda text, filename: {"property_name": "Oak Street", "document_type": "invoice"}
+    )
+
+
+def test_chunk_indexes_unique_when_long_paragraphs_are_split():
+    long_paragraph = " ".join(f"Sentence {i} of the service report." for i in range(300))
+    text = "Short intro.\n\n" + long_paragraph + "\n\nClosing note.\n\n" + long_paragraph
+
+    chunks = ingest.chunk_text(text)
+
+    # Each long paragraph is split into several chunks
+    assert len(chunks) > 10
+    assert [chunk["chunk_index"] for chunk in chunks] == list(range(len(chunks)))
+
+
+def test_streamed_chunk_indexes_unique_without_paragraph_breaks():
+    text = "Unbroken scanned text without blank lines. " * 5000
+    pieces = [text[start:start + 7000] for start in range(0, len(text), 7000)]
+
+    chunks = list(ingest.iter_chunks(pieces))
+
+    assert len(text) > ingest.MAX_PARAGRAPH_CHARS
+    assert [chunk["chunk_index"] for chunk in chunks] == list(range(len(chunks)))
+
+
+@pytest.mark.parametrize("size_mb", [1, 4, 16])
+def test_streaming_ingest_memory_ceiling(no_openai, size_mb):
+    data = (PARAGRAPH * (size_mb * 1024 * 1024 // len(PARAGRAPH))).encode()
+
+    tracemalloc.start()
+    try:
+        result = ingest.process_document_streaming(memoryview(data), "large.txt")
+        saved = sum(len(batch) for batch in result["chunk_batches"])
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert saved > 0
+    assert len(result["file_content"]) <= ingest.STREAMED_CONTENT_CHARS
+    assert peak < MEMORY_CEILING, f"peak {peak / 2**20:.1f} MB for a {size_mb} MB document"
@@ -0,0 +1,97 @@
+"""
+Tests for jobs.py's upload processing, with OpenAI and Supabase stubbed
+"""
+
+import threading
+import time
+import jwt
+import numpy as np
+import pytest
+import auth
+import database
+import ingest
+import jobs
+from vectors import EMBEDDING_DIMENSIONS
+
+SENTENCE = "The HVAC unit at 123 Oak Street was serviced and the filters were replaced. "
+
+
+@pytest.fixture
+def saved(monkeypatch):
+    """Stubs OpenAI and the database; returns what was saved"""
+    saved = {"document": None, "chunks": []}
+    monkeypatch.setattr(
+        ingest, "create_embeddings",
+        lambda texts: [np.zeros(EMBEDDING_DIMENSIONS, dtype=np.float32) for _ in texts]
+    )
+    monkeypatch.setattr(
+        ingest, "extract_metadata_with_ai",
+        lambda text, filename: {"property_name": "Oak Street", "document_type": "invoice"}
+    )
+
+    def save_document(**document):
+        saved["document"] = document
+        return {"id": "doc-1"}
+
+    def save_document_chunks(document_id, user_id, chunks, client=None):
+        saved["chunks"].extend(chunks)
+        return len(chunks)
+
+    monkeypatch.setattr(database, "save_document", save_document)
+    monkeypatch.setattr(database, "save_document_chunks", save_document_chunks)
+    monkeypatch.setattr(jobs, "_jobs_table_available", False)
+    return saved
+
+
+def _run_job(data: bytes) -> dict:
+    job = {"id": "job-1", "user_id": "user-1", "filename": "report.txt", "client": None, "data": data}
+    jobs._live_jobs[job["id"]] = dict(job)
+    try:
+        jobs._process_job(job)
+        return jobs._live_jobs[job["id"]]
+    finally:
+        jobs._live_jobs.pop(job["id"], None)
+
+
+def test_small_upload_keeps_its_full_text(saved):
+    text = SENTENCE * 1000
+    assert ingest.STREAMED_CONTENT_CHARS < len(text) < ingest.STREAMING_THRESHOLD_BYTES
+
+    job = _run_job(text.encode())
+
+    assert job["status"] == "done"
+    assert saved["document"]["file_content"] == text
+    assert [chunk["chunk_index"] for chunk in saved["chunks"]] == list(range(len(saved["chunks"])))
+
+
+def test_large_upload_is_streamed(saved):
+    text = SENTENCE * (ingest.STREAMING_THRESHOLD_BYTES // len(SENTENCE) + 1)
+
+    job = _run_job(text.encode())
+
+    assert job["status"] == "done"
+    assert len(saved["document"]["file_content"]) == ingest.STREAMED_CONTENT_CHARS
+    assert [chunk["chunk_index"] for chunk in saved["chunks"]] == list(range(len(saved["chunks"])))
+    assert saved["chunks"][-1]["text"].endswith("the filters were replaced.")
+
+
+def test_expiring_token_is_refreshed_once_per_batch(monkeypatch):
+    expiring = jwt.encode({"sub": "user-1", "exp": int(time.time()) + 60}, "test-jwt-secret-at-least-32-bytes-long")
+    fresh = jwt.encode({"sub": "user-1", "exp": int(time.time()) + 3600}, "test-jwt-secret-at-least-32-bytes-long")
+    refreshes = []
+
+    def refresh_session_tokens(refresh_token):
+        refreshes.append(refresh_token)
+        return fresh, "refresh-2"
+
+    monkeypatch.setattr(auth, "refresh_session_tokens", refresh_session_tokens)
+    monkeypatch.setattr(database, "create_user_client", lambda access_token: ("client", access_token))
+    session = {"access_token": expiring, "refresh_token": "refresh-1", "client": ("client", expiring), "lock": threading.Lock()}
+    batch = [{"id": f"job-{i}", "client": session["client"], "session": session} for i in range(3)]
+
+    for job in batch:
+        jobs._refresh_job_client(job)
+
+    assert refreshes == ["refresh-1"]
+    assert all(job["client"] == ("client", fresh) for job in batch)
+    assert session["refresh_token"] == "refresh-2"
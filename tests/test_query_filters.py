@@ -0,0 +1,83 @@
+"""
+Tests for query_filters.py's aggregate intent detection and filter extraction
+"""
+
+from datetime import date
+import pytest
+from query_filters import detect_intent, extract_date_range, extract_filters
+
+FACETS = {
+    "properties": ["123 Oak Street", "45 Elm Street"],
+    "vendors": ["Acme Plumbing LLC", "Best Plumbing Inc", "City Electric"],
+    "document_types": ["invoice", "utility_bill", "lease"]
+}
+
+
+@pytest.mark.parametrize("question, intent", [
+    ("What's the total spent on HVAC?", "sum"),
+    ("Total of all Oak Street bills", "sum"),
+    ("What did the repairs cost altogether?", "sum"),
+    ("How much have we paid so far?", "sum"),
+    ("What is the average water bill?", "average"),
+    ("Which invoice had the highest amount?", "max"),
+    ("What was the cheapest repair cost?", "min"),
+    ("How many leases do we have?", "count"),
+    ("List all inspection reports", "list"),
+])
+def test_aggregate_questions(question, intent):
+    assert detect_intent(question) == intent
+
+
+@pytest.mark.parametrize("question", [
+    "What is the total amount due on the Oak Street electric bill?",
+    "What's the total on the latest gas bill?",
+    "What is the total square footage of Elm Street?",
+    "What is the largest unit at Oak Street?",
+    "When does the Oak Street lease end?",
+])
+def test_lookup_questions_have_no_intent(question):
+    assert detect_intent(question) is None
+
+
+def test_filters_from_a_question():
+    filters = extract_filters("Plumbing invoices for Oak Street in March 2024 over $500", FACETS)
+
+    assert filters == {
+        "property_name": "123 Oak Street",
+        "vendor": "plumbing",
+        "document_type": "invoice",
+        "date_from": "2024-03-01",
+        "date_to": "2024-03-31",
+        "min_amount": 500.0,
+        "max_amount": None,
+        "unmatched": []
+    }
+
+
+def test_unexplained_words_are_reported():
+    filters = extract_filters("Did City Electric mention the roof warranty?", FACETS)
+
+    assert filters["vendor"] == "City Electric"
+    assert filters["property_name"] is None
+    assert filters["unmatched"] == ["mention", "roof", "warranty"]
+
+
+def test_house_number_alone_matches_no_property():
+    filters = extract_filters("Bills under $1,200 for unit 123", FACETS)
+
+    assert filters["property_name"] is None
+    assert filters["max_amount"] == 1200.0
+
+
+@pytest.mark.parametrize("phrase, expected", [
+    ("in Q2 2023", ("2023-04-01", "2023-06-30")),
+    ("during 2022", ("2022-01-01", "2022-12-31")),
+    ("last month", ("2024-01-01", "2024-01-31")),
+    ("this year", ("2024-01-01", "2024-12-31")),
+    ("in November", ("2023-11-01", "2023-11-30")),
+    ("in February", ("2024-02-01", "2024-02-29")),
+])
+def test_date_phrases(phrase, expected):
+    date_from, date_to, _ = extract_date_range(f"Bills {phrase}", today=date(2024, 2, 15))
+
+    assert (date_from, date_to) == expected
@@ -0,0 +1,61 @@
+"""
+Tests for rerank.py's BM25 scoring and MMR selection
+"""
+
+from rerank import bm25_scores, rerank
+
+
+def test_bm25_prefers_texts_with_the_rare_query_terms():
+    texts = [
+        "Electric bill for Oak Street, March.",
+        "HVAC repair invoice: compressor replaced.",
+        "Water bill for Oak Street, March."
+    ]
+
+    scores = bm25_scores("compressor repair", texts)
+
+    assert scores.argmax() == 1
+    assert scores[0] == scores[2] == 0
+
+
+def test_bm25_without_content_words_scores_zero():
+    assert not bm25_scores("what is the", ["Any text at all."]).any()
+
+
+def test_lexical_match_lifts_a_candidate():
+    candidates = [
+        {"document_id": "a", "content": "Lease renewal terms for unit 4.", "similarity": 0.81},
+        {"document_id": "b", "content": "Roof inspection found missing shingles.", "similarity": 0.80},
+        {"document_id": "c", "content": "Gas bill for March.", "similarity": 0.50}
+    ]
+
+    results = rerank("roof shingles inspection", candidates, top_k=2, diversity=0)
+
+    assert [result["document_id"] for result in results] == ["b", "a"]
+    assert results[0]["rerank_score"] > results[1]["rerank_score"]
+
+
+def test_mmr_skips_near_copies():
+    copy = "Plumber invoice for the Oak Street leak, 240 dollars."
+    candidates = [
+        {"document_id": "a", "content": copy, "similarity": 0.90},
+        {"document_id": "b", "content": copy, "similarity": 0.89},
+        {"document_id": "c", "content": "Leak insurance claim filed for Oak Street.", "similarity": 0.70},
+        {"document_id": "d", "content": "Gas bill for March.", "similarity": 0.30}
+    ]
+
+    assert [r["document_id"] for r in rerank("Oak Street leak", candidates, top_k=2)] == ["a", "c"]
+    assert [r["document_id"] for r in rerank("Oak Street leak", candidates, top_k=2, diversity=0)] == ["a", "b"]
+
+
+def test_rerank_leaves_candidates_unchanged():
+    candidates = [
+        {"document_id": "a", "content": "Gas bill.", "similarity": 0.5},
+        {"document_id": "b", "content": "Gas meter reading.", "similarity": 0.6}
+    ]
+
+    results = rerank("gas", candidates, top_k=5)
+
+    assert len(results) == 2
+    assert all("rerank_score" not in candidate for candidate in candidates)
+    assert rerank("gas", candidates[:1]) == candidates[:1]
@@ -0,0 +1,54 @@
+"""
+Tests for resilience.py's deadlines, hedging and circuit breaker
+"""
+
+import threading
+import time
+import pytest
+import resilience
+from resilience import CircuitBreaker, call_with_deadline
+
+
+def test_abandoned_calls_dont_starve_later_ones():
+    release = threading.Event()
+    try:
+        for _ in range(resilience.MAX_ATTEMPTS_IN_FLIGHT * 2):
+            with pytest.raises(TimeoutError):
+                call_with_deadline(release.wait, timeout=0.02, hedge_after=0.01)
+
+        # Every earlier attempt is still blocked, yet this one runs straight away
+        assert call_with_deadline(lambda: "ok", timeout=0.5) == "ok"
+    finally:
+        release.set()
+
+
+def test_hedge_wins_over_a_slow_first_attempt():
+    attempts = []
+
+    def search():
+        attempts.append(None)
+        time.sleep(1.0 if len(attempts) == 1 else 0.0)
+        return len(attempts)
+
+    assert call_with_deadline(search, timeout=0.5, hedge_after=0.05) == 2
+
+
+def test_call_error_is_raised():
+    with pytest.raises(ZeroDivisionError):
+        call_with_deadline(lambda: 1 / 0, timeout=0.5)
+
+
+def test_breaker_lets_one_trial_through_when_half_open():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.01)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    time.sleep(0.02)
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    breaker.release()
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed"
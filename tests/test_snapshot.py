@@ -0,0 +1,147 @@
+"""
+Tests for snapshot.py's export and import, against an in-memory stand-in for the Supabase client
+"""
+
+import uuid
+from types import SimpleNamespace
+import numpy as np
+import pytest
+import database
+import snapshot
+from vectors import EMBEDDING_DIMENSIONS, to_pgvector
+
+
+class FakeQuery:
+    """The slice of postgrest's query builder snapshot.py uses"""
+
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.columns = "*"
+        self.filters = []
+        self.row_limit = None
+        self.rows = None
+        self.deleting = False
+
+    def select(self, columns):
+        self.columns = columns
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: row[column] > value)
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def order(self, column):
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def insert(self, rows):
+        self.rows = rows
+        return self
+
+    def delete(self):
+        self.deleting = True
+        return self
+
+    def execute(self):
+        table = self.db[self.table]
+        if self.rows is not None:
+            if self.table == "document_chunks" and self.db["fail_after"] is not None \
+                    and len(table) + len(self.rows) > self.db["fail_after"]:
+                raise RuntimeError("insert failed")
+            table.extend({"id": str(uuid.uuid4()), **row} for row in self.rows)
+            return SimpleNamespace(data=self.rows)
+
+        matches = [row for row in table if all(f(row) for f in self.filters)]
+        if self.deleting:
+            self.db[self.table] = [row for row in table if row not in matches]
+            return SimpleNamespace(data=[])
+
+        matches = sorted(matches, key=lambda row: row["id"])[:self.row_limit]
+        if self.columns != "*":
+            matches = [{column: row.get(column) for column in self.columns.split(",")} for row in matches]
+        return SimpleNamespace(data=matches)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    rng = np.random.default_rng(0)
+    db = {"documents": [], "document_chunks": [], "fail_after": None}
+    for d in range(12):
+        document_id = str(uuid.uuid4())
+        db["documents"].append({
+            "id": document_id, "user_id": "user-1", "filename": f"bill-{d}.txt", "file_content": f"Bill {d}",
+            "property_name": "Oak Street", "document_type": "invoice", "vendor": None, "amount": 10.5 + d,
+            "document_date": None, "uploaded_at": "2026-01-01T00:00:00", "embedding": None, "simhash": -5
+        })
+        for i in range(25):
+            db["document_chunks"].append({
+                "id": str(uuid.uuid4()), "document_id": document_id, "user_id": "user-1", "chunk_index": i,
+                "chunk_text": f"Bill {d}, part {i}", "start_char": i * 450,
+                "embedding": to_pgvector(rng.random(EMBEDDING_DIMENSIONS, dtype=np.float32)) if i != 3 else None
+            })
+
+    client = SimpleNamespace(table=lambda name: FakeQuery(db, name))
+    monkeypatch.setattr(snapshot, "get_service_client", lambda: client)
+    monkeypatch.setattr(snapshot, "EXPORT_PAGE_SIZE", 10)
+    monkeypatch.setattr(database, "_simhash_columns_available", True)
+    return db
+
+
+def _chunks_by_name(db, user_id):
+    names = {row["id"]: row["filename"] for row in db["documents"]}
+    return {
+        (names[row["document_id"]], row["chunk_index"]): (row["chunk_text"], row["start_char"], row["embedding"])
+        for row in db["document_chunks"] if row["user_id"] == user_id
+    }
+
+
+def test_import_into_another_user_restores_everything(db, tmp_path):
+    path = str(tmp_path / "snapshot.npz")
+    manifest = snapshot.export_snapshot("user-1", path)
+
+    result = snapshot.import_snapshot(path, user_id="user-2", batch_size=40, workers=3)
+
+    assert manifest["documents"] == 12 and manifest["chunks"] == 300
+    assert result == {"documents": 12, "chunks": 300, "skipped_documents": 0}
+    assert _chunks_by_name(db, "user-2") == _chunks_by_name(db, "user-1")
+    restored = next(row for row in db["documents"] if row["user_id"] == "user-2")
+    assert "embedding" not in restored
+    assert restored["simhash"] == -5 and restored["simhash_band_0"] == 65531
+
+
+def test_rerun_skips_documents_with_the_same_text(db, tmp_path):
+    path = str(tmp_path / "snapshot.npz")
+    snapshot.export_snapshot("user-1", path)
+    db["documents"][0]["file_content"] = "Edited"
+
+    result = snapshot.import_snapshot(path)
+
+    assert result == {"documents": 1, "chunks": 25, "skipped_documents": 11}
+
+
+def test_failed_import_removes_the_documents_it_added(db, tmp_path):
+    path = str(tmp_path / "snapshot.npz")
+    snapshot.export_snapshot("user-1", path)
+    db["fail_after"] = len(db["document_chunks"]) + 100
+
+    with pytest.raises(RuntimeError):
+        snapshot.import_snapshot(path, user_id="user-2", batch_size=40, workers=2)
+
+    assert not [row for row in db["documents"] if row["user_id"] == "user-2"]
+    assert not [row for row in db["document_chunks"] if row["user_id"] == "user-2"]
+
+    db["fail_after"] = None
+    assert snapshot.import_snapshot(path, user_id="user-2")["chunks"] == 300
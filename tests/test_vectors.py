@@ -0,0 +1,37 @@
+"""
+Tests for vectors.py's embedding conversions
+"""
+
+import base64
+import numpy as np
+from vectors import EMBEDDING_DIMENSIONS, from_openai, from_pgvector, to_pgvector
+
+
+def test_pgvector_literal_round_trips_float32_exactly():
+    rng = np.random.default_rng(0)
+    vector = (rng.standard_normal(EMBEDDING_DIMENSIONS) * 0.05).astype(np.float32)
+    vector[:4] = [0.0, -0.0, 1e-30, -3.4e38]
+
+    literal = to_pgvector(vector)
+    parsed = from_pgvector(literal)
+
+    assert literal.startswith("[") and literal.endswith("]") and " " not in literal
+    assert parsed.dtype == np.float32
+    assert np.array_equal(parsed, vector)
+
+
+def test_pgvector_accepts_lists_and_padded_literals():
+    assert to_pgvector([0.5, -1, 2.25]) == "[0.5,-1,2.25]"
+    assert from_pgvector(" [0.5, -1, 2.25]\n").tolist() == [0.5, -1.0, 2.25]
+
+
+def test_from_openai_decodes_base64_and_lists():
+    vector = np.linspace(-1, 1, EMBEDDING_DIMENSIONS, dtype=np.float32)
+    encoded = base64.b64encode(vector.astype("<f4").tobytes()).decode()
+
+    assert np.array_equal(from_openai(encoded), vector)
+    assert np.array_equal(from_openai(vector.tolist()), vector)
+
+
+def test_from_openai_rejects_other_dimensions():
+    assert from_openai([0.1] * 3) is None
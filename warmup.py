@@ -0,0 +1,69 @@
+"""
+warmup.py
+Fills a user's caches in the background right after they log in
+The dashboard data, first page of the document browser and the search lexicon
+are fetched concurrently while the app is still switching to the main page, so
+the first tab view and the first question are served from memory
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Set
+import database
+import database_async
+import qa
+
+# Queries run at the same time during a warmup
+WARMUP_WORKERS = 3
+
+# Users whose warmup is running (logging in again meanwhile doesn't start another)
+_running: Set[str] = set()
+_lock = threading.Lock()
+
+
+def start_warmup(user_id: str, access_token: str) -> bool:
+    """
+    Starts warming a user's caches in a background thread
+
+    Args:
+        user_id: The user who just logged in
+        access_token: Their access token (worker threads can't read st.session_state)
+
+    Returns:
+        True if a warmup was started, False if one is already running for this user
+    """
+    with _lock:
+        if user_id in _running:
+            return False
+        _running.add(user_id)
+
+    threading.Thread(target=_warm, args=(user_id, access_token), name="cache-warmup", daemon=True).start()
+    return True
+
+
+def _warm(user_id: str, access_token: str) -> None:
+    """Runs the warmup queries concurrently; failures only mean a cold cache"""
+    started = time.monotonic()
+    try:
+        client = database.create_user_client(access_token)
+        qa.get_openai_client()
+
+        with ThreadPoolExecutor(max_workers=WARMUP_WORKERS, thread_name_prefix="cache-warmup") as pool:
+            tasks = {
+                "dashboard": pool.submit(database_async.get_dashboard_data, user_id, access_token),
+                "documents": pool.submit(database.get_cached_document_page, user_id, client=client),
+                "lexicon": pool.submit(qa.get_search_lexicon, user_id, client=client)
+            }
+            for name, task in tasks.items():
+                try:
+                    task.result()
+                except Exception as e:
+                    print(f"Warning: could not prefetch {name}: {e}")
+
+        print(f"Warmed caches in {time.monotonic() - started:.2f}s")
+    except Exception as e:
+        print(f"Warning: cache warmup failed: {e}")
+    finally:
+        with _lock:
+            _running.discard(user_id)